@@ -0,0 +1,5 @@
+# Import the Celery app whenever Django starts, so shared_task publishes
+# through it (with its broker, queues and routes) and not the default app.
+from .celery import app as celery_app
+
+__all__ = ('celery_app',)
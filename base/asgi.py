@@ -1,12 +1,19 @@
 # asgi.py
+# Serves both HTTP (sync views plus the async views in rest.async_views) and
+# WebSockets, e.g. `daphne base.asgi:application` or
+# `gunicorn base.asgi:application -k uvicorn.workers.UvicornWorker`.
 import os
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
-from django.urls import path
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'base.settings')
 
+# Initialise Django before importing anything that touches models.
+django_asgi_app = get_asgi_application()
+
+from rest.routing import websocket_urlpatterns  # noqa: E402
+
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
-    # You can add other protocols like WebSocket here if needed
+    "http": django_asgi_app,
+    "websocket": URLRouter(websocket_urlpatterns),
 })
@@ -14,6 +14,8 @@ from pathlib import Path
 from decouple import config
 from datetime import timedelta
 import os
+import tempfile
+from kombu import Exchange, Queue
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -79,7 +81,7 @@ TEMPLATES = [
     },
 ]
 
-ASGI_APPLICATION = 'rest.routing.application'
+ASGI_APPLICATION = 'base.asgi.application'
 WSGI_APPLICATION = 'base.wsgi.application'
 
 # Database
@@ -95,6 +97,16 @@ DATABASES = {
     }
 }
 
+# Cache
+# Schema versions and snapshots live here, so production should point this at
+# a shared backend such as django.core.cache.backends.redis.RedisCache.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 AUTH_PASSWORD_VALIDATORS = [
@@ -115,7 +127,7 @@ AUTH_PASSWORD_VALIDATORS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'rest.authentication.ClaimsJWTAuthentication',
     ),
 }
 
@@ -125,6 +137,56 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 
+# One queue per kind of work, so a burst of imports or bulk recomputes never
+# delays the recalculation behind an interactive edit. Give each its own
+# workers in production, for example:
+#   celery -A base worker -Q recalc --concurrency 4
+#   celery -A base worker -Q bulk,imports --concurrency 2
+#   celery -A base worker -Q media,default
+# A worker started without -Q consumes all of them.
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+CELERY_TASK_QUEUES = [
+    Queue(name, Exchange(name), routing_key=name)
+    for name in ('recalc', 'bulk', 'imports', 'media', 'default')
+]
+# Priorities order tasks within a queue. The Redis transport emulates them
+# with one list per step, and 0 is the highest.
+CELERY_TASK_ROUTES = {
+    'rest.models.update_dependent_cells_task': {'queue': 'recalc', 'priority': 0},
+    # Queued on 'bulk' or 'imports' explicitly when not interactive.
+    'rest.tasks.recalculate_rows_task': {'queue': 'recalc', 'priority': 3},
+    'rest.tasks.recompute_table_task': {'queue': 'bulk', 'priority': 6},
+    'rest.tasks.import_upload_task': {'queue': 'imports', 'priority': 6},
+    'rest.tasks.generate_image_derivatives_task': {'queue': 'media', 'priority': 6},
+}
+CELERY_TASK_DEFAULT_PRIORITY = 5
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    'queue_order_strategy': 'priority',
+}
+# Prefetch one task at a time so a worker does not sit on queued work behind
+# a long recompute, and priorities hold.
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+# A queued recalculation of a row (or cell, or table) is not queued again
+# until it starts; this only bounds how long a lost task blocks the next one.
+RECALC_PENDING_TIMEOUT = config('RECALC_PENDING_TIMEOUT', default=600, cast=int)
+# Bulk and import recomputes of one table start at most once per interval;
+# batches arriving meanwhile are folded into a single table recompute.
+RECALC_TABLE_INTERVAL = config('RECALC_TABLE_INTERVAL', default=5, cast=int)
+
+# Worker processes used by table-wide formula recomputes; tables with fewer
+# rows than FORMULA_POOL_MIN_ROWS are evaluated in the task process itself.
+# Each running recompute starts its own pool, so the bulk and imports workers
+# need FORMULA_POOL_SIZE times their --concurrency cores.
+FORMULA_POOL_SIZE = config('FORMULA_POOL_SIZE', default=os.cpu_count() or 1, cast=int)
+FORMULA_POOL_MIN_ROWS = config('FORMULA_POOL_MIN_ROWS', default=2000, cast=int)
+
+# On PostgreSQL, cell batches of at least this size are inserted with COPY
+# through a staging table instead of bulk_create.
+CELL_COPY_MIN_ROWS = config('CELL_COPY_MIN_ROWS', default=5000, cast=int)
+
 SWAGGER_SETTINGS = {
     'USE_SESSION_AUTH': False,
     # 'SECURITY_DEFINITIONS': None,  # Disable token auth prompt in Swagger
@@ -143,8 +205,18 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
+    # Requests are authenticated from token claims; revocations live in the
+    # cache (see rest/authentication.py).
+    'AUTH_TOKEN_CLASSES': ('rest.authentication.AccessToken',),
+    'TOKEN_USER_CLASS': 'rest.authentication.ClaimsUser',
+    'TOKEN_OBTAIN_SERIALIZER': 'rest.serializers.ClaimsTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'rest.serializers.ClaimsTokenRefreshSerializer',
+    'TOKEN_BLACKLIST_SERIALIZER': 'rest.serializers.ClaimsTokenBlacklistSerializer',
 }
 
+# How long a full User row loaded for a token stays in the cache.
+AUTH_USER_CACHE_SECONDS = config('AUTH_USER_CACHE_SECONDS', default=60, cast=int)
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
@@ -188,6 +260,56 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'uploads')
 MEDIA_URL = '/uploads/'
 
+# Cell files and images are stored once per content hash ("blobs", see
+# rest/storage.py); clean_blobs removes blobs no row refers to any more
+# after BLOB_GRACE_HOURS.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'blobs': {
+        'BACKEND': 'rest.storage.ContentAddressedStorage',
+    },
+    # Deployments run "python manage.py collectstatic --noinput": it writes
+    # hashed copies of every static file plus gzip/brotli variants, which
+    # WhiteNoise serves with far-future cache headers.
+    'staticfiles': {
+        'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+BLOB_GRACE_HOURS = config('BLOB_GRACE_HOURS', default=24, cast=int)
+
+# Media is served by rest.media.serve_media, only to users who may see the
+# owning cell. Set MEDIA_SENDFILE to "nginx" (X-Accel-Redirect to
+# MEDIA_SENDFILE_PREFIX, an internal location aliased to MEDIA_ROOT) or
+# "apache" (X-Sendfile) to let the web server send the bytes. Never alias
+# MEDIA_ROOT under a public location: that would skip the access check.
+MEDIA_SENDFILE = config('MEDIA_SENDFILE', default='')
+MEDIA_SENDFILE_PREFIX = config('MEDIA_SENDFILE_PREFIX', default='/protected-media/')
+MEDIA_CACHE_SECONDS = config('MEDIA_CACHE_SECONDS', default=3600, cast=int)
+
+# Uploads above this size are streamed to a temporary file instead of being
+# held in memory; spreadsheet imports then read them from disk.
+FILE_UPLOAD_MAX_MEMORY_SIZE = config(
+    'FILE_UPLOAD_MAX_MEMORY_SIZE', default=2 * 1024 * 1024, cast=int)
+
+# Resumable uploads: chunks are assembled in temporary files in this
+# directory; unfinished sessions older than UPLOAD_SESSION_EXPIRY_HOURS are
+# removed by the clean_upload_sessions command.
+UPLOAD_SESSION_DIR = config(
+    'UPLOAD_SESSION_DIR', default=os.path.join(tempfile.gettempdir(), 'upload-sessions'))
+UPLOAD_SESSION_MAX_SIZE = config(
+    'UPLOAD_SESSION_MAX_SIZE', default=4 * 1024 * 1024 * 1024, cast=int)
+UPLOAD_SESSION_EXPIRY_HOURS = config('UPLOAD_SESSION_EXPIRY_HOURS', default=48, cast=int)
+
+# Bounding boxes of the WebP derivatives rendered for every cell image
+# (rest/images.py); the API and admin serve these instead of the original.
+IMAGE_DERIVATIVES = {
+    'thumbnail': (160, 160),
+    'web': (1600, 1600),
+}
+IMAGE_DERIVATIVE_QUALITY = config('IMAGE_DERIVATIVE_QUALITY', default=80, cast=int)
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
@@ -1,13 +1,15 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from rest_framework.routers import DefaultRouter
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from rest_framework import permissions
 from django.conf import settings
-from django.conf.urls.static import static
+from rest import async_views
+from rest.media import serve_media
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
+    TokenBlacklistView,
     TokenRefreshView,
 )
 
@@ -27,6 +29,8 @@ from rest.views import (
     JobViewSet,
     OperationViewSet,  # New
     FormulaStepViewSet,  # New
+    JobTableCollectionSchemaView,
+    UploadSessionViewSet,
     WebSocketAPIView,
     get_columns_for_table
 )
@@ -37,6 +41,7 @@ router.register(r'users', UserViewSet, basename='user')
 router.register(r'tables', TableViewSet, basename='table')
 router.register(r'cell-files', FileUploadViewSet, basename='file')
 router.register(r'cell-images', ImageUploadViewSet, basename='image')
+router.register(r'uploads', UploadSessionViewSet, basename='upload')
 router.register(r'table-categories', TableCategoryViewSet,
                 basename='table-category')
 router.register(r'columns', ColumnViewSet, basename='column')
@@ -64,20 +69,33 @@ schema_view = get_schema_view(
 )
 
 urlpatterns = [
+    # Before the admin so the model URLs do not swallow it.
+    path('admin/rest/column/api/columns-for-table/',
+         get_columns_for_table, name='columns_for_table'),
     path('admin/', admin.site.urls),
     path('api/', include(router.urls)),
     path('swagger/', schema_view.with_ui('swagger',
          cache_timeout=0), name='schema-swagger-ui'),
     path('redoc/', schema_view.with_ui('redoc',
          cache_timeout=0), name='schema-redoc'),
-    # path('admin/rest/column/api/columns-for-table/',
-    #      get_columns_for_table, name='columns_for_table'),
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/token/blacklist/', TokenBlacklistView.as_view(), name='token_blacklist'),
     path('api/upload/', ExcelUploadView.as_view(), name='excel_upload'),
+    path('api/job-table-collections/<uuid:pk>/schema/',
+         JobTableCollectionSchemaView.as_view(), name='job-table-collection-schema'),
     path('api/websocket-test/', WebSocketAPIView.as_view(), name='websocket-test'),
+    # Native async read endpoints (best served under ASGI)
+    path('api/async/tables/<uuid:pk>/rows/',
+         async_views.table_rows, name='async-table-rows'),
+    path('api/async/tables/<uuid:pk>/schema/',
+         async_views.table_schema, name='async-table-schema'),
+    path('api/async/table-apis/<uuid:pk>/cells/',
+         async_views.table_api_cells, name='async-table-api-cells'),
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL,
-                          document_root=settings.MEDIA_ROOT)
+# Uploaded media, with range requests and cache headers (see rest/media.py).
+urlpatterns += [
+    re_path(r'^%s(?P<path>.+)$' % settings.MEDIA_URL.lstrip('/'),
+            serve_media, name='media'),
+]
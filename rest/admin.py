@@ -1,6 +1,10 @@
 from .forms import TableSelectionForm
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.contrib.admin.utils import unquote
 from django.contrib.auth.admin import UserAdmin
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.core.paginator import Paginator
 from django.forms import BaseInlineFormSet
 from django.utils.html import format_html
 from django.http import HttpResponseRedirect
@@ -8,13 +12,27 @@ from django.urls import path, reverse
 from django.shortcuts import render
 from django.contrib import messages
 from django import forms
-from .utils import parse_formula, FormulaParseError
+from django.db import transaction
+from django.db.models import Case, IntegerField, Prefetch, Q, Value, When
+from .utils import check_formula, compile_formula, parse_formula, save_formula, FormulaParseError
+from .schema import column_catalogue
+from .services import bulk_create_cells, bulk_update_cells
+from .tasks import enqueue_table_recompute
 from .models import (
     JobTableCollection, TableCategory, User, Table, Column, TableApi, Cell, Option,
-    Company, Project, Job, File, Image, Operation, FormulaStep, FormulaOperand
+    Blob, Company, Project, Job, File, Image, Operation, FormulaStep, FormulaOperand,
+    computed_values, formula_displays, load_formulas
 )
 
 
+class PageChangeList(ChangeList):
+    """Lets the ModelAdmin load per-row display data for a whole page at once."""
+
+    def get_results(self, request):
+        super().get_results(request)
+        self.model_admin.annotate_page(list(self.result_list))
+
+
 class ColumnAdminForm(forms.ModelForm):
     selected_columns = forms.MultipleChoiceField(
         choices=[],
@@ -35,34 +53,46 @@ class ColumnAdminForm(forms.ModelForm):
         return cleaned_data
 
     def clean_formula_text(self):
+        """
+        Compile the formula in memory and check its references and cycles;
+        nothing is written until ``ColumnAdmin.save_model`` stores the
+        resulting ``formula_plan``.
+        """
         formula_text = self.cleaned_data.get('formula_text', '')
-        if formula_text and self.instance.table_id:
-            valid_columns = set(Column.objects.filter(
-                table=self.instance.table).values_list('name', flat=True))
-            operations_dict = {op.name: op for op in Operation.objects.all()}
+        table = self.cleaned_data.get('table')
+        self.formula_plan = None
+        if formula_text and table:
+            if self.cleaned_data.get('data_type') != 'number':
+                raise forms.ValidationError("Formulas can only be set on number columns.")
             try:
-                tokens = parse_formula(
-                    formula_text, self.instance, operations_dict)
-                for token in tokens:
-                    if isinstance(token, str) and token not in operations_dict and token not in '()+-*/%' and token not in valid_columns:
-                        raise forms.ValidationError(
-                            f"Invalid column name: '{token}' not found in table.")
+                plan = compile_formula(
+                    formula_text, Operation.objects.values_list('name', flat=True))
+                check_formula(
+                    plan, self.instance.id, column_catalogue(table.id)['columns'],
+                    load_formulas(table.id))
             except FormulaParseError as e:
                 raise forms.ValidationError(f"Invalid formula: {str(e)}")
+            self.formula_plan = plan
         return formula_text
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.fields['formula_text'].widget.attrs.update({
+            'class': 'formula-input',
+            'data-catalogue-url': reverse('columns_for_table'),
+            'data-functions': 'sqrt,%,add,subtract,multiply,divide',
+            'placeholder': 'e.g., sqrt(Column1) + Column2 * 5'
+        })
         if self.instance and self.instance.table_id:
-            columns = Column.objects.filter(
-                table=self.instance.table).exclude(id=self.instance.id)
-            column_choices = [(col.name, col.name) for col in columns]
+            column_choices = [
+                (column['name'], column['name'])
+                for column in column_catalogue(self.instance.table_id)['columns']
+                if column['id'] != str(self.instance.id)
+            ]
             self.fields['selected_columns'].choices = column_choices
             self.fields['formula_text'].widget.attrs.update({
-                'class': 'formula-input',
-                'data-columns': ','.join(col[0] for col in column_choices),
-                'data-functions': 'sqrt,%,add,subtract,multiply,divide',
-                'placeholder': 'e.g., sqrt(Column1) + Column2 * 5'
+                'data-table': str(self.instance.table_id),
+                'data-columns': ','.join(name for name, _ in column_choices),
             })
 
 
@@ -107,6 +137,10 @@ class FormulaStepInline(admin.TabularInline):
                        'operation', 'operand', 'order')
     can_delete = False
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'column', 'operation', 'operand__column')
+
     def display_step(self, obj):
         operand_str = obj.operand.__str__() if obj.operand else "No Operand"
         op_str = obj.operation.symbol if obj.operation else ""
@@ -124,6 +158,7 @@ class FormulaStepAdmin(admin.ModelAdmin):
     list_display = ('column', 'display_step', 'order')
     list_filter = ('order',)
     raw_id_fields = ('column', 'operand', 'operation')
+    list_select_related = ('column', 'operand__column', 'operation')
 
     def display_step(self, obj):
         operand_str = obj.operand.__str__() if obj.operand else "No Operand"
@@ -140,6 +175,7 @@ class ColumnAdmin(admin.ModelAdmin):
                     'formula_text', 'display_formula')
     search_fields = ('name', 'data_type')
     list_filter = ('data_type', 'table')
+    list_select_related = ('table',)
     inlines = [OptionInline, FormulaStepInline]
     actions = ['create_intermediate_columns_for_formula']
     change_form_template = 'admin/rest/column_change_form.html'
@@ -152,49 +188,42 @@ class ColumnAdmin(admin.ModelAdmin):
 
     def get_form(self, request, obj=None, **kwargs):
         form = super().get_form(request, obj, **kwargs)
-        print("Form fields:", form.base_fields.keys())  # Debug
-        if obj and hasattr(obj, 'table_id') and obj.table_id:
+        if obj and obj.table_id:
             if 'formula_text' in form.base_fields:
                 form.base_fields['formula_text'].initial = obj.formula_text
-            kwargs['column_options'] = list(
-                Column.objects.filter(table_id=obj.table_id).values('name'))
         else:
             table_id = request.GET.get('table')
             if table_id:
-                try:
-                    table = Table.objects.get(id=table_id)
-                    form.initial['table'] = table
-                    kwargs['column_options'] = list(
-                        Column.objects.filter(table_id=table_id).values('name'))
-                except Table.DoesNotExist:
-                    kwargs['column_options'] = []
-            else:
-                kwargs['column_options'] = []
+                table = Table.objects.filter(id=table_id).first()
+                if table and 'table' in form.base_fields:
+                    form.base_fields['table'].initial = table
         return form
 
     def render_change_form(self, request, context, add=False, change=False, form_url='', obj=None):
+        table_id = obj.table_id if obj and obj.table_id else None
         if add:
-            context['column_options'] = []
             table_id = request.GET.get('table')
             if table_id:
                 context['table_id'] = table_id
-        elif obj and obj.table_id:
-            context['column_options'] = list(
-                Column.objects.filter(table_id=obj.table_id).values('name'))
-        else:
-            context['column_options'] = []
+        try:
+            columns = column_catalogue(table_id)['columns'] if table_id else []
+        except ValidationError:
+            columns = []
+        context['column_options'] = [{'name': column['name']} for column in columns]
         return super().render_change_form(request, context, add=add, change=change, form_url=form_url, obj=obj)
 
+    def get_changelist(self, request, **kwargs):
+        return PageChangeList
+
+    def annotate_page(self, columns):
+        displays = formula_displays({column.table_id for column in columns})
+        for column in columns:
+            column.formula_display = displays.get(str(column.id), "-")
+
     def display_formula(self, obj):
-        steps = FormulaStep.objects.filter(column=obj).order_by('order')
-        if not steps.exists():
-            return "-"
-        formula_parts = []
-        for step in steps:
-            operand_str = step.operand.__str__() if step.operand else "No Operand"
-            op_str = step.operation.symbol if step.operation else ""
-            formula_parts.append(f"{operand_str} {op_str}")
-        return " ".join(formula_parts)
+        if not hasattr(obj, 'formula_display'):
+            self.annotate_page([obj])
+        return obj.formula_display
     display_formula.short_description = "Parsed Formula"
 
     def create_intermediate_columns_for_formula(self, request, queryset):
@@ -218,14 +247,23 @@ class ColumnAdmin(admin.ModelAdmin):
 
     def save_model(self, request, obj, form, change):
         super().save_model(request, obj, form, change)
-        if obj.formula_text and (change or not FormulaStep.objects.filter(column=obj).exists()):
-            operations_dict = {op.name: op for op in Operation.objects.all()}
-            try:
-                FormulaStep.objects.filter(column=obj).delete()
-                parse_formula(obj.formula_text, obj, operations_dict)
-            except FormulaParseError as e:
-                messages.error(
-                    request, f"Error saving formula for {obj.name}: {str(e)}")
+        plan = getattr(form, 'formula_plan', None)
+        if plan is None:
+            if not (change and 'formula_text' in form.changed_data and not obj.formula_text):
+                return
+            plan = []  # The formula was cleared: drop its steps.
+        elif change and not form.has_changed() and obj.steps.exists():
+            return
+        operations_dict = {op.name: op for op in Operation.objects.all()}
+        try:
+            # Runs inside the admin's save transaction.
+            save_formula(obj, plan, operations_dict)
+        except FormulaParseError as e:
+            messages.error(
+                request, f"Error saving formula for {obj.name}: {str(e)}")
+            return
+        transaction.on_commit(
+            lambda: enqueue_table_recompute(obj.table_id))
 
 
 if Column in admin.site._registry:
@@ -267,17 +305,12 @@ class CellInlineFormSet(BaseInlineFormSet):
 class CellInline(admin.TabularInline):
     model = Cell
     extra = 0
+    # A select of every column in every table per cell is what made wide
+    # rows slow to render; the grid view is the place to edit many cells.
+    raw_id_fields = ('column',)
 
     def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        table_id = request.GET.get('table')
-        if table_id:
-            table = Table.objects.get(pk=table_id)
-            table_api, created = TableApi.objects.get_or_create(
-                table=table, user=request.user
-            )
-            return Cell.objects.filter(table_api=table_api)
-        return qs
+        return super().get_queryset(request).select_related('column')
 
 # Table Admin
 
@@ -287,6 +320,15 @@ class TableAdmin(admin.ModelAdmin):
     inlines = [ColumnInline]
     search_fields = ('name',)
     list_filter = ('created_at',)
+    actions = ['recompute_formulas']
+
+    def recompute_formulas(self, request, queryset):
+        for table in queryset:
+            enqueue_table_recompute(table.id)
+        messages.success(
+            request, f"Scheduled formula recompute for {queryset.count()} table(s).")
+
+    recompute_formulas.short_description = "Recompute formula values"
 
     def response_add(self, request, obj, post_url_continue=None):
         return super().response_add(request, obj, post_url_continue)
@@ -300,15 +342,144 @@ admin.site.register(Table, TableAdmin)
 class TableApiAdmin(admin.ModelAdmin):
     inlines = [CellInline]
     change_form_template = "admin/rest/table_api_change_form.html"
+    grid_rows_per_page = 50
+    grid_columns_per_page = 25
 
     def get_urls(self):
         urls = super().get_urls()
         custom_urls = [
             path('select-table/', self.admin_site.admin_view(self.select_table),
                  name='rest_tableapi_select_table'),
+            path('<path:object_id>/grid/', self.admin_site.admin_view(self.grid_view),
+                 name='rest_tableapi_grid'),
         ]
         return custom_urls + urls
 
+    def grid_view(self, request, object_id):
+        """
+        Spreadsheet view of a TableApi and its child rows. Only one page of
+        rows by one page of columns is loaded, so wide tables stay usable.
+        GET has no side effects; POST saves the changed cells of the page
+        in one batch.
+        """
+        table_api = self.get_object(request, unquote(object_id))
+        if table_api is None:
+            return self._get_obj_does_not_exist_redirect(request, self.opts, object_id)
+        if not self.has_view_or_change_permission(request, table_api):
+            raise PermissionDenied
+
+        root_id = table_api.parent_id or table_api.id
+        row_ids = TableApi.objects.filter(Q(id=root_id) | Q(parent_id=root_id)).annotate(
+            position=Case(When(id=root_id, then=Value(0)), default=Value(1),
+                          output_field=IntegerField()),
+        ).order_by('position', 'id').values_list('id', flat=True)
+        rows_page = Paginator(row_ids, self.grid_rows_per_page).get_page(request.GET.get('p'))
+        columns_page = Paginator(
+            Column.objects.filter(table_id=table_api.table_id).prefetch_related('options')
+            .order_by('name', 'id'),
+            self.grid_columns_per_page,
+        ).get_page(request.GET.get('cp'))
+        page_rows = list(rows_page)
+        columns = list(columns_page)
+        formula_columns = set(load_formulas(table_api.table_id))
+        editable = {
+            str(column.id): column.id for column in columns
+            if str(column.id) not in formula_columns and column.data_type not in ('file', 'image')
+        }
+
+        if request.method == 'POST':
+            if not self.has_change_permission(request, table_api):
+                raise PermissionDenied
+            saved, conflicts = self._save_grid(
+                request.POST, {str(row_id): row_id for row_id in page_rows}, editable)
+            if saved:
+                messages.success(request, f"Saved {saved} cell(s).")
+            if conflicts:
+                messages.warning(
+                    request, f"{conflicts} cell(s) were changed by someone else meanwhile "
+                             "and were not saved; the grid shows their current values.")
+            return HttpResponseRedirect(request.get_full_path())
+
+        cells = Cell.objects.filter(
+            table_api_id__in=page_rows, column_id__in=[column.id for column in columns],
+        ).order_by('id').values('id', 'table_api', 'column', 'value')
+        by_key = {}
+        for cell in cells:
+            by_key.setdefault((cell['table_api'], cell['column']), cell)
+        computed = computed_values([
+            {**cell, 'table': table_api.table_id} for cell in by_key.values()
+            if str(cell['column']) in formula_columns
+        ])
+        grid_rows = []
+        for number, row_id in enumerate(page_rows, start=rows_page.start_index()):
+            grid_cells = []
+            for column in columns:
+                cell = by_key.get((row_id, column.id))
+                value = cell['value'] if cell else ''
+                grid_cells.append({
+                    'key': f"{row_id}:{column.id}",
+                    'value': computed.get(cell['id'], value) if cell else value,
+                    'editable': str(column.id) in editable,
+                    'options': [option.value for option in column.options.all()],
+                })
+            grid_rows.append({'id': row_id, 'number': number, 'cells': grid_cells})
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.opts,
+            'original': table_api,
+            'title': f"Grid: {table_api.table.name}",
+            'columns': columns,
+            'formula_columns': {column.id for column in columns if str(column.id) in formula_columns},
+            'rows': grid_rows,
+            'rows_page': rows_page,
+            'columns_page': columns_page,
+            'can_change': self.has_change_permission(request, table_api),
+        }
+        return render(request, "admin/rest/table_api_grid.html", context)
+
+    def _save_grid(self, data, row_ids, editable):
+        """
+        Apply the posted grid values; ``row_ids`` and ``editable`` map the
+        string ids used in field names to the ids of the page's rows and
+        editable columns. A cell is written only when its value differs from
+        the one the page was rendered with, and skipped as a conflict when
+        the stored value no longer matches that original. Returns
+        ``(saved, conflicts)``.
+        """
+        changes = {}
+        for key, value in data.items():
+            if not key.startswith('cell:'):
+                continue
+            row_id, _, column_id = key[len('cell:'):].partition(':')
+            if row_id not in row_ids or column_id not in editable:
+                continue
+            original = data.get(f"original:{row_id}:{column_id}", '')
+            if value != original:
+                changes[(row_ids[row_id], editable[column_id])] = (original, value)
+        if not changes:
+            return 0, 0
+
+        updated, created, conflicts = [], [], 0
+        with transaction.atomic():
+            existing = {}
+            for cell in Cell.objects.select_for_update().filter(
+                    table_api_id__in={row_id for row_id, _ in changes},
+                    column_id__in={column_id for _, column_id in changes}).order_by('id'):
+                existing.setdefault((cell.table_api_id, cell.column_id), cell)
+            for (row_id, column_id), (original, value) in changes.items():
+                cell = existing.get((row_id, column_id))
+                if (cell.value if cell else '') != original:
+                    conflicts += 1
+                elif cell:
+                    cell.value = value
+                    updated.append(cell)
+                else:
+                    created.append(Cell(table_api_id=row_id, column_id=column_id, value=value))
+            bulk_update_cells(updated)
+            bulk_create_cells(created)
+        return len(updated) + len(created), conflicts
+
     def select_table(self, request):
         if request.method == 'POST':
             form = TableSelectionForm(request.POST)
@@ -328,6 +499,23 @@ class TableApiAdmin(admin.ModelAdmin):
             form.base_fields['table'].initial = table
         return form
 
+    def save_formset(self, request, form, formset, change):
+        if formset.model is not Cell:
+            return super().save_formset(request, form, formset, change)
+        # New cells go through the bulk path: one insert and at most one
+        # recalculation instead of a save and a task per cell.
+        instances = formset.save(commit=False)
+        for obj in formset.deleted_objects:
+            obj.delete()
+        new_cells = []
+        for obj in instances:
+            if obj._state.adding:
+                new_cells.append(obj)
+            else:
+                obj.save()
+        bulk_create_cells(new_cells)
+        formset.save_m2m()
+
     def add_view(self, request, form_url='', extra_context=None):
         if 'table' in request.GET:
             extra_context = extra_context or {}
@@ -349,6 +537,13 @@ class FileInline(admin.TabularInline):
 class ImageInline(admin.TabularInline):
     model = Image
     extra = 0
+    readonly_fields = ('display_thumbnail',)
+
+    def display_thumbnail(self, obj):
+        if obj.thumbnail:
+            return format_html('<img src="{}"/>', obj.thumbnail.url)
+        return "-"
+    display_thumbnail.short_description = 'Thumbnail'
 
 # Cell Admin
 
@@ -358,26 +553,57 @@ class CellAdmin(admin.ModelAdmin):
                     'display_value', 'display_computed_value')
     search_fields = ('column__name', 'value')
     list_filter = ('column__data_type',)
+    list_select_related = ('column', 'table_api__table', 'table_api__user')
+    list_per_page = 100
+    # Counting every cell on each filtered page view costs more than the page.
+    show_full_result_count = False
     inlines = [FileInline, ImageInline]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related(
+            Prefetch('files', queryset=File.objects.order_by('uploaded_at')),
+            Prefetch('images', queryset=Image.objects.order_by('uploaded_at')),
+        )
+
+    def get_changelist(self, request, **kwargs):
+        return PageChangeList
+
+    def annotate_page(self, cells):
+        """Computed values of a page of formula cells, from the compiled formulas."""
+        formula_columns = set()
+        for table_id in {cell.table_api.table_id for cell in cells}:
+            formula_columns |= set(load_formulas(table_id))
+        formula_cells = [cell for cell in cells if str(cell.column_id) in formula_columns]
+        computed = computed_values([
+            {'id': cell.id, 'table_api': cell.table_api_id, 'column': cell.column_id,
+             'value': cell.value, 'table': cell.table_api.table_id}
+            for cell in formula_cells
+        ])
+        for cell in cells:
+            cell.computed_display = computed.get(cell.id, "-")
+
     def display_table_api(self, obj):
-        return f"{obj.table_api.table.name} - {obj.table_api.user.username}"
+        user = obj.table_api.user
+        return f"{obj.table_api.table.name} - {user.username if user else '-'}"
     display_table_api.short_description = 'Table API'
 
     def display_value(self, obj):
-        if obj.column.data_type == 'image' and obj.images.exists():
-            final_image = obj.images.all()[0]
-            return format_html('<img src="{}" width="50" height="50"/>', final_image.image.url)
-        elif obj.column.data_type == 'file' and obj.files.exists():
-            final_file = obj.files.all()[0]
-            return format_html('<a href="{}">Download File</a>', final_file.file.url)
+        if obj.column.data_type == 'image':
+            images = obj.images.all()
+            if images:
+                preview = images[0].thumbnail or images[0].image
+                return format_html('<img src="{}" width="50" height="50" loading="lazy"/>', preview.url)
+        elif obj.column.data_type == 'file':
+            files = obj.files.all()
+            if files:
+                return format_html('<a href="{}">Download File</a>', files[0].file.url)
         return obj.value
     display_value.short_description = 'Value'
 
     def display_computed_value(self, obj):
-        if FormulaStep.objects.filter(column=obj.column).exists():
-            return obj.computed_value
-        return "-"
+        if not hasattr(obj, 'computed_display'):
+            self.annotate_page([obj])
+        return obj.computed_display
     display_computed_value.short_description = 'Computed Value'
 
 
@@ -388,14 +614,30 @@ admin.site.register(Cell, CellAdmin)
 
 @admin.register(File)
 class FileAdmin(admin.ModelAdmin):
-    list_display = ('id', 'cell', 'file', 'uploaded_at')
-    search_fields = ('cell__id', 'file')
+    list_display = ('id', 'cell', 'original_name', 'file', 'uploaded_at')
+    search_fields = ('cell__id', 'original_name', 'file')
+    list_select_related = ('cell__column',)
 
 
 @admin.register(Image)
 class ImageAdmin(admin.ModelAdmin):
-    list_display = ('id', 'cell', 'image', 'uploaded_at')
+    list_display = ('id', 'cell', 'display_thumbnail', 'uploaded_at')
     search_fields = ('cell__id', 'image')
+    list_select_related = ('cell__column',)
+    readonly_fields = ('display_thumbnail', 'content_hash')
+
+    def display_thumbnail(self, obj):
+        if obj.thumbnail:
+            return format_html('<img src="{}" width="50" height="50" loading="lazy"/>', obj.thumbnail.url)
+        return obj.image.name
+    display_thumbnail.short_description = 'Image'
+
+
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'size', 'refcount', 'updated_at')
+    search_fields = ('name',)
+    readonly_fields = ('name', 'size', 'refcount', 'created_at', 'updated_at')
 
 # Company Admin
 
@@ -404,6 +646,7 @@ class CompanyAdmin(admin.ModelAdmin):
     list_display = ('name',)
     search_fields = ('name',)
     ordering = ('name',)
+    filter_horizontal = ('members',)
 
 
 admin.site.register(Company, CompanyAdmin)
@@ -415,7 +658,9 @@ class ProjectAdmin(admin.ModelAdmin):
     list_display = ('name', 'company', 'created_at')
     search_fields = ('name',)
     list_filter = ('company', 'created_at')
+    list_select_related = ('company',)
     ordering = ('name',)
+    filter_horizontal = ('members',)
 
 
 admin.site.register(Project, ProjectAdmin)
@@ -428,9 +673,17 @@ class JobAdmin(admin.ModelAdmin):
                     'get_advisor_companies', 'get_contractor_companies')
     search_fields = ('name',)
     list_filter = ('project', 'created_at')
+    list_select_related = ('project',)
     ordering = ('name',)
     filter_horizontal = ('advisorCompanies', 'contractorCompanies',)
 
+    def get_queryset(self, request):
+        companies = Company.objects.only('id', 'name').order_by('name')
+        return super().get_queryset(request).prefetch_related(
+            Prefetch('advisorCompanies', queryset=companies),
+            Prefetch('contractorCompanies', queryset=companies),
+        )
+
     def get_advisor_companies(self, obj):
         return ", ".join([company.name for company in obj.advisorCompanies.all()])
     get_advisor_companies.short_description = "Advisor Companies"
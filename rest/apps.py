@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class RestConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'rest'
+
+    def ready(self):
+        # Registers the receivers that keep cached users, revocations and
+        # tenancy current.
+        from . import authentication, tenancy  # noqa: F401
@@ -0,0 +1,153 @@
+"""
+Native async read endpoints for table data, schema and cells.
+
+These are plain Django async views rather than DRF views, so under ASGI
+(``base.asgi.application``) the queries run through the async ORM and a
+slow query no longer pins a worker thread. They authenticate with the same
+JWT bearer tokens as the REST API and render with ``FastJSONRenderer``.
+
+Blocking calls never run on the event loop: those that may query go through
+``sync_to_async`` in the default thread-sensitive mode, which keeps them on
+the thread that owns the database connection, and those that only read the
+cache (token revocation, schema versions) use ``thread_sensitive=False`` so
+they do not queue behind queries.
+"""
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.http import require_GET
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from .authentication import ClaimsJWTAuthentication
+from .models import Cell, Column, Table, TableApi, computed_values, schema_versions
+from .renderers import FastJSONRenderer
+from .rows import cells_queryset, row_filters, row_queryset
+from .schema import (
+    SNAPSHOT_TIMEOUT, assemble_schema, not_modified, schema_etag, schema_querysets, table_schema_key
+)
+from .tenancy import scope_rows
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+_jwt = ClaimsJWTAuthentication()
+
+
+async def authenticate(request):
+    """Return the ``ClaimsUser`` for the request's bearer token, or None."""
+    header = _jwt.get_header(request)
+    if header is None:
+        return None
+    raw_token = _jwt.get_raw_token(header)
+    if raw_token is None:
+        return None
+    try:
+        # Signature and cached revocation checks only; no user query.
+        token = await sync_to_async(_jwt.get_validated_token, thread_sensitive=False)(raw_token)
+        return _jwt.get_user(token)
+    except (InvalidToken, TokenError):
+        return None
+
+
+def _unauthorized():
+    return JsonResponse(
+        {'detail': 'Authentication credentials were not provided.'}, status=401)
+
+
+def _render(data, status=200, headers=None):
+    return HttpResponse(
+        FastJSONRenderer().render(data), status=status,
+        content_type='application/json', headers=headers)
+
+
+def _page_bounds(request):
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+        size = min(max(int(request.GET.get('page_size', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        page, size = 1, DEFAULT_PAGE_SIZE
+    return (page - 1) * size, page * size
+
+
+@require_GET
+async def table_rows(request, pk):
+    """
+    One page of a table's TableApi rows, each with ``cells`` mapping column
+    id to stored value (formula cells store their computed result).
+    ``?<column id>=<value>`` filters rows, as on ``TableViewSet.rows``.
+    """
+    user = await authenticate(request)
+    if user is None:
+        return _unauthorized()
+    table = await Table.objects.filter(pk=pk).only('id', 'wide_rows').afirst()
+    if table is None:
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+    column_ids = [
+        column_id async for column_id in Column.objects.filter(
+            table_id=pk).values_list('id', flat=True)
+    ]
+    start, end = _page_bounds(request)
+    queryset = await sync_to_async(scope_rows)(
+        row_queryset(table, row_filters(request.GET, column_ids)), user)
+    rows = [row async for row in queryset[start:end]]
+    if table.wide_rows:
+        for row in rows:
+            row['cells'] = row.pop('row_data')
+    else:
+        by_id = {row['id']: {**row, 'cells': {}} for row in rows}
+        async for table_api_id, column_id, value in cells_queryset(list(by_id)):
+            by_id[table_api_id]['cells'].setdefault(str(column_id), value)
+        rows = list(by_id.values())
+    return _render({'table': str(pk), 'results': rows})
+
+
+@require_GET
+async def table_schema(request, pk):
+    """Async twin of ``TableViewSet.schema``, sharing its cache and ETags."""
+    if await authenticate(request) is None:
+        return _unauthorized()
+    table = await Table.objects.filter(pk=pk).only('id', 'name').afirst()
+    if table is None:
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+    versions = await sync_to_async(schema_versions, thread_sensitive=False)([table.id])
+    etag = schema_etag(versions)
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+    if not_modified(request, etag):
+        return HttpResponse(status=304, headers=headers)
+    key = table_schema_key(etag)
+    snapshot = await cache.aget(key)
+    if snapshot is None:
+        columns, options, steps = schema_querysets([table.id])
+        snapshot = assemble_schema(
+            [table],
+            [row async for row in columns],
+            [row async for row in options],
+            [row async for row in steps],
+        )[0]
+        await cache.aset(key, snapshot, SNAPSHOT_TIMEOUT)
+    return _render(snapshot, headers=headers)
+
+
+@require_GET
+async def table_api_cells(request, pk):
+    """Cells of one TableApi with their computed values."""
+    user = await authenticate(request)
+    if user is None:
+        return _unauthorized()
+    # Computing the accessible projects may query.
+    table_apis = await sync_to_async(scope_rows)(TableApi.objects.filter(pk=pk), user)
+    table_api = await table_apis.values('id', 'table').afirst()
+    if table_api is None:
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+    cells = [
+        cell async for cell in Cell.objects.filter(table_api_id=pk).values(
+            'id', 'column', 'value', 'created_at', 'table_api')
+    ]
+    computed = await sync_to_async(computed_values)(
+        [{**cell, 'table': table_api['table']} for cell in cells])
+    results = [
+        {'id': cell['id'], 'column': cell['column'], 'value': cell['value'],
+         'computed_value': computed[cell['id']], 'created_at': cell['created_at']}
+        for cell in cells
+    ]
+    return _render(results)
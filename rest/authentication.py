@@ -0,0 +1,152 @@
+"""
+JWT authentication without a database query per request.
+
+Access tokens carry the user's ``username``, ``role``, ``is_staff`` and
+``is_superuser`` claims, so ``ClaimsJWTAuthentication`` only checks the
+signature and builds a ``ClaimsUser`` from them. Code that needs the full
+``User`` row calls ``load_user`` (or ``request.user.user``), which keeps it
+in the shared cache for ``AUTH_USER_CACHE_SECONDS``.
+
+Revocation is cache-backed, as ``rest_framework_simplejwt.token_blacklist``
+is not installed: blacklisted token ids are kept until the token would have
+expired anyway, and deactivating a user or changing their password records a
+cut-off before which none of their tokens are accepted; so does changing
+any of the claims above, so a demoted user loses access at once. Both are
+read with a single ``get_many`` when a token is verified, so the cache must
+be shared by all processes (see ``CACHES``).
+"""
+import time
+from functools import cached_property
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import User
+
+USER_CLAIMS = ('username', 'role', 'is_staff', 'is_superuser')
+
+
+def blacklist_key(jti):
+    return f"jwt_blacklist_{jti}"
+
+
+def revoked_key(user_id):
+    return f"jwt_revoked_{user_id}"
+
+
+def user_key(user_id):
+    return f"auth_user_{user_id}"
+
+
+def is_revoked(payload):
+    """Whether the token was blacklisted or issued before its user's cut-off."""
+    jti = payload.get(api_settings.JTI_CLAIM)
+    user_id = payload.get(api_settings.USER_ID_CLAIM)
+    found = cache.get_many([blacklist_key(jti), revoked_key(user_id)])
+    if blacklist_key(jti) in found:
+        return True
+    revoked_at = found.get(revoked_key(user_id))
+    return revoked_at is not None and payload.get('iat', 0) < revoked_at
+
+
+def blacklist(payload):
+    """Reject the token with this payload until it expires."""
+    remaining = int(payload['exp'] - time.time())
+    if remaining > 0:
+        cache.set(blacklist_key(payload[api_settings.JTI_CLAIM]), True, remaining)
+
+
+def revoke_user_tokens(user_id):
+    """Reject every token issued to the user so far."""
+    lifetime = max(api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME)
+    cache.set(revoked_key(user_id), int(time.time()), int(lifetime.total_seconds()))
+
+
+def load_user(user_id):
+    """The ``User`` row for ``user_id``, from the cache when possible; None if missing."""
+    key = user_key(user_id)
+    user = cache.get(key)
+    if user is None:
+        user = User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+        if user is not None:
+            cache.set(key, user, settings.AUTH_USER_CACHE_SECONDS)
+    return user
+
+
+def add_user_claims(token, user):
+    for claim in USER_CLAIMS:
+        token[claim] = getattr(user, claim)
+    return token
+
+
+class CacheBlacklistMixin:
+    def verify(self, *args, **kwargs):
+        super().verify(*args, **kwargs)
+        if is_revoked(self.payload):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        blacklist(self.payload)
+
+
+class AccessToken(CacheBlacklistMixin, tokens.AccessToken):
+    pass
+
+
+class RefreshToken(CacheBlacklistMixin, tokens.RefreshToken):
+    access_token_class = AccessToken
+
+    @classmethod
+    def for_user(cls, user):
+        return add_user_claims(super().for_user(user), user)
+
+
+class ClaimsUser(TokenUser):
+    """``TokenUser`` with the claims ``RefreshToken.for_user`` adds."""
+
+    @property
+    def role(self):
+        return self.token.get('role', '')
+
+    @cached_property
+    def user(self):
+        """The full ``User`` row, loaded through the cache."""
+        return load_user(self.id)
+
+
+class ClaimsJWTAuthentication(JWTStatelessUserAuthentication):
+    """Checks the token's signature and revocation state; reads no user row."""
+
+
+@receiver(pre_save, sender=User)
+def check_credentials_change(sender, instance, **kwargs):
+    if instance._state.adding:
+        return
+    # Tokens carry USER_CLAIMS, which access checks trust until they expire.
+    previous = User.objects.filter(pk=instance.pk).values(
+        'password', 'is_active', *USER_CLAIMS).first()
+    instance._revoke_tokens = previous is not None and (
+        previous['password'] != instance.password
+        or (previous['is_active'] and not instance.is_active)
+        or any(previous[claim] != getattr(instance, claim) for claim in USER_CLAIMS))
+
+
+@receiver(post_save, sender=User)
+def refresh_cached_user(sender, instance, **kwargs):
+    cache.delete(user_key(instance.pk))
+    if getattr(instance, '_revoke_tokens', False):
+        revoke_user_tokens(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    cache.delete(user_key(instance.pk))
+    revoke_user_tokens(instance.pk)
@@ -0,0 +1,82 @@
+"""
+Split TableApis that hold more than one cell for a column.
+
+Older spreadsheet imports stored every row of a sheet in a single TableApi,
+and concurrent reads could create the same empty referenced cell twice.
+Both leave several cells per (table_api, column), which the unique
+constraint on ``Cell`` no longer allows.
+
+The functions take the model classes as arguments; migration 0004 runs a
+frozen copy of them with historical models.
+"""
+from django.db.models import Count, Exists, OuterRef, Q
+
+
+def duplicated_table_api_ids(Cell):
+    """Ids of TableApis with more than one cell for some column."""
+    return list(
+        Cell.objects.values('table_api_id', 'column_id')
+        .annotate(cells=Count('id')).filter(cells__gt=1)
+        .values_list('table_api_id', flat=True).distinct()
+    )
+
+
+def split_table_api(TableApi, Cell, table_api):
+    """
+    Leave at most one cell per column in ``table_api``.
+
+    When every column has the same number of cells, the TableApi is a
+    multi-row import: the k-th cell of each column (by creation) forms row
+    k, row 0 stays on the TableApi and every further row moves to a child
+    TableApi. Otherwise empty cells without files or images are dropped
+    from the duplicated columns first, and whatever is still duplicated is
+    split the same way. Returns ``(children created, cells deleted)``.
+    """
+    cells = Cell.objects.filter(table_api_id=table_api.id).annotate(
+        attached=Exists(Cell.objects.filter(pk=OuterRef('pk')).filter(
+            Q(files__isnull=False) | Q(images__isnull=False)))
+    ).order_by('created_at', 'id')
+    columns = {}
+    for cell in cells:
+        columns.setdefault(cell.column_id, []).append(cell)
+
+    deleted = []
+    if len({len(group) for group in columns.values()}) > 1:
+        for column_id, group in columns.items():
+            if len(group) < 2:
+                continue
+            keep = [cell for cell in group if cell.value or cell.attached] or group[:1]
+            deleted.extend(cell for cell in group if cell not in keep)
+            columns[column_id] = keep
+
+    rows = max(len(group) for group in columns.values()) if columns else 0
+    children = [
+        TableApi(table_id=table_api.table_id, job_id=table_api.job_id,
+                 user_id=table_api.user_id, parent_id=table_api.id)
+        for _ in range(rows - 1)
+    ]
+    TableApi.objects.bulk_create(children)
+    moved = []
+    for group in columns.values():
+        for child, cell in zip(children, group[1:]):
+            cell.table_api_id = child.id
+            moved.append(cell)
+    Cell.objects.bulk_update(moved, ['table_api'], batch_size=1000)
+    Cell.objects.filter(id__in=[cell.id for cell in deleted]).delete()
+    return len(children), len(deleted)
+
+
+def split_duplicated_table_apis(TableApi, Cell):
+    """Run ``split_table_api`` on every affected TableApi.
+
+    Returns ``{table_id: [table_api ids touched, children included]}``.
+    """
+    touched = {}
+    table_apis = TableApi.objects.filter(id__in=duplicated_table_api_ids(Cell))
+    for table_api in table_apis.order_by('id'):
+        split_table_api(TableApi, Cell, table_api)
+        ids = touched.setdefault(table_api.table_id, [])
+        ids.append(table_api.id)
+        ids.extend(TableApi.objects.filter(
+            parent_id=table_api.id).values_list('id', flat=True))
+    return touched
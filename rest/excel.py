@@ -0,0 +1,137 @@
+"""
+Streaming spreadsheet import.
+
+Workbooks are opened with openpyxl in read-only mode and read row by row
+with ``iter_rows(values_only=True)``. Rows are written in batches through
+``bulk_create_cells``, so memory use depends on ``batch_size`` rather than
+on the size of the file. Each sheet maps to one Table: its header row is
+matched against the given columns once, the first data row is stored on a
+new TableApi and every further row on a child of it.
+"""
+import zipfile
+
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+
+from .models import Cell, TableApi
+from .services import add_child_rows, bulk_create_cells
+from .tasks import IMPORT_QUEUE
+
+IMPORT_BATCH_ROWS = 1000
+
+
+class ExcelImportError(Exception):
+    """The workbook does not fit the requested tables and columns."""
+
+
+def cell_text(value, column, strict_numeric, row_number):
+    """Stored text for a spreadsheet value, as the pandas import produced it."""
+    if value is None:
+        return ''
+    if column.data_type == 'number':
+        try:
+            return str(float(value))
+        except (ValueError, TypeError):
+            if strict_numeric:
+                raise ExcelImportError(
+                    f'Invalid numeric value "{value}" in column "{column.name}" at row {row_number}')
+            return ''
+    return str(value)
+
+
+def header_positions(header, columns):
+    """``[(index, column)]`` for a header row; unknown headers are an error."""
+    column_map = {column.name: column for column in columns}
+    positions = []
+    unmatched = []
+    for index, name in enumerate(header):
+        if name is None:
+            continue
+        if str(name) in column_map:
+            positions.append((index, column_map[str(name)]))
+        else:
+            unmatched.append(str(name))
+    if unmatched:
+        raise ExcelImportError(
+            f"Excel columns {unmatched} do not match any provided column names")
+    return positions
+
+
+def _write_rows(table_api, rows, first):
+    row_apis = [table_api] if first else []
+    row_apis += add_child_rows(table_api, len(rows) - len(row_apis))
+    cells = []
+    for row_api, row in zip(row_apis, rows):
+        for cell in row:
+            cell.table_api = row_api
+            cells.append(cell)
+    bulk_create_cells(cells, queue=IMPORT_QUEUE)
+    return len(cells)
+
+
+def import_sheet(worksheet, table, columns, job=None, user_id=None,
+                 strict_numeric=True, batch_size=IMPORT_BATCH_ROWS):
+    """
+    Import one worksheet into ``table``. Returns ``(table_api, rows, cells)``;
+    rows without a value in any mapped column are skipped.
+    """
+    rows = worksheet.iter_rows(values_only=True)
+    positions = header_positions(next(rows, ()), columns)
+    table_api = TableApi.objects.create(table=table, job=job, user_id=user_id)
+    row_count = cell_count = 0
+    batch = []
+    for row_number, row in enumerate(rows, start=2):
+        values = [
+            (column, row[index] if index < len(row) else None)
+            for index, column in positions
+        ]
+        if all(value is None for _, value in values):
+            continue
+        batch.append([
+            Cell(column=column, is_required=False,
+                 value=cell_text(value, column, strict_numeric, row_number))
+            for column, value in values
+        ])
+        if len(batch) >= batch_size:
+            cell_count += _write_rows(table_api, batch, first=row_count == 0)
+            row_count += len(batch)
+            batch = []
+    if batch:
+        cell_count += _write_rows(table_api, batch, first=row_count == 0)
+        row_count += len(batch)
+    return table_api, row_count, cell_count
+
+
+def import_workbook(file, sheets, job=None, user_id=None, strict_numeric=True,
+                    batch_size=IMPORT_BATCH_ROWS):
+    """
+    Import ``sheets``, a list of dicts with ``sheet`` (name or index),
+    ``table`` and ``columns``. Returns one summary dict per sheet. Run it in
+    a transaction: a sheet that fails leaves earlier batches written.
+    """
+    try:
+        workbook = load_workbook(file, read_only=True, data_only=True)
+    except (InvalidFileException, zipfile.BadZipFile) as e:
+        raise ExcelImportError(f"Not a readable Excel workbook: {e}")
+    try:
+        results = []
+        for mapping in sheets:
+            sheet = mapping['sheet']
+            try:
+                worksheet = (workbook.worksheets[sheet] if isinstance(sheet, int)
+                             else workbook[sheet])
+            except (IndexError, KeyError):
+                raise ExcelImportError(f"Sheet {sheet!r} not found in workbook")
+            table_api, rows, cells = import_sheet(
+                worksheet, mapping['table'], mapping['columns'], job=job,
+                user_id=user_id, strict_numeric=strict_numeric, batch_size=batch_size)
+            results.append({
+                'sheet': worksheet.title,
+                'table_id': str(mapping['table'].id),
+                'table_api_id': str(table_api.id),
+                'rows': rows,
+                'cells': cells,
+            })
+        return results
+    finally:
+        workbook.close()
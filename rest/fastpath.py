@@ -0,0 +1,42 @@
+"""
+Serializer-free list endpoints for read-heavy, mostly flat models.
+
+``ValuesListMixin`` answers ``list()`` with dicts built from
+``QuerySet.values()`` instead of model instances run through serializer
+fields, and renders them with ``FastJSONRenderer``. Field names and order
+come from the view's serializer (after ``fields``/``omit`` pruning), so the
+payload matches the regular path key for key.
+"""
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.response import Response
+
+from .renderers import FastJSONRenderer
+
+
+class ValuesListMixin:
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def get_values_fields(self):
+        """Names of the fields the serializer would render, in order."""
+        serializer = self.get_serializer()
+        return [name for name, field in serializer.fields.items() if not field.write_only]
+
+    def get_values_lookups(self, fields):
+        """Arguments for ``values()``; by default the rendered fields themselves."""
+        return fields
+
+    def get_values_rows(self, rows, fields):
+        """Hook to add computed or nested data to the ``values()`` rows."""
+        return rows
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        fields = self.get_values_fields()
+        values = queryset.select_related(None).prefetch_related(None).values(
+            *self.get_values_lookups(fields))
+        page = self.paginate_queryset(values)
+        rows = self.get_values_rows(
+            list(page if page is not None else values), fields)
+        if page is not None:
+            return self.get_paginated_response(rows)
+        return Response(rows)
@@ -0,0 +1,146 @@
+"""
+Sparse fieldsets and expansion control for read requests.
+
+Every GET endpoint accepts three comma separated query parameters; dotted
+paths reach into nested serializers:
+
+``fields=id,name,jobs.name``
+    Render only these fields. A nested field listed without sub-paths is
+    rendered in full.
+``omit=description,jobs.advisorCompanies``
+    Drop these fields.
+``expand=jobs,jobs.advisorCompanies``
+    When present, only the listed nested serializers are rendered as
+    objects; every other nested serializer collapses to its primary key(s).
+
+``SparseFieldsMixin`` prunes the serializer tree and
+``SparseFieldsViewSetMixin`` joins or prefetches only the relations that
+are still rendered.
+"""
+from rest_framework import serializers
+
+
+def parse_paths(values):
+    """Turn ``['a,b.c', 'b.d']`` into ``{'a': {}, 'b': {'c': {}, 'd': {}}}``."""
+    tree = {}
+    for value in values:
+        for path in value.split(','):
+            node = tree
+            for part in path.strip().split('.'):
+                if part:
+                    node = node.setdefault(part, {})
+    return tree
+
+
+class FieldPlan:
+    """The parsed ``fields``/``omit``/``expand`` parameters of a request."""
+
+    def __init__(self, request):
+        params = request.query_params if request is not None else {}
+        self.include = parse_paths(
+            params.getlist('fields')) if 'fields' in params else None
+        self.omit = parse_paths(params.getlist('omit')) if 'omit' in params else {}
+        self.expand = parse_paths(
+            params.getlist('expand')) if 'expand' in params else None
+
+    @property
+    def active(self):
+        return self.include is not None or self.omit or self.expand is not None
+
+    def renders(self, name):
+        if self.include is not None and name not in self.include:
+            return False
+        return not (name in self.omit and not self.omit[name])
+
+    def expands(self, name):
+        return self.expand is None or name in self.expand
+
+
+def _collapse(field):
+    """Primary key stand-in for a nested serializer field."""
+    many = isinstance(field, serializers.ListSerializer)
+    kwargs = {'read_only': True, 'many': many}
+    if field.source != field.field_name:
+        kwargs['source'] = field.source
+    return serializers.PrimaryKeyRelatedField(**kwargs)
+
+
+def prune_fields(serializer, include, omit, expand):
+    """Apply the parsed trees to ``serializer.fields``, recursing into nested serializers."""
+    fields = serializer.fields
+    for name in list(fields):
+        if include is not None and name not in include:
+            del fields[name]
+            continue
+        if name in omit and not omit[name]:
+            del fields[name]
+            continue
+        field = fields[name]
+        nested = field.child if isinstance(
+            field, serializers.ListSerializer) else field
+        if not isinstance(nested, serializers.Serializer):
+            continue
+        if expand is not None and name not in expand:
+            fields[name] = _collapse(field)
+            continue
+        prune_fields(
+            nested,
+            include[name] or None if include is not None else None,
+            omit.get(name, {}),
+            expand[name] if expand is not None else None,
+        )
+
+
+class SparseFieldsMixin:
+    """
+    Serializer mixin that honours ``fields``/``omit``/``expand`` on GET.
+
+    Only the serializer built by the view (the one carrying the request in
+    its context) applies the plan; it prunes its nested serializers itself.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method != 'GET':
+            return
+        plan = FieldPlan(request)
+        if plan.active:
+            prune_fields(self, plan.include, plan.omit, plan.expand)
+
+
+class SparseFieldsViewSetMixin:
+    """
+    ViewSet mixin that adds joins and prefetches per rendered field.
+
+    ``field_select_related`` and ``field_prefetches`` map a top-level field
+    name to lookups that are applied only when that field is rendered. A
+    nested serializer that collapses to primary keys gets a plain prefetch
+    of its relation (when many-valued) instead.
+    """
+    field_select_related = {}
+    field_prefetches = {}
+
+    def get_queryset(self):
+        return self.apply_field_lookups(super().get_queryset())
+
+    def apply_field_lookups(self, queryset):
+        plan = FieldPlan(self.request if self.request.method == 'GET' else None)
+        declared = getattr(self.get_serializer_class(), '_declared_fields', {})
+        names = list(self.field_select_related) + [
+            name for name in self.field_prefetches if name not in self.field_select_related]
+        select, prefetch = [], []
+        for name in names:
+            if not plan.renders(name):
+                continue
+            field = declared.get(name)
+            if plan.expands(name) or not isinstance(field, serializers.BaseSerializer):
+                select.extend(self.field_select_related.get(name, ()))
+                prefetch.extend(self.field_prefetches.get(name, ()))
+            elif isinstance(field, serializers.ListSerializer):
+                prefetch.append(field.source or name)
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset
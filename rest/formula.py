@@ -0,0 +1,217 @@
+"""
+Compiled formula evaluation.
+
+A formula column's ``FormulaStep`` rows are compiled into plain tuples so a
+row can be evaluated from an in-memory ``{column_id: value}`` mapping. The
+compiled form holds no ORM objects, which keeps it cheap to cache and lets
+it be shipped to worker processes.
+
+Evaluation follows ``Cell.computed_value`` step for step: the first step
+seeds the result, unary operations (sqrt, percent) apply to the running
+result and binary operations take their right-hand side from the operand of
+the next step. A binary operation followed by a ``group`` step takes its
+right-hand side from the steps up to the matching ``end_group`` instead,
+evaluated on a fresh running result.
+"""
+import math
+
+import billiard
+
+UNARY_OPERATIONS = ('sqrt', 'percent')
+# Steps bracketing a group that follows the first operand
+GROUP = 'group'
+END_GROUP = 'end_group'
+
+OPERATIONS = {
+    'add': lambda x, y: x + y,
+    'subtract': lambda x, y: x - y,
+    'multiply': lambda x, y: x * y,
+    'divide': lambda x, y: x / y if y != 0 else float('nan'),
+    'sqrt': lambda x: x ** 0.5 if x >= 0 else float('nan'),
+    'percent': lambda x: x * 0.01,
+}
+
+ERROR_PREFIX = "Error in formula: "
+
+
+def _compile_operand(operand):
+    if operand is None:
+        return None
+    if operand.column_id:
+        return ('column', str(operand.column_id))
+    if operand.constant is not None:
+        return ('constant', float(operand.constant))
+    return None
+
+
+def compile_steps(steps):
+    """
+    Compile a column's steps (ordered by ``order``, with ``operand`` and
+    ``operation`` loaded) into a tuple of ``(operand, operation, next_operand)``.
+    """
+    steps = list(steps)
+    compiled = []
+    for index, step in enumerate(steps):
+        next_step = next(
+            (s for s in steps[index + 1:] if s.order > step.order), None)
+        compiled.append((
+            _compile_operand(step.operand),
+            step.operation.name if step.operation else None,
+            _compile_operand(next_step.operand) if next_step else None,
+        ))
+    return tuple(compiled)
+
+
+def compile_formulas(steps):
+    """
+    Group steps of several columns into ``{column_id: compiled}``.
+
+    Only number columns are evaluated, matching ``Cell.computed_value``; the
+    caller is expected to filter on ``column__data_type='number'``.
+    """
+    by_column = {}
+    for step in steps:
+        by_column.setdefault(str(step.column_id), []).append(step)
+    return {
+        column_id: compile_steps(sorted(column_steps, key=lambda s: s.order))
+        for column_id, column_steps in by_column.items()
+    }
+
+
+def referenced_columns(formulas):
+    """Column ids read by the given formulas, including other formula columns."""
+    columns = set()
+    for compiled in formulas.values():
+        for operand, _, next_operand in compiled:
+            for ref in (operand, next_operand):
+                if ref and ref[0] == 'column':
+                    columns.add(ref[1])
+    return columns
+
+
+class RowEvaluator:
+    """Evaluates every formula of one row, memoising intermediate columns."""
+
+    def __init__(self, formulas, values):
+        self.formulas = formulas
+        self.values = values
+        self.results = {}
+        self._active = set()
+
+    def value_of(self, column_id):
+        if column_id in self.formulas:
+            return self.evaluate(column_id)
+        return self.values.get(column_id, '')
+
+    def _operand_value(self, ref):
+        if ref[0] == 'constant':
+            return ref[1]
+        return float(self.value_of(ref[1]) or 0)
+
+    def evaluate(self, column_id):
+        """Return the computed value of a formula column as a string."""
+        if column_id in self.results:
+            return self.results[column_id]
+        if column_id in self._active:
+            raise ValueError(f"Circular reference to column {column_id}")
+        self._active.add(column_id)
+        try:
+            result = self._run(self.formulas[column_id])
+        except Exception as e:
+            result = ERROR_PREFIX + str(e)
+        else:
+            result = str(result) if result is not None else self.values.get(
+                column_id, '')
+        finally:
+            self._active.discard(column_id)
+        self.results[column_id] = result
+        return result
+
+    def _run(self, compiled):
+        result = None
+        pending = None  # a binary operation whose right-hand side is a group
+        groups = []  # (outer result, pending operation) per open group
+        for operand, operation, next_operand in compiled:
+            if operation == GROUP:
+                groups.append((result, pending))
+                result = pending = None
+                continue
+            if pending:
+                raise ValueError(f"No operand for operation {pending}")
+            if operation == END_GROUP:
+                if not groups:
+                    raise ValueError("Unbalanced group")
+                outer, combine = groups.pop()
+                if combine:
+                    result = OPERATIONS[combine](outer, result)
+                continue
+
+            if operand is not None:
+                value = self._operand_value(operand)
+            elif result is not None:
+                value = result
+            else:
+                value = 0
+
+            if result is None:
+                result = value
+            elif operation:
+                if operation in UNARY_OPERATIONS:
+                    result = OPERATIONS[operation](result)
+                elif next_operand is not None:
+                    result = OPERATIONS[operation](
+                        result, self._operand_value(next_operand))
+                else:
+                    pending = operation
+        if pending:
+            raise ValueError(f"No operand for operation {pending}")
+        return result
+
+
+def evaluate_row(formulas, values, columns=None):
+    """Evaluate ``columns`` (default: every formula) for a single row."""
+    evaluator = RowEvaluator(formulas, values)
+    return {
+        column_id: evaluator.evaluate(column_id)
+        for column_id in (columns if columns is not None else formulas)
+    }
+
+
+def _evaluate_chunk(args):
+    formulas, input_columns, output_columns, rows = args
+    out = []
+    for row in rows:
+        results = evaluate_row(
+            formulas, dict(zip(input_columns, row)), output_columns)
+        out.append(tuple(results[c] for c in output_columns))
+    return out
+
+
+def evaluate_rows(formulas, input_columns, rows, pool_size=1, min_rows=0):
+    """
+    Evaluate every formula for each row in ``rows``.
+
+    ``rows`` is a list of value tuples aligned with ``input_columns``. The
+    return value is a list of result tuples aligned with ``formulas`` (in
+    iteration order). When ``pool_size`` is above one and there are at least
+    ``min_rows`` rows, the rows are partitioned across a process pool.
+
+    The pool is billiard's, Celery's fork of ``multiprocessing``: unlike the
+    standard library it may be started from a daemonic process, such as a
+    worker of Celery's default prefork pool, which is where recomputes run.
+    """
+    output_columns = list(formulas)
+    if pool_size <= 1 or len(rows) < max(min_rows, 2):
+        return _evaluate_chunk((formulas, input_columns, output_columns, rows))
+
+    # A few chunks per worker keeps the pool busy when rows differ in cost.
+    chunk_size = max(1, math.ceil(len(rows) / (pool_size * 4)))
+    chunks = [
+        (formulas, input_columns, output_columns, rows[i:i + chunk_size])
+        for i in range(0, len(rows), chunk_size)
+    ]
+    results = []
+    with billiard.Pool(processes=pool_size) as pool:
+        for chunk_result in pool.imap(_evaluate_chunk, chunks):
+            results.extend(chunk_result)
+    return results
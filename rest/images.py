@@ -0,0 +1,70 @@
+"""
+Derivatives of uploaded cell images.
+
+Each ``Image`` gets a small thumbnail and a web-sized copy, sized by
+``IMAGE_DERIVATIVES``. They are rendered with Pillow in a Celery task after
+upload: the original is turned upright from its EXIF orientation, scaled
+down and re-encoded as WebP without any metadata, so EXIF (camera, GPS) is
+not served. Files are named after the SHA-256 of the original's content,
+so identical uploads share their derivatives and a derivative that already
+exists in storage is never rendered again.
+"""
+import hashlib
+import io
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image as PILImage, ImageOps
+
+DERIVATIVE_FORMAT = 'WEBP'
+DERIVATIVE_EXTENSION = 'webp'
+READ_BLOCK_SIZE = 1024 * 1024
+
+
+def content_hash(field_file):
+    digest = hashlib.sha256()
+    field_file.open('rb')
+    try:
+        for block in field_file.chunks(READ_BLOCK_SIZE):
+            digest.update(block)
+    finally:
+        field_file.close()
+    return digest.hexdigest()
+
+
+def derivative_name(digest, name):
+    return f"uploads/derivatives/{digest[:2]}/{digest}-{name}.{DERIVATIVE_EXTENSION}"
+
+
+def render_derivative(source, size):
+    """WebP bytes of ``source`` (a PIL image) fitted into ``size``, without metadata."""
+    image = source.copy()
+    image.thumbnail(size, PILImage.Resampling.LANCZOS)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or 'A' in image.mode else 'RGB')
+    out = io.BytesIO()
+    image.save(out, DERIVATIVE_FORMAT,
+               quality=settings.IMAGE_DERIVATIVE_QUALITY, method=6)
+    return out.getvalue()
+
+
+def generate_derivatives(image):
+    """
+    Render the missing derivatives of ``image`` (an ``Image``) and return
+    ``(content_hash, {name: storage name})``.
+    """
+    digest = content_hash(image.image)
+    names = {name: derivative_name(digest, name) for name in settings.IMAGE_DERIVATIVES}
+    missing = [name for name, path in names.items() if not default_storage.exists(path)]
+    if missing:
+        image.image.open('rb')
+        try:
+            with PILImage.open(image.image) as source:
+                source = ImageOps.exif_transpose(source)
+                for name in missing:
+                    rendered = render_derivative(source, settings.IMAGE_DERIVATIVES[name])
+                    names[name] = default_storage.save(names[name], ContentFile(rendered))
+        finally:
+            image.image.close()
+    return digest, names
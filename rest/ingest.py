@@ -0,0 +1,86 @@
+"""
+Insert backends for large batches of new cells.
+
+``insert_cells`` picks one per call. On PostgreSQL, batches of at least
+``CELL_COPY_MIN_ROWS`` cells are streamed with ``COPY FROM STDIN`` into a
+temporary staging table and moved into ``rest_cell`` with a single
+``INSERT ... SELECT``, which skips the per-row parameter binding of
+``bulk_create``. Every other case, SQLite included, uses batched
+``bulk_create``. Either way no signals are sent.
+"""
+import csv
+import io
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from .models import Cell
+
+COPY_CHUNK_ROWS = 100000
+
+
+def use_copy(count, using):
+    return (connections[using].vendor == 'postgresql'
+            and count >= settings.CELL_COPY_MIN_ROWS)
+
+
+def insert_cells(cells, batch_size=1000):
+    """Insert unsaved cells with the fastest backend for this database."""
+    using = router.db_for_write(Cell)
+    if use_copy(len(cells), using):
+        copy_insert(cells, using)
+    else:
+        Cell.objects.using(using).bulk_create(cells, batch_size=batch_size)
+    return cells
+
+
+def _copy(cursor, sql, data):
+    raw = cursor.cursor
+    if hasattr(raw, 'copy_expert'):  # psycopg2
+        raw.copy_expert(sql, data)
+    else:  # psycopg 3
+        with raw.copy(sql) as copy:
+            copy.write(data.getvalue())
+
+
+def copy_insert(cells, using='default'):
+    """
+    Stream ``cells`` into a staging table with COPY, then insert them into
+    the cell table in one statement. Every concrete field is written, as
+    text; the Cell model has no nullable fields, so no NULL handling is
+    needed.
+    """
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    fields = Cell._meta.concrete_fields
+    table = qn(Cell._meta.db_table)
+    stage = qn(f"{Cell._meta.db_table}_ingest")
+    columns = ', '.join(qn(field.column) for field in fields)
+    now = timezone.now()
+    for cell in cells:
+        if cell.created_at is None:
+            cell.created_at = now
+
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE IF NOT EXISTS {stage} "
+            f"(LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP")
+        cursor.execute(f"TRUNCATE {stage}")
+        copy_sql = f"COPY {stage} ({columns}) FROM STDIN WITH (FORMAT csv)"
+        for start in range(0, len(cells), COPY_CHUNK_ROWS):
+            data = io.StringIO()
+            writer = csv.writer(data, quoting=csv.QUOTE_ALL)
+            writer.writerows(
+                [field.get_db_prep_save(getattr(cell, field.attname), connection)
+                 for field in fields]
+                for cell in cells[start:start + COPY_CHUNK_ROWS]
+            )
+            data.seek(0)
+            _copy(cursor, copy_sql, data)
+        cursor.execute(
+            f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {stage}")
+        cursor.execute(f"TRUNCATE {stage}")
+    for cell in cells:
+        cell._state.adding = False
+        cell._state.db = using
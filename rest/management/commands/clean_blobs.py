@@ -0,0 +1,109 @@
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.utils import timezone
+
+from rest.models import BLOB_FIELDS, Blob, acquire_blob
+from rest.storage import BLOB_PREFIX, blob_storage, is_blob
+
+
+class Command(BaseCommand):
+    help = "Delete stored blobs that no File or Image refers to."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=int, default=settings.BLOB_GRACE_HOURS,
+            help="Only delete blobs unused for at least this many hours.")
+        parser.add_argument(
+            '--recount', action='store_true',
+            help="Recompute every reference count from the File and Image rows first.")
+        parser.add_argument(
+            '--adopt', action='store_true',
+            help="Move files stored before deduplication into blobs first.")
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Report what would be deleted without deleting it.")
+
+    def handle(self, *args, **options):
+        storage = blob_storage()
+        if options['adopt']:
+            self.adopt(storage, options['dry_run'])
+        if options['recount']:
+            self.recount(options['dry_run'])
+
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        removed = freed = 0
+        for blob in Blob.objects.filter(refcount__lte=0, updated_at__lt=cutoff).iterator():
+            if storage.exists(blob.name) and storage.get_modified_time(blob.name) >= cutoff:
+                continue  # Re-uploaded since; its row is about to be counted.
+            if not options['dry_run']:
+                if not Blob.objects.filter(pk=blob.pk, refcount__lte=0).delete()[0]:
+                    continue
+                storage.delete(blob.name)
+            removed += 1
+            freed += blob.size
+
+        # Blobs written by uploads whose row was never saved.
+        known = set(Blob.objects.values_list('name', flat=True))
+        root = storage.path(BLOB_PREFIX)
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, storage.location).replace(os.sep, '/')
+                if name in known or storage.get_modified_time(name) >= cutoff:
+                    continue
+                freed += os.path.getsize(path)
+                removed += 1
+                if not options['dry_run']:
+                    os.remove(path)
+
+        verb = "Would remove" if options['dry_run'] else "Removed"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {removed} blobs ({freed} bytes)"))
+
+    def recount(self, dry_run):
+        counts = {}
+        for model, field in BLOB_FIELDS.items():
+            for name, count in model.objects.values_list(field).annotate(n=Count('pk')):
+                if is_blob(name):
+                    counts[name] = counts.get(name, 0) + count
+        changed = 0
+        for blob in Blob.objects.iterator():
+            refcount = counts.pop(blob.name, 0)
+            if blob.refcount != refcount:
+                changed += 1
+                if not dry_run:
+                    Blob.objects.filter(pk=blob.pk).update(refcount=refcount)
+        for name, refcount in counts.items():
+            changed += 1
+            if not dry_run:
+                acquire_blob(name)
+                Blob.objects.filter(name=name).update(refcount=refcount)
+        self.stdout.write(f"Corrected {changed} reference counts")
+
+    def adopt(self, storage, dry_run):
+        adopted = 0
+        for model, field in BLOB_FIELDS.items():
+            rows = model.objects.exclude(**{field: ''}).exclude(
+                **{f'{field}__startswith': BLOB_PREFIX + '/'})
+            for pk, name in rows.values_list('pk', field).iterator():
+                if not storage.exists(name):
+                    self.stderr.write(f"Missing file for {model.__name__} {pk}: {name}")
+                    continue
+                adopted += 1
+                if dry_run:
+                    continue
+                with storage.open(name) as f:
+                    blob_name = storage.save(name, f)
+                updates = {field: blob_name}
+                if any(model_field.name == 'original_name' for model_field in model._meta.fields):
+                    updates['original_name'] = os.path.basename(name)
+                model.objects.filter(pk=pk).update(**updates)
+                acquire_blob(blob_name)
+                if not any(other.objects.filter(**{other_field: name}).exists()
+                           for other, other_field in BLOB_FIELDS.items()):
+                    storage.delete(name)
+        self.stdout.write(f"Moved {adopted} files into blobs")
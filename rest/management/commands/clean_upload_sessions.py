@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from rest.models import UploadSession
+from rest.uploads import discard_session
+
+
+class Command(BaseCommand):
+    help = "Delete upload sessions (and their temporary files) older than the expiry."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=int, default=settings.UPLOAD_SESSION_EXPIRY_HOURS,
+            help="Age in hours after which a session is removed.")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        sessions = UploadSession.objects.filter(created_at__lt=cutoff)
+        count = 0
+        for session in sessions.iterator():
+            discard_session(session)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Removed {count} upload sessions"))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from rest.dedup import duplicated_table_api_ids, split_duplicated_table_apis
+from rest.models import Cell, TableApi, sync_row_data
+from rest.tasks import BULK_QUEUE, enqueue_rows_recalculation
+
+
+class Command(BaseCommand):
+    help = (
+        "Split TableApis holding several cells for one column into child "
+        "TableApis (one per row) and drop empty duplicate cells, then "
+        "recompute formulas of the affected rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Only report how many TableApis are affected.")
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            count = len(duplicated_table_api_ids(Cell))
+            self.stdout.write(f"{count} TableApis hold duplicate cells")
+            return
+        with transaction.atomic():
+            touched = split_duplicated_table_apis(TableApi, Cell)
+            for table_api_ids in touched.values():
+                sync_row_data(table_api_ids)
+                ids = [str(table_api_id) for table_api_id in table_api_ids]
+                transaction.on_commit(
+                    lambda ids=ids: enqueue_rows_recalculation(ids, BULK_QUEUE))
+        rows = sum(len(ids) for ids in touched.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Split duplicates in {len(touched)} tables, {rows} rows scheduled for recompute"))
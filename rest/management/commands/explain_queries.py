@@ -0,0 +1,83 @@
+"""
+Print the query plans of the hot cell and formula lookups.
+
+Run it against a Postgres database that holds production-sized data (a
+fresh or tiny database is planned with sequential scans regardless of the
+indexes), e.g.::
+
+    DB_ENGINE=django.db.backends.postgresql python manage.py explain_queries --analyze
+
+Every plan that reads one of the app's tables with a sequential scan
+(``Seq Scan`` on Postgres, a bare ``SCAN`` on SQLite) is flagged and the
+command exits with an error, so it can also run as a CI check.
+"""
+import re
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from rest.models import Cell, Column, FormulaStep, TableApi
+
+FULL_SCAN = re.compile(
+    r'Seq Scan on (rest_\w+)|\bSCAN (rest_\w+)\b(?! USING)', re.IGNORECASE)
+
+
+def _sample(model, field):
+    value = model.objects.values_list(field, flat=True).first()
+    return value if value is not None else uuid.uuid4()
+
+
+def hot_queries():
+    """``(description, queryset)`` for the lookups the app runs most."""
+    table_api_id = _sample(Cell, 'table_api_id')
+    column_id = _sample(Cell, 'column_id')
+    table_id = _sample(TableApi, 'table_id')
+    job_id = _sample(TableApi, 'job_id')
+    return [
+        ("cell by (table_api, column)",
+         Cell.objects.filter(table_api_id=table_api_id, column_id=column_id)),
+        ("cells of a page of rows",
+         Cell.objects.filter(table_api_id__in=[table_api_id]).order_by('table_api_id', 'id')),
+        ("latest cells",
+         Cell.objects.order_by('-created_at')[:100]),
+        ("formula steps of a column",
+         FormulaStep.objects.filter(column_id=column_id).order_by('order')),
+        ("columns depending on a column",
+         FormulaStep.objects.filter(operand__column_id=column_id).values('column_id')),
+        ("formula columns of a table",
+         Column.objects.filter(table_id=table_id).exclude(formula_text='')),
+        ("rows of a table",
+         TableApi.objects.filter(table_id=table_id).order_by('id')[:100]),
+        ("rows of a job and table",
+         TableApi.objects.filter(job_id=job_id, table_id=table_id)),
+        ("child rows",
+         TableApi.objects.filter(parent_id=table_api_id)),
+    ]
+
+
+class Command(BaseCommand):
+    help = "Print query plans of the hot lookups and flag sequential scans."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--analyze', action='store_true',
+            help="Run the queries (EXPLAIN ANALYZE) on Postgres.")
+
+    def handle(self, *args, **options):
+        explain = {}
+        if options['analyze'] and connection.vendor == 'postgresql':
+            explain = {'analyze': True, 'buffers': True}
+        flagged = []
+        for description, queryset in hot_queries():
+            plan = queryset.explain(**explain)
+            scans = sorted({
+                table for match in FULL_SCAN.finditer(plan) for table in match.groups() if table})
+            self.stdout.write(self.style.MIGRATE_HEADING(description))
+            self.stdout.write(plan + '\n')
+            if scans:
+                flagged.append(f"{description}: {', '.join(scans)}")
+        if flagged:
+            raise CommandError(
+                "Sequential scans found:\n  " + "\n  ".join(flagged))
+        self.stdout.write(self.style.SUCCESS("No sequential scans"))
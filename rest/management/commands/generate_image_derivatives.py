@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from rest.models import Image
+from rest.tasks import generate_image_derivatives_task
+
+
+class Command(BaseCommand):
+    help = "Queue derivative rendering for images that have none yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help="Queue every image, not only those without derivatives.")
+        parser.add_argument(
+            '--sync', action='store_true',
+            help="Render in this process instead of queueing Celery tasks.")
+
+    def handle(self, *args, **options):
+        images = Image.objects.exclude(image='')
+        if not options['all']:
+            images = images.filter(thumbnail='')
+        count = 0
+        for image_id in images.values_list('id', flat=True).iterator():
+            if options['sync']:
+                generate_image_derivatives_task(str(image_id))
+            else:
+                generate_image_derivatives_task.delay(str(image_id))
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"{count} images processed"))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from rest.models import Table
+from rest.services import normalize_rows
+
+
+class Command(BaseCommand):
+    help = "Create the missing (empty) cells so every TableApi has one cell per column."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'tables', nargs='*',
+            help="Table ids to normalize (default: all tables).")
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="TableApis handled per batch.")
+
+    def handle(self, *args, **options):
+        tables = Table.objects.order_by('name')
+        if options['tables']:
+            tables = tables.filter(id__in=options['tables'])
+            if tables.count() != len(set(options['tables'])):
+                raise CommandError("Some of the given tables do not exist.")
+        total = 0
+        for table in tables:
+            created = normalize_rows(table.id, batch_size=options['batch_size'])
+            total += created
+            self.stdout.write(f"{table.name}: created {created} cells")
+        self.stdout.write(self.style.SUCCESS(f"Created {total} cells"))
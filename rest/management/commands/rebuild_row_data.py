@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from rest.models import Table
+from rest.services import rebuild_row_data
+
+
+class Command(BaseCommand):
+    help = "Rebuild TableApi.row_data for tables with wide rows enabled."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'tables', nargs='*',
+            help="Table ids to rebuild (default: all wide-rows tables).")
+        parser.add_argument(
+            '--enable', action='store_true',
+            help="Enable wide rows on the given tables before rebuilding.")
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="TableApis rebuilt per batch.")
+
+    def handle(self, *args, **options):
+        tables = Table.objects.order_by('name')
+        if options['tables']:
+            tables = tables.filter(id__in=options['tables'])
+            if tables.count() != len(set(options['tables'])):
+                raise CommandError("Some of the given tables do not exist.")
+            if options['enable']:
+                for table in tables.filter(wide_rows=False):
+                    table.wide_rows = True
+                    table.save(update_fields=['wide_rows'])
+        elif options['enable']:
+            raise CommandError("--enable needs explicit table ids.")
+        for table in tables.filter(wide_rows=True):
+            count = rebuild_row_data(table.id, batch_size=options['batch_size'])
+            self.stdout.write(f"{table.name}: rebuilt {count} rows")
+        self.stdout.write(self.style.SUCCESS("Done"))
@@ -0,0 +1,66 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from rest.models import Column, FormulaStep, Operation, load_formulas
+from rest.schema import column_catalogue
+from rest.tasks import enqueue_table_recompute
+from rest.utils import FormulaParseError, check_formula, compile_formula, save_formula
+
+
+def stored_plan(column):
+    """The column's FormulaSteps as ``(operand, operation)`` pairs, like a plan."""
+    plan = []
+    for step in FormulaStep.objects.filter(column=column).select_related(
+            'operand__column', 'operation').order_by('order'):
+        operand = None
+        if step.operand and step.operand.column_id:
+            operand = ('column', step.operand.column.name)
+        elif step.operand and step.operand.constant is not None:
+            operand = ('constant', Decimal(step.operand.constant))
+        plan.append((operand, step.operation.name if step.operation else None))
+    return plan
+
+
+class Command(BaseCommand):
+    help = (
+        "Compile every formula_text again and replace the steps of formula "
+        "columns whose stored steps differ, such as formulas saved before "
+        "groups after the first operand were kept. Formulas that no longer "
+        "compile are reported and left as they are."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Only report the formulas that would change or do not compile.")
+
+    def handle(self, *args, **options):
+        operations = {operation.name: operation for operation in Operation.objects.all()}
+        columns = Column.objects.filter(data_type='number').exclude(
+            formula_text='').select_related('table').order_by('table__name', 'name')
+        changed = failed = 0
+        for column in columns:
+            label = f"{column.table.name}.{column.name}"
+            try:
+                plan = compile_formula(column.formula_text, operations)
+                check_formula(
+                    plan, column.id, column_catalogue(column.table_id)['columns'],
+                    load_formulas(column.table_id))
+            except FormulaParseError as e:
+                failed += 1
+                self.stderr.write(f"{label}: {e}")
+                continue
+            if [tuple(step) for step in plan] == stored_plan(column):
+                continue
+            changed += 1
+            self.stdout.write(f"{label}: steps differ from {column.formula_text!r}")
+            if not options['dry_run']:
+                with transaction.atomic():
+                    save_formula(column, plan, operations)
+                    transaction.on_commit(
+                        lambda table_id=column.table_id: enqueue_table_recompute(table_id))
+        verb = "would be recompiled" if options['dry_run'] else "recompiled"
+        self.stdout.write(self.style.SUCCESS(
+            f"{changed} formulas {verb}, {failed} do not compile"))
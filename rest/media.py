@@ -0,0 +1,189 @@
+"""
+Serving of uploaded media under ``MEDIA_URL``.
+
+Media belongs to cells, so it is only sent to a user who may see a cell
+whose File or Image refers to it: signed in to the admin, or with the same
+``Authorization`` header as the API. Responses are ``Cache-Control:
+private``, so shared proxies never keep a tenant's files.
+
+``serve_media`` answers conditional requests (``If-None-Match``,
+``If-Modified-Since``) and single byte ranges (``Range``, ``If-Range``), so
+interrupted downloads resume and video or PDF viewers can seek. Blobs and
+image derivatives are named after their content hash: that hash is their
+ETag and they may be kept for a year without revalidation. Other files get
+a size/mtime ETag and ``MEDIA_CACHE_SECONDS``.
+
+With ``MEDIA_SENDFILE`` set to ``nginx`` (or ``apache``) the view only
+resolves the path and answers with ``X-Accel-Redirect`` (or
+``X-Sendfile``); the web server then streams the bytes, ranges included,
+and no Python worker is held for the length of the download. Only that
+internal location may map to ``MEDIA_ROOT``: a public alias of it would
+bypass the access check.
+"""
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse,
+)
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from django.views.decorators.http import require_http_methods
+from rest_framework.exceptions import AuthenticationFailed
+
+from .authentication import ClaimsJWTAuthentication
+from .models import Cell, File, Image
+from .tenancy import has_full_access, scope_rows
+
+IMMUTABLE_CACHE_SECONDS = 365 * 24 * 3600
+READ_BLOCK_SIZE = 64 * 1024
+CONTENT_HASH = re.compile(r'(?<![0-9a-f])([0-9a-f]{64})(?![0-9a-f])')
+SINGLE_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+COMPRESSED_TYPES = {
+    'bzip2': 'application/x-bzip',
+    'gzip': 'application/gzip',
+    'xz': 'application/x-xz',
+    'br': 'application/x-brotli',
+}
+
+
+def media_etag(path, stats):
+    match = CONTENT_HASH.search(os.path.basename(path))
+    if match:
+        return quote_etag(match.group(1)), True
+    return quote_etag(f"{stats.st_size:x}-{stats.st_mtime_ns:x}"), False
+
+
+def byte_range(header, size):
+    """
+    ``(start, end)`` (inclusive) for a single-range ``Range`` header, None
+    to send the whole file, or ``False`` when the range cannot be satisfied.
+    """
+    match = SINGLE_RANGE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None  # Malformed or multi-range: ignore it and send everything.
+    first, last = match.groups()
+    if first == '':
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def media_user(request):
+    """The admin session's user, else the API token's; None if neither."""
+    if request.user.is_authenticated:
+        return request.user
+    try:
+        authenticated = ClaimsJWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+    return authenticated[0] if authenticated else None
+
+
+def can_see_media(user, name):
+    """Whether ``user`` may see a cell with a File or Image stored at ``name``."""
+    if has_full_access(user):
+        return True
+    cells = scope_rows(Cell.objects.all(), user, 'table_api')
+    return (
+        File.objects.filter(file=name, cell__in=cells).exists()
+        or Image.objects.filter(
+            Q(image=name) | Q(thumbnail=name) | Q(web_image=name), cell__in=cells).exists())
+
+
+def _etag_matches(header, etag):
+    return any(tag.strip() in (etag, '*', f"W/{etag}") for tag in header.split(','))
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length:
+            block = f.read(min(READ_BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+
+@require_http_methods(['GET', 'HEAD'])
+def serve_media(request, path):
+    user = media_user(request)
+    if user is None:
+        return HttpResponse(status=401, headers={'WWW-Authenticate': 'Bearer'})
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stats = os.stat(full_path)
+    except (OSError, ValueError):
+        raise Http404("File not found")
+    name = os.path.relpath(full_path, settings.MEDIA_ROOT).replace(os.sep, '/')
+    if not stat.S_ISREG(stats.st_mode) or not can_see_media(user, name):
+        raise Http404("File not found")
+
+    etag, immutable = media_etag(full_path, stats)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stats.st_mtime),
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': (
+            f"private, max-age={IMMUTABLE_CACHE_SECONDS}, immutable" if immutable
+            else f"private, max-age={settings.MEDIA_CACHE_SECONDS}"),
+        'Vary': 'Authorization, Cookie',
+    }
+
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        not_modified = _etag_matches(if_none_match, etag)
+    else:
+        since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        not_modified = since is not None and int(stats.st_mtime) <= since
+    if not_modified:
+        return HttpResponseNotModified(headers=headers)
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    # Compressed files are served as they are, not as their decompressed type.
+    content_type = COMPRESSED_TYPES.get(encoding, content_type) or 'application/octet-stream'
+
+    sendfile = settings.MEDIA_SENDFILE
+    if sendfile:
+        # The web server handles Range and the body.
+        if sendfile == 'nginx':
+            headers['X-Accel-Redirect'] = settings.MEDIA_SENDFILE_PREFIX.rstrip('/') + '/' + quote(path)
+        else:
+            headers['X-Sendfile'] = full_path
+        return HttpResponse(content_type=content_type, headers=headers)
+
+    size = stats.st_size
+    span = None
+    if 'Range' in request.headers:
+        if_range = request.headers.get('If-Range')
+        if if_range is None or if_range.strip() == etag:
+            span = byte_range(request.headers['Range'], size)
+    if span is False:
+        return HttpResponse(
+            status=416, headers={**headers, 'Content-Range': f"bytes */{size}"})
+
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type, headers=headers)
+        response['Content-Length'] = size
+        return response
+    if span is None:
+        return FileResponse(open(full_path, 'rb'), content_type=content_type, headers=headers)
+    start, end = span
+    response = StreamingHttpResponse(
+        _read_range(full_path, start, end - start + 1), status=206,
+        content_type=content_type, headers=headers)
+    response['Content-Range'] = f"bytes {start}-{end}/{size}"
+    response['Content-Length'] = end - start + 1
+    return response
@@ -0,0 +1,119 @@
+# Generated by Django 5.1.5 on 2026-10-19 12:17
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='File',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('file', models.FileField(upload_to='uploads/files/')),
+                ('uploaded_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FormulaOperand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('constant', models.DecimalField(blank=True, decimal_places=2, help_text='The constant operand (if applicable).', max_digits=12, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FormulaStep',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order', models.IntegerField(default=0, help_text='Order of this step in the formula.')),
+            ],
+            options={
+                'ordering': ['order'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Image',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('image', models.ImageField(upload_to='uploads/images/')),
+                ('uploaded_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Operation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(choices=[('add', 'Addition (+)'), ('subtract', 'Subtraction (-)'), ('multiply', 'Multiplication (*)'), ('divide', 'Division (/)'), ('sqrt', 'Square Root (sqrt)'), ('percent', 'Percentage (%)')], max_length=50, unique=True)),
+                ('symbol', models.CharField(max_length=10)),
+            ],
+        ),
+        migrations.RemoveField(
+            model_name='cell',
+            name='file',
+        ),
+        migrations.RemoveField(
+            model_name='cell',
+            name='image',
+        ),
+        migrations.AddField(
+            model_name='column',
+            name='formula_text',
+            field=models.TextField(blank=True, help_text="Enter the formula as a string (e.g., 'sqrt(W_1) + W_2 % * (W_3 - W_1)'). Supported operations: +, -, *, /, sqrt(), %"),
+        ),
+        migrations.AddField(
+            model_name='tablecategory',
+            name='job_table_collection',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='table_categories', to='rest.jobtablecollection'),
+        ),
+        migrations.AddField(
+            model_name='tablecategory',
+            name='order_number',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='tableapi',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='table_apis', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='cell',
+            index=models.Index(fields=['table_api', 'column'], name='rest_cell_table_a_48937e_idx'),
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='cell',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='files', to='rest.cell'),
+        ),
+        migrations.AddField(
+            model_name='formulaoperand',
+            name='column',
+            field=models.ForeignKey(blank=True, help_text='The column operand (if applicable).', null=True, on_delete=django.db.models.deletion.CASCADE, to='rest.column'),
+        ),
+        migrations.AddField(
+            model_name='formulastep',
+            name='column',
+            field=models.ForeignKey(help_text='The column this step belongs to.', on_delete=django.db.models.deletion.CASCADE, related_name='steps', to='rest.column'),
+        ),
+        migrations.AddField(
+            model_name='formulastep',
+            name='operand',
+            field=models.ForeignKey(blank=True, help_text='The operand for this step (column or constant).', null=True, on_delete=django.db.models.deletion.CASCADE, to='rest.formulaoperand'),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='cell',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='images', to='rest.cell'),
+        ),
+        migrations.AddField(
+            model_name='formulastep',
+            name='operation',
+            field=models.ForeignKey(blank=True, help_text='The operation to apply (e.g., +, -, *, /, sqrt, %).', null=True, on_delete=django.db.models.deletion.CASCADE, to='rest.operation'),
+        ),
+    ]
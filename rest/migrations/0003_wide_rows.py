@@ -0,0 +1,23 @@
+# Generated by Django 5.1.5 on 2026-10-19 12:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest', '0002_formulas_files_images'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='table',
+            name='wide_rows',
+            field=models.BooleanField(default=False, help_text="Keep each TableApi's values in TableApi.row_data. Run the rebuild_row_data command after enabling."),
+        ),
+        migrations.AddField(
+            model_name='tableapi',
+            name='row_data',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,77 @@
+from django.db import migrations
+from django.db.migrations.exceptions import IrreversibleError
+from django.db.models import Count, Exists, OuterRef, Q
+
+
+def split_duplicate_cells(apps, schema_editor):
+    """
+    Leave at most one cell per (table_api, column), as the unique constraint
+    added in 0005 requires.
+
+    When every column of a TableApi has the same number of cells it is a
+    multi-row import: the k-th cell of each column (by creation) forms row
+    k, row 0 stays on the TableApi and every further row moves to a child
+    TableApi. Otherwise empty cells without files or images are dropped
+    from the duplicated columns first, and what is still duplicated is
+    split the same way. Formula cells moved to child rows keep their old
+    values until the table is recomputed (the "Recompute formula values"
+    table action).
+
+    A copy of ``rest.dedup`` as of this migration, so later changes to it
+    do not change what the migration does.
+    """
+    TableApi = apps.get_model('rest', 'TableApi')
+    Cell = apps.get_model('rest', 'Cell')
+    duplicated = (
+        Cell.objects.values('table_api_id', 'column_id')
+        .annotate(cells=Count('id')).filter(cells__gt=1)
+        .values_list('table_api_id', flat=True).distinct()
+    )
+    for table_api in TableApi.objects.filter(id__in=list(duplicated)).order_by('id'):
+        cells = Cell.objects.filter(table_api_id=table_api.id).annotate(
+            attached=Exists(Cell.objects.filter(pk=OuterRef('pk')).filter(
+                Q(files__isnull=False) | Q(images__isnull=False)))
+        ).order_by('created_at', 'id')
+        columns = {}
+        for cell in cells:
+            columns.setdefault(cell.column_id, []).append(cell)
+
+        deleted = []
+        if len({len(group) for group in columns.values()}) > 1:
+            for column_id, group in columns.items():
+                if len(group) < 2:
+                    continue
+                keep = [cell for cell in group if cell.value or cell.attached] or group[:1]
+                deleted.extend(cell for cell in group if cell not in keep)
+                columns[column_id] = keep
+
+        rows = max(len(group) for group in columns.values())
+        children = [
+            TableApi(table_id=table_api.table_id, job_id=table_api.job_id,
+                     user_id=table_api.user_id, parent_id=table_api.id)
+            for _ in range(rows - 1)
+        ]
+        TableApi.objects.bulk_create(children)
+        moved = []
+        for group in columns.values():
+            for child, cell in zip(children, group[1:]):
+                cell.table_api_id = child.id
+                moved.append(cell)
+        Cell.objects.bulk_update(moved, ['table_api'], batch_size=1000)
+        Cell.objects.filter(id__in=[cell.id for cell in deleted]).delete()
+
+
+def keep_split_cells(apps, schema_editor):
+    raise IrreversibleError(
+        "Cells split into child rows cannot be merged back into one TableApi.")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest', '0003_wide_rows'),
+    ]
+
+    operations = [
+        migrations.RunPython(split_duplicate_cells, keep_split_cells),
+    ]
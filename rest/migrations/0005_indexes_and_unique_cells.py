@@ -0,0 +1,49 @@
+# Generated by Django 5.1.5 on 2026-10-19 12:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest', '0004_split_duplicate_cells'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='cell',
+            name='rest_cell_table_a_48937e_idx',
+        ),
+        migrations.AddIndex(
+            model_name='cell',
+            index=models.Index(fields=['created_at'], name='cell_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='column',
+            index=models.Index(condition=models.Q(('formula_text', ''), _negated=True), fields=['table'], name='column_formula_table_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='formulaoperand',
+            index=models.Index(fields=['column', 'id'], name='formulaoperand_column_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='formulastep',
+            index=models.Index(fields=['column', 'order'], name='formulastep_column_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='formulastep',
+            index=models.Index(fields=['operand', 'column'], name='formulastep_operand_column_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tableapi',
+            index=models.Index(fields=['table', 'id'], name='tableapi_table_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tableapi',
+            index=models.Index(fields=['job', 'table'], name='tableapi_job_table_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='cell',
+            constraint=models.UniqueConstraint(fields=('table_api', 'column'), name='unique_cell_per_table_api_column'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.1.5 on 2026-10-19 12:25
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest', '0005_indexes_and_unique_cells'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('file', 'File'), ('image', 'Image'), ('excel', 'Excel import')], max_length=10)),
+                ('filename', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField(help_text='Total size of the file in bytes.')),
+                ('checksum', models.CharField(blank=True, default='', help_text='Expected SHA-256 of the whole file (hex), if known.', max_length=64)),
+                ('options', models.JSONField(blank=True, default=dict, help_text='Import options for Excel uploads.')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('complete', 'Complete')], default='pending', max_length=10)),
+                ('result', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('cell', models.ForeignKey(blank=True, help_text='Target cell for file and image uploads.', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to='rest.cell')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UploadChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField()),
+                ('offset', models.BigIntegerField()),
+                ('size', models.PositiveIntegerField()),
+                ('checksum', models.CharField(max_length=64)),
+                ('received_at', models.DateTimeField(auto_now=True)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='rest.uploadsession')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('session', 'index'), name='unique_chunk_per_session')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.5 on 2026-10-19 12:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest', '0006_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='thumbnail',
+            field=models.ImageField(blank=True, editable=False, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='web_image',
+            field=models.ImageField(blank=True, editable=False, upload_to=''),
+        ),
+    ]
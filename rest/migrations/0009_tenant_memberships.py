@@ -0,0 +1,24 @@
+# Generated by Django 5.1.5 on 2026-10-19 12:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest', '0008_content_addressed_blobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='members',
+            field=models.ManyToManyField(blank=True, related_name='companies', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='members',
+            field=models.ManyToManyField(blank=True, related_name='member_projects', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
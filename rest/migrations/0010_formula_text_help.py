@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-19 12:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest', '0009_tenant_memberships'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='column',
+            name='formula_text',
+            field=models.TextField(blank=True, help_text="Enter the formula as a string (e.g., 'sqrt(W_1 + W_2) * W_3 %'), evaluated left to right. Supported operations: +, -, *, /, sqrt(), %; parentheses only around the start of the formula."),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.5 on 2026-10-19 13:12
+
+from django.db import migrations, models
+
+
+GROUP_OPERATIONS = {'group': '(', 'end_group': ')'}
+
+
+def add_group_operations(apps, schema_editor):
+    # compile_formula only uses operations that exist as rows.
+    Operation = apps.get_model('rest', 'Operation')
+    for name, symbol in GROUP_OPERATIONS.items():
+        Operation.objects.get_or_create(name=name, defaults={'symbol': symbol})
+
+
+def remove_group_operations(apps, schema_editor):
+    # Operations still used by formula steps are kept with them.
+    apps.get_model('rest', 'Operation').objects.filter(
+        name__in=GROUP_OPERATIONS, formulastep__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest', '0010_formula_text_help'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='column',
+            name='formula_text',
+            field=models.TextField(blank=True, help_text="Enter the formula as a string (e.g., 'sqrt(W_1) + W_2 % * (W_3 - W_1)'), evaluated left to right. Supported operations: +, -, *, /, sqrt(), % and parentheses."),
+        ),
+        migrations.AlterField(
+            model_name='operation',
+            name='name',
+            field=models.CharField(choices=[('add', 'Addition (+)'), ('subtract', 'Subtraction (-)'), ('multiply', 'Multiplication (*)'), ('divide', 'Division (/)'), ('sqrt', 'Square Root (sqrt)'), ('percent', 'Percentage (%)'), ('group', 'Open group (()'), ('end_group', 'Close group ())')], max_length=50, unique=True),
+        ),
+        migrations.RunPython(add_group_operations, remove_group_operations),
+    ]
@@ -2,13 +2,17 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ValidationError
 from django.conf import settings
+import os
 import uuid
-from django.db.models import F
+from django.db.models import F, Q
 from django.core.cache import cache
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
 from django.dispatch import receiver
-from celery import shared_task
 import threading
+from django.utils import timezone
+from .formula import RowEvaluator, compile_formulas, referenced_columns
+from .storage import blob_storage, is_blob
 
 
 thread_local = threading.local()
@@ -65,6 +69,9 @@ class Company(models.Model):
     website = models.URLField(blank=True)
     established_date = models.DateField(null=True, blank=True)
     description = models.TextField(blank=True)
+    # Members see every project of the company (see rest/tenancy.py).
+    members = models.ManyToManyField(
+        settings.AUTH_USER_MODEL, related_name="companies", blank=True)
 
     def __str__(self):
         return self.name
@@ -91,6 +98,9 @@ class Project(models.Model):
         on_delete=models.CASCADE,
         related_name="projects"
     )
+    # Users given this project alone, without the rest of the company.
+    members = models.ManyToManyField(
+        settings.AUTH_USER_MODEL, related_name="member_projects", blank=True)
 
     def __str__(self):
         return self.name
@@ -171,6 +181,10 @@ class Table(models.Model):
     category = models.ForeignKey(
         'TableCategory', on_delete=models.CASCADE, related_name="tables", null=True, blank=True
     )
+    wide_rows = models.BooleanField(
+        default=False,
+        help_text="Keep each TableApi's values in TableApi.row_data. "
+                  "Run the rebuild_row_data command after enabling.")
 
     def __str__(self):
         return self.name
@@ -186,6 +200,9 @@ class Operation(models.Model):
         ('divide', 'Division (/)'),
         ('sqrt', 'Square Root (sqrt)'),
         ('percent', 'Percentage (%)'),
+        # Bracket a parenthesised group after the first operand
+        ('group', 'Open group (()'),
+        ('end_group', 'Close group ())'),
     ])
     # Increased length for 'sqrt' and 'percent'
     symbol = models.CharField(max_length=10)
@@ -221,6 +238,12 @@ class FormulaOperand(models.Model):
         help_text="The constant operand (if applicable)."
     )
 
+    class Meta:
+        indexes = [
+            # Operand ids by referenced column, without touching the table.
+            models.Index(fields=['column', 'id'], name='formulaoperand_column_idx'),
+        ]
+
     def __str__(self):
         if self.column:
             return f"Column: {self.column.name}"
@@ -250,6 +273,11 @@ class FormulaStep(models.Model):
 
     class Meta:
         ordering = ['order']
+        indexes = [
+            models.Index(fields=['column', 'order'], name='formulastep_column_order_idx'),
+            # Dependency lookup: which columns use a given operand.
+            models.Index(fields=['operand', 'column'], name='formulastep_operand_column_idx'),
+        ]
 
     def __str__(self):
         if self.operand and self.operand.column:
@@ -283,9 +311,15 @@ class Column(models.Model):
     )
     formula_text = models.TextField(
         blank=True,
-        help_text="Enter the formula as a string (e.g., 'sqrt(W_1) + W_2 % * (W_3 - W_1)'). Supported operations: +, -, *, /, sqrt(), %"
+        help_text="Enter the formula as a string (e.g., 'sqrt(W_1) + W_2 % * (W_3 - W_1)'), evaluated left to right. Supported operations: +, -, *, /, sqrt(), % and parentheses."
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['table'], condition=~Q(formula_text=''),
+                         name='column_formula_table_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.data_type})"
 
@@ -318,6 +352,14 @@ class TableApi(models.Model):
     )
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
                              on_delete=models.CASCADE, related_name="table_apis", blank=True, null=True)
+    # Column id -> stored value, maintained only for tables with wide_rows.
+    row_data = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['table', 'id'], name='tableapi_table_id_idx'),
+            models.Index(fields=['job', 'table'], name='tableapi_job_table_idx'),
+        ]
 
 
 # Cell Model
@@ -334,8 +376,13 @@ class Cell(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
+        constraints = [
+            # One cell per column and row; further rows are child TableApis.
+            models.UniqueConstraint(
+                fields=['table_api', 'column'], name='unique_cell_per_table_api_column'),
+        ]
         indexes = [
-            models.Index(fields=['table_api', 'column']),
+            models.Index(fields=['created_at'], name='cell_created_at_idx'),
         ]
 
     def __str__(self):
@@ -343,77 +390,27 @@ class Cell(models.Model):
 
     @property
     def computed_value(self):
-        cache_key = f"cell_computed_value_{self.id}"
-        cached_value = cache.get(cache_key)
-        if cached_value is not None:
-            return cached_value
-
-        formula_steps = FormulaStep.objects.filter(
-            column=self.column).order_by('order')
-        if not formula_steps.exists() or self.column.data_type != 'number':
-            return self.value
-
-        try:
-            sibling_cells = self.table_api.api_cells.select_related('column')
-            result = None
-
-            for step in formula_steps:
-                if step.operand and step.operand.column:
-                    ref_cell = sibling_cells.filter(
-                        column=step.operand.column).first()
-                    if not ref_cell:
-                        ref_cell = Cell.objects.create(
-                            table_api=self.table_api,
-                            column=step.operand.column,
-                            value=""
-                        )
-                    operand = float(ref_cell.computed_value or 0)
-                elif step.operand and step.operand.constant is not None:
-                    operand = float(step.operand.constant)
-                elif result is not None:
-                    operand = result
-                else:
-                    operand = 0
-
-                if result is None:
-                    result = operand
-                elif step.operation:
-                    operation_func = step.operation.apply(operand)
-                    if step.operation.name in ['sqrt', 'percent']:
-                        result = operation_func(result)
-                    else:
-                        # For binary operations, get the next operand
-                        next_step = next(
-                            (s for s in formula_steps if s.order > step.order), None)
-                        if next_step and next_step.operand and next_step.operand.column:
-                            next_ref_cell = sibling_cells.filter(
-                                column=next_step.operand.column).first()
-                            if not next_ref_cell:
-                                next_ref_cell = Cell.objects.create(
-                                    table_api=self.table_api,
-                                    column=next_step.operand.column,
-                                    value=""
-                                )
-                            next_operand = float(
-                                next_ref_cell.computed_value or 0)
-                            result = operation_func(result, next_operand)
-                        elif next_step and next_step.operand and next_step.operand.constant is not None:
-                            next_operand = float(next_step.operand.constant)
-                            result = operation_func(result, next_operand)
-                        else:
-                            raise ValueError(
-                                f"No operand for operation {step.operation.name}")
-                # Debug output
-                print(f"Step {step.order}: operand={operand}, result={result}")
-
-            cache.set(cache_key, str(result), timeout=3600)  # Cache for 1 hour
-            return str(result) if result is not None else self.value
-        except Exception as e:
-            return f"Error in formula: {str(e)}"
+        """
+        The formula result for number formula columns, otherwise the stored
+        value. Read-only: a referenced column without a cell in this row
+        counts as empty (0) instead of being created; ``normalize_rows``
+        materializes missing cells explicitly.
+        """
+        return self._computed_value()
+
+    def _computed_value(self, use_cache=True):
+        return computed_values([{
+            'id': self.id,
+            'table_api': self.table_api_id,
+            'column': self.column_id,
+            'value': self.value,
+            'table': self.column.table_id,
+        }], use_cache=use_cache)[self.id]
 
     def save(self, *args, **kwargs):
         if FormulaStep.objects.filter(column=self.column).exists():
-            self.value = self.computed_value
+            # Inputs may have changed since the value was cached.
+            self.value = self._computed_value(use_cache=False)
         super().save(*args, **kwargs)
 
 # File Model
@@ -423,7 +420,9 @@ class File(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     cell = models.ForeignKey(
         Cell, on_delete=models.CASCADE, related_name="files")
-    file = models.FileField(upload_to='uploads/files/')
+    file = models.FileField(upload_to='uploads/files/', storage=blob_storage)
+    # Stored under its content hash; this keeps the name it was uploaded as
+    original_name = models.CharField(max_length=255, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
 # Image Model
@@ -433,59 +432,411 @@ class Image(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     cell = models.ForeignKey(
         Cell, on_delete=models.CASCADE, related_name="images")
-    image = models.ImageField(upload_to='uploads/images/')
+    image = models.ImageField(upload_to='uploads/images/', storage=blob_storage)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # Filled by generate_image_derivatives_task; see rest/images.py
+    content_hash = models.CharField(max_length=64, blank=True, editable=False)
+    thumbnail = models.ImageField(blank=True, editable=False)
+    web_image = models.ImageField(blank=True, editable=False)
+
+# Blob Model
+
+
+class Blob(models.Model):
+    """A stored upload, shared by every File and Image with the same content."""
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField(default=0)
+    refcount = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount})"
+
+# Upload Session Models
+
+
+class UploadSession(models.Model):
+    """A resumable upload, received in chunks and assembled on completion."""
+    KIND_CHOICES = [
+        ('file', 'File'),
+        ('image', 'Image'),
+        ('excel', 'Excel import'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        # Excel imports run on the imports queue once every byte arrived.
+        ('processing', 'Processing'),
+        ('complete', 'Complete'),
+        ('failed', 'Failed'),
+    ]
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             on_delete=models.CASCADE, related_name="upload_sessions")
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField(help_text="Total size of the file in bytes.")
+    checksum = models.CharField(
+        max_length=64, blank=True, default='',
+        help_text="Expected SHA-256 of the whole file (hex), if known.")
+    cell = models.ForeignKey(
+        Cell, on_delete=models.CASCADE, related_name="upload_sessions", null=True, blank=True,
+        help_text="Target cell for file and image uploads.")
+    options = models.JSONField(
+        default=dict, blank=True, help_text="Import options for Excel uploads.")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    result = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.status})"
+
 
-# Celery Task for Dependency Updates
-
-
-@shared_task
-def update_dependent_cells_task(cell_id):
-    try:
-        # Set the thread-local flag to indicate this is a task-driven update
-        thread_local.update_from_task = True
-        try:
-            cell = Cell.objects.get(id=cell_id)
-            print(f"Processing cell {cell_id} with column {cell.column.name}")
-            # Find FormulaStep instances where this column is an operand
-            dependent_steps = FormulaStep.objects.filter(
-                operand__column=cell.column
-                # Exclude the current column to avoid self-reference
-            ).exclude(column=cell.column)
-            print(f"Found dependent steps: {list(dependent_steps)}")
-            # Find columns that have these dependent steps
-            dependent_columns = Column.objects.filter(
-                steps__in=dependent_steps
-            ).distinct()
-            print(f"Found dependent columns: {list(dependent_columns)}")
-
-            # Update the current cell if it has a formula
-            if FormulaStep.objects.filter(column=cell.column).exists():
-                print(
-                    f"Updating current cell {cell.column.name} with computed value {cell.computed_value}")
-                cell.value = cell.computed_value
-                cell.save(update_fields=['value'])
-
-            # Update dependent cells in the same TableApi
-            for dep_column in dependent_columns:
-                dependent_cells = cell.table_api.api_cells.filter(
-                    column=dep_column)
-                for dep_cell in dependent_cells:
-                    print(
-                        f"Updating cell for column {dep_cell.column.name} with value {dep_cell.computed_value}")
-                    dep_cell.value = dep_cell.computed_value
-                    dep_cell.save(update_fields=['value'])
-        finally:
-            # Reset the thread-local flag
-            thread_local.update_from_task = False
-    except Cell.DoesNotExist:
-        print(f"Cell with id {cell_id} not found")
+class UploadChunk(models.Model):
+    session = models.ForeignKey(
+        UploadSession, on_delete=models.CASCADE, related_name="chunks")
+    index = models.PositiveIntegerField()
+    offset = models.BigIntegerField()
+    size = models.PositiveIntegerField()
+    checksum = models.CharField(max_length=64)
+    received_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['session', 'index'], name='unique_chunk_per_session'),
+        ]
+
+# Schema Versions
+
+
+def _schema_version_key(table_id):
+    return f"table_schema_version_{table_id}"
+
+
+def schema_versions(table_ids):
+    """
+    Map each table id to an opaque token that changes whenever the table,
+    its columns, options or formula steps change.
+    """
+    keys = {_schema_version_key(table_id): table_id for table_id in table_ids}
+    found = cache.get_many(keys)
+    versions = {keys[key]: version for key, version in found.items()}
+    for key, table_id in keys.items():
+        if key not in found:
+            # Evicted or never set: start from a fresh token rather than a
+            # counter so an old ETag can never match again.
+            version = uuid.uuid4().hex
+            if not cache.add(key, version, timeout=None):
+                version = cache.get(key, version)
+            versions[table_id] = version
+    return versions
+
+
+def schema_version(table_id):
+    return schema_versions([table_id])[table_id]
+
+
+def bump_schema_version(table_id):
+    key = _schema_version_key(table_id)
+    cache.set(key, uuid.uuid4().hex, timeout=None)
+    # Bump again once the change is visible to other connections, so nothing
+    # built from the old rows in the meantime survives under the new token.
+    transaction.on_commit(
+        lambda: cache.set(key, uuid.uuid4().hex, timeout=None))
+
+# Compiled Formulas
+
+
+def load_formulas(table_id):
+    """
+    Compile the formulas of every number column in a table.
+
+    The compiled formulas are cached under the table's schema version, so
+    they are rebuilt only after its columns or formula steps change.
+    """
+    key = f"table_formulas_{table_id}_{schema_version(table_id)}"
+    formulas = cache.get(key)
+    if formulas is None:
+        steps = FormulaStep.objects.filter(
+            column__table_id=table_id, column__data_type='number'
+        ).select_related('operation', 'operand').order_by('column_id', 'order')
+        formulas = compile_formulas(steps)
+        cache.set(key, formulas, timeout=86400)
+    return formulas
+
+
+def formula_displays(table_ids):
+    """
+    ``{column_id: text}`` describing the formula steps of every formula
+    column in the given tables, as the admin lists them. Cached per table
+    under its schema version, like ``load_formulas``.
+    """
+    keys = {
+        f"table_formula_display_{table_id}_{version}": table_id
+        for table_id, version in schema_versions(set(table_ids)).items()
+    }
+    found = cache.get_many(keys)
+    displays = {}
+    for key, table_id in keys.items():
+        table_displays = found.get(key)
+        if table_displays is None:
+            parts = {}
+            steps = FormulaStep.objects.filter(column__table_id=table_id).select_related(
+                'operation', 'operand__column').order_by('column_id', 'order')
+            for step in steps:
+                operand_str = str(step.operand) if step.operand else "No Operand"
+                op_str = step.operation.symbol if step.operation else ""
+                parts.setdefault(str(step.column_id), []).append(f"{operand_str} {op_str}")
+            table_displays = {column_id: " ".join(texts) for column_id, texts in parts.items()}
+            cache.set(key, table_displays, timeout=86400)
+        displays.update(table_displays)
+    return displays
+
+
+def computed_values(cells, use_cache=True):
+    """
+    Batch counterpart of ``Cell.computed_value``.
+
+    ``cells`` are dicts with ``id``, ``table_api``, ``column``, ``value`` and
+    ``table`` (the TableApi's table id), as produced by ``values()``. Returns
+    ``{cell_id: computed value}``, reading the per-cell cache first (unless
+    ``use_cache`` is false) and loading sibling values for the remaining
+    formula cells in one query. Fresh results are cached either way.
+    """
+    results = {}
+    formulas = {}
+    pending = []
+    for cell in cells:
+        table_id = cell['table']
+        if table_id not in formulas:
+            formulas[table_id] = load_formulas(table_id)
+        if str(cell['column']) in formulas[table_id]:
+            pending.append(cell)
+        else:
+            results[cell['id']] = cell['value']
+    if not pending:
+        return results
+
+    cached = cache.get_many(
+        [f"cell_computed_value_{cell['id']}" for cell in pending]) if use_cache else {}
+    missing = []
+    for cell in pending:
+        key = f"cell_computed_value_{cell['id']}"
+        if key in cached:
+            results[cell['id']] = cached[key]
+        else:
+            missing.append(cell)
+    if not missing:
+        return results
+
+    columns = set()
+    for table_id in {cell['table'] for cell in missing}:
+        columns |= referenced_columns(formulas[table_id])
+    rows = {}
+    siblings = Cell.objects.filter(
+        table_api_id__in={cell['table_api'] for cell in missing},
+        column_id__in=columns,
+    ).order_by('table_api_id', 'id').values_list('table_api_id', 'column_id', 'value')
+    for table_api_id, column_id, value in siblings:
+        # Like computed_value, the first cell of a column wins.
+        rows.setdefault(table_api_id, {}).setdefault(str(column_id), value)
+
+    evaluators = {}
+    fresh = {}
+    for cell in missing:
+        evaluator = evaluators.get(cell['table_api'])
+        if evaluator is None:
+            evaluator = evaluators[cell['table_api']] = RowEvaluator(
+                formulas[cell['table']], rows.get(cell['table_api'], {}))
+        value = evaluator.evaluate(str(cell['column']))
+        results[cell['id']] = value
+        fresh[f"cell_computed_value_{cell['id']}"] = value
+    cache.set_many(fresh, timeout=3600)
+    return results
+
+# Wide Rows
+
+
+def sync_row_data(table_api_ids):
+    """
+    Rebuild ``row_data`` for the given TableApis of tables with
+    ``wide_rows`` enabled; the others are left alone. Like
+    ``computed_value``, the first cell of a column wins.
+    """
+    rows = {
+        table_api_id: {} for table_api_id in TableApi.objects.filter(
+            id__in=table_api_ids, table__wide_rows=True).values_list('id', flat=True)
+    }
+    if not rows:
+        return
+    cells = Cell.objects.filter(table_api_id__in=list(rows)).order_by(
+        'table_api_id', 'id').values_list('table_api_id', 'column_id', 'value')
+    for table_api_id, column_id, value in cells:
+        rows[table_api_id].setdefault(str(column_id), value)
+    TableApi.objects.bulk_update(
+        [TableApi(id=table_api_id, row_data=data) for table_api_id, data in rows.items()],
+        ['row_data'], batch_size=1000)
 
 # Signal to Trigger Dependency Updates
 
 
+class DependentCellsBatch:
+    """
+    The cells saved in one transaction, handed to a single
+    ``update_dependent_cells_task`` when it commits. One cell per (row,
+    column) is enough: the task reads the current values.
+    """
+
+    def __init__(self):
+        self.cells = {}
+
+    def add(self, cell):
+        self.cells[(cell.table_api_id, cell.column_id)] = cell.id
+
+    def flush(self):
+        if getattr(thread_local, 'dependent_cells', None) is self:
+            del thread_local.dependent_cells
+        from .tasks import enqueue_dependent_cells_update
+        enqueue_dependent_cells_update(self.cells)
+
+
+def batch_dependent_cell(cell):
+    connection = transaction.get_connection()
+    batch = getattr(thread_local, 'dependent_cells', None)
+    # A batch whose transaction rolled back lost its callback: start anew.
+    if batch is not None and any(
+            callback == batch.flush for _, callback, _ in connection.run_on_commit):
+        batch.add(cell)
+        return
+    batch = DependentCellsBatch()
+    batch.add(cell)
+    if connection.in_atomic_block:
+        thread_local.dependent_cells = batch
+    transaction.on_commit(batch.flush)
+
+
 @receiver(post_save, sender=Cell)
 def trigger_update_dependent_cells(sender, instance, **kwargs):
-    # Avoid triggering on task updates
-    if not getattr(thread_local, 'update_from_task', False):
-        update_dependent_cells_task.delay(instance.id)
+    batch_dependent_cell(instance)
+
+# Blob Reference Counting
+
+
+BLOB_FIELDS = {File: 'file', Image: 'image'}
+
+
+def acquire_blob(name):
+    if not is_blob(name):
+        return
+    blob, _ = Blob.objects.get_or_create(
+        name=name, defaults={'size': blob_storage().size(name)})
+    Blob.objects.filter(pk=blob.pk).update(
+        refcount=F('refcount') + 1, updated_at=timezone.now())
+
+
+def release_blob(name):
+    if is_blob(name):
+        Blob.objects.filter(name=name).update(
+            refcount=F('refcount') - 1, updated_at=timezone.now())
+
+
+@receiver(pre_save, sender=File)
+@receiver(pre_save, sender=Image)
+def remember_blob(sender, instance, raw=False, **kwargs):
+    field_file = getattr(instance, BLOB_FIELDS[sender])
+    if sender is File and field_file and not field_file._committed:
+        instance.original_name = os.path.basename(field_file.name)
+    instance._previous_blob = None
+    if not instance._state.adding:
+        instance._previous_blob = sender.objects.filter(pk=instance.pk).values_list(
+            BLOB_FIELDS[sender], flat=True).first()
+
+
+@receiver(post_save, sender=File)
+@receiver(post_save, sender=Image)
+def count_blob(sender, instance, raw=False, **kwargs):
+    name = getattr(instance, BLOB_FIELDS[sender]).name
+    previous = instance.__dict__.pop('_previous_blob', None)
+    if name != previous:
+        acquire_blob(name)
+        release_blob(previous)
+
+
+@receiver(post_delete, sender=File)
+@receiver(post_delete, sender=Image)
+def uncount_blob(sender, instance, **kwargs):
+    release_blob(getattr(instance, BLOB_FIELDS[sender]).name)
+
+# Signal to Render Image Derivatives
+
+
+@receiver(post_save, sender=Image)
+def schedule_image_derivatives(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    from .tasks import generate_image_derivatives_task
+    transaction.on_commit(
+        lambda: generate_image_derivatives_task.delay(str(instance.pk)))
+
+# Signal to Keep Wide Rows in Sync
+
+
+def is_wide_table(table_id):
+    """``Table.wide_rows``, cached under the table's schema version."""
+    key = f"table_wide_rows_{table_id}_{schema_version(table_id)}"
+    wide = cache.get(key)
+    if wide is None:
+        wide = Table.objects.filter(pk=table_id, wide_rows=True).exists()
+        cache.set(key, wide, timeout=3600)
+    return wide
+
+
+@receiver(pre_delete, sender=TableApi)
+def mark_deleted_row(sender, instance, **kwargs):
+    # Its cells are deleted first; their row needs no rebuild.
+    thread_local.deleted_rows = getattr(thread_local, 'deleted_rows', set()) | {instance.pk}
+
+
+@receiver(post_delete, sender=TableApi)
+def unmark_deleted_row(sender, instance, **kwargs):
+    getattr(thread_local, 'deleted_rows', set()).discard(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Cell)
+def sync_cell_row_data(sender, instance, **kwargs):
+    if instance.table_api_id in getattr(thread_local, 'deleted_rows', ()):
+        return
+    # Cell.save has loaded the column; the table's flag then comes from the cache.
+    if Cell.column.is_cached(instance) and not is_wide_table(instance.column.table_id):
+        return
+    sync_row_data([instance.table_api_id])
+
+# Signals to Invalidate Schema Snapshots
+
+
+@receiver([post_save, post_delete], sender=Table)
+def bump_table_schema(sender, instance, **kwargs):
+    bump_schema_version(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Column)
+def bump_column_schema(sender, instance, **kwargs):
+    bump_schema_version(instance.table_id)
+
+
+@receiver([post_save, post_delete], sender=Option)
+@receiver([post_save, post_delete], sender=FormulaStep)
+def bump_column_child_schema(sender, instance, **kwargs):
+    table_id = Column.objects.filter(
+        pk=instance.column_id).values_list('table_id', flat=True).first()
+    if table_id:
+        bump_schema_version(table_id)
+
+
+@receiver([post_save, post_delete], sender=FormulaOperand)
+def bump_operand_schema(sender, instance, **kwargs):
+    table_ids = Column.objects.filter(
+        steps__operand=instance).values_list('table_id', flat=True).distinct()
+    for table_id in table_ids:
+        bump_schema_version(table_id)
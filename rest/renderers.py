@@ -0,0 +1,57 @@
+import decimal
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - falls back to the stdlib encoder
+    orjson = None
+
+
+def _decimal_string(value):
+    # Same text DRF's DecimalField produces with COERCE_DECIMAL_TO_STRING.
+    return format(value, 'f')
+
+
+class FastJSONEncoder(encoders.JSONEncoder):
+    """DRF's encoder, except that Decimals render as strings like DecimalField."""
+
+    def default(self, obj):
+        if isinstance(obj, decimal.Decimal):
+            return _decimal_string(obj)
+        return super().default(obj)
+
+
+_fallback_encoder = FastJSONEncoder()
+
+
+def _orjson_default(obj):
+    return _fallback_encoder.default(obj)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSON renderer backed by orjson.
+
+    UUIDs, dates and datetimes are encoded natively (datetimes in UTC use the
+    same trailing ``Z`` as DRF) and Decimals render as strings, so rows
+    straight from ``QuerySet.values()`` come out as a serializer would
+    render them. Indented output, e.g. for the browsable API, and
+    installations without orjson use the stock renderer.
+    """
+    encoder_class = FastJSONEncoder
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        ret = orjson.dumps(data, default=_orjson_default,
+                           option=orjson.OPT_UTC_Z)
+        # Match JSONRenderer, which escapes these for JavaScript embedding.
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+                b'\xe2\x80\xa9', b'\\u2029')
+        return ret
@@ -1,11 +1,9 @@
 # your_project_name/routing.py
 
-from channels.routing import ProtocolTypeRouter, URLRouter
 from django.urls import path
 from .consumers import MyConsumer
 
-application = ProtocolTypeRouter({
-    'websocket': URLRouter([
-        path('ws/some_path/', MyConsumer.as_asgi()),
-    ])
-})
+# HTTP is served by Django itself (see base/asgi.py); only WebSocket routes live here.
+websocket_urlpatterns = [
+    path('ws/some_path/', MyConsumer.as_asgi()),
+]
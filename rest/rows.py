@@ -0,0 +1,52 @@
+"""
+Row-shaped reads of table data.
+
+A row is a TableApi with ``cells`` mapping column id to stored value
+(formula cells store their computed result). Tables with ``wide_rows``
+read the whole row from ``TableApi.row_data``; the others gather it from
+``Cell``. Any query parameter named after one of the table's column ids
+filters rows on that column's value.
+"""
+from django.db.models import Exists, OuterRef
+
+from .models import Cell, TableApi
+
+ROW_FIELDS = ('id', 'job', 'user', 'parent')
+
+
+def row_filters(params, column_ids):
+    """``{column_id: value}`` for the query parameters that name a column."""
+    return {
+        str(column_id): params[str(column_id)]
+        for column_id in column_ids if str(column_id) in params
+    }
+
+
+def row_queryset(table, filters):
+    """``values()`` queryset of the table's rows, ordered by id."""
+    queryset = TableApi.objects.filter(table_id=table.id)
+    for column_id, value in filters.items():
+        if table.wide_rows:
+            queryset = queryset.filter(**{f'row_data__{column_id}': value})
+        else:
+            queryset = queryset.filter(Exists(Cell.objects.filter(
+                table_api=OuterRef('pk'), column_id=column_id, value=value)))
+    fields = ROW_FIELDS + ('row_data',) if table.wide_rows else ROW_FIELDS
+    return queryset.order_by('id').values(*fields)
+
+
+def cells_queryset(table_api_ids):
+    return Cell.objects.filter(table_api_id__in=table_api_ids).order_by(
+        'table_api_id', 'id').values_list('table_api_id', 'column_id', 'value')
+
+
+def build_rows(table, rows):
+    """Add ``cells`` to rows from ``row_queryset``."""
+    if table.wide_rows:
+        for row in rows:
+            row['cells'] = row.pop('row_data')
+        return list(rows)
+    by_id = {row['id']: {**row, 'cells': {}} for row in rows}
+    for table_api_id, column_id, value in cells_queryset(list(by_id)):
+        by_id[table_api_id]['cells'].setdefault(str(column_id), value)
+    return list(by_id.values())
@@ -0,0 +1,191 @@
+"""
+Compact, cached schema snapshots for tables and job table collections.
+
+A snapshot lists a table's columns with their options and formula steps in
+the same shape ``ColumnSerializer`` uses, but is built from ``values()``
+queries: one each for columns, options and steps, however many tables or
+columns are involved. Snapshots are cached under the tables' schema
+versions, which also make up the strong ETag served to clients.
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef, Prefetch
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import Column, FormulaStep, Option, Table, schema_versions
+
+SNAPSHOT_TIMEOUT = 60 * 60 * 24
+
+
+def column_prefetches(prefix='', options=True, steps=True):
+    """
+    Prefetches that let ``ColumnSerializer`` render options and formula steps
+    (with their operands and operations) from cache. ``prefix`` is the lookup
+    path to the columns, e.g. ``'columns__'`` from a Table queryset.
+    """
+    prefetches = []
+    if options:
+        prefetches.append(
+            Prefetch(f'{prefix}options', queryset=Option.objects.order_by('value')))
+    if steps:
+        prefetches.append(Prefetch(f'{prefix}steps', queryset=FormulaStep.objects.select_related(
+            'operation', 'operand').order_by('order')))
+    return prefetches
+
+
+def schema_etag(versions):
+    """Strong ETag for a ``{table_id: version}`` mapping."""
+    digest = hashlib.sha1()
+    for table_id, version in sorted((str(k), v) for k, v in versions.items()):
+        digest.update(f"{table_id}:{version};".encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def _decimal(value):
+    # Matches the string rendering DRF gives DecimalField.
+    return None if value is None else str(value)
+
+
+def schema_querysets(table_ids):
+    """The three ``values()`` querysets a snapshot of ``table_ids`` is built from."""
+    columns = Column.objects.filter(table_id__in=table_ids).order_by(
+        'table_id', 'name', 'id').values('id', 'table_id', 'name', 'data_type', 'formula_text')
+    options = Option.objects.filter(
+        column__table_id__in=table_ids, column__data_type='select').values('id', 'column_id', 'value')
+    steps = FormulaStep.objects.filter(column__table_id__in=table_ids).order_by('order').values(
+        'id', 'column_id', 'operation_id', 'operand_id', 'operand__column_id', 'operand__constant', 'order')
+    return columns, options, steps
+
+
+def assemble_schema(tables, columns, options, steps):
+    """Shape the rows of ``schema_querysets`` into one snapshot per table."""
+    options_by_column = {}
+    for option in options:
+        options_by_column.setdefault(option['column_id'], []).append(
+            {'id': str(option['id']), 'value': option['value']})
+
+    steps_by_column = {}
+    for step in steps:
+        operand = None
+        if step['operand_id'] is not None:
+            operand = {
+                'id': step['operand_id'],
+                'column': str(step['operand__column_id']) if step['operand__column_id'] else None,
+                'constant': _decimal(step['operand__constant']),
+            }
+        steps_by_column.setdefault(step['column_id'], []).append({
+            'id': step['id'],
+            'column': str(step['column_id']),
+            'operation': step['operation_id'],
+            'operand': operand,
+            'order': step['order'],
+        })
+
+    by_table = {table.id: [] for table in tables}
+    for column in columns:
+        by_table[column['table_id']].append({
+            'id': str(column['id']),
+            'name': column['name'],
+            'data_type': column['data_type'],
+            'options': options_by_column.get(column['id'], []) if column['data_type'] == 'select' else None,
+            'formula_text': column['formula_text'],
+            'formula_steps': steps_by_column.get(column['id'], []),
+        })
+    return [
+        {'id': str(table.id), 'name': table.name, 'columns': by_table[table.id]}
+        for table in tables
+    ]
+
+
+def build_schema(tables):
+    """Build snapshots for ``tables`` (Table instances) in a fixed number of queries."""
+    querysets = schema_querysets([table.id for table in tables])
+    return assemble_schema(tables, *(list(qs) for qs in querysets))
+
+
+def table_schema_etag(table_id):
+    return schema_etag(schema_versions([table_id]))
+
+
+def table_schema_key(etag):
+    return f"table_schema_{etag}"
+
+
+def table_schema(table, etag):
+    """Cached snapshot of a single table, keyed by its ETag."""
+    key = table_schema_key(etag)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = build_schema([table])[0]
+        cache.set(key, snapshot, SNAPSHOT_TIMEOUT)
+    return snapshot
+
+
+def collection_schema_etag(collection, tables):
+    versions = schema_versions([table.id for table in tables])
+    return schema_etag({'collection': collection.name, **versions})
+
+
+def collection_schema(collection, tables, etag):
+    """Cached snapshot of every table in a JobTableCollection."""
+    key = f"collection_schema_{collection.id}_{etag}"
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = {
+            'id': str(collection.id),
+            'name': collection.name,
+            'tables': build_schema(tables),
+        }
+        cache.set(key, snapshot, SNAPSHOT_TIMEOUT)
+    return snapshot
+
+
+def column_catalogue(table_id, etag=None):
+    """
+    Cached list of a table's columns for editors: id, name, data type and
+    whether the column is a formula. Keyed by the table's schema ETag.
+    """
+    etag = etag or table_schema_etag(table_id)
+    key = f"column_catalogue_{etag}"
+    catalogue = cache.get(key)
+    if catalogue is None:
+        columns = Column.objects.filter(table_id=table_id).annotate(
+            has_steps=Exists(FormulaStep.objects.filter(column=OuterRef('pk')))
+        ).order_by('name', 'id').values('id', 'name', 'data_type', 'formula_text', 'has_steps')
+        catalogue = {
+            'table_id': str(table_id),
+            'columns': [
+                {
+                    'id': str(column['id']),
+                    'name': column['name'],
+                    'data_type': column['data_type'],
+                    'is_formula': bool(column['formula_text']) or column['has_steps'],
+                }
+                for column in columns
+            ],
+        }
+        cache.set(key, catalogue, SNAPSHOT_TIMEOUT)
+    return catalogue
+
+
+def not_modified(request, etag):
+    """True when the request's If-None-Match already names ``etag``."""
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return '*' in etags or etag in etags
+
+
+def conditional_response(request, etag, get_data):
+    """
+    Serve ``get_data()`` with ``etag``, or a bodiless 304 when the client
+    already holds that version.
+    """
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+    if not_modified(request, etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(get_data(), headers=headers)
@@ -1,16 +1,24 @@
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth.hashers import make_password
 from .models import (
     File, FormulaOperand, Image, JobTableCollection, TableCategory, User, Company, Project, Job,
-    Table, Column, Option, TableApi, Cell, Operation, FormulaStep
+    Table, Column, Option, TableApi, Cell, Operation, FormulaStep, UploadChunk, UploadSession
 )
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import (
+    TokenBlacklistSerializer, TokenObtainPairSerializer, TokenRefreshSerializer
+)
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from .authentication import RefreshToken, add_user_claims, load_user
+from .fieldsets import SparseFieldsMixin
+from .services import add_child_rows, bulk_create_cells, group_rows
 from django.core.exceptions import ValidationError
 import logging
 # ----- OPERATION SERIALIZER -----
 
 
-class OperationSerializer(serializers.ModelSerializer):
+class OperationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Operation
         fields = ['id', 'name', 'symbol']
@@ -24,7 +32,7 @@ class FormulaOperandSerializer(serializers.ModelSerializer):
         fields = ['id', 'column', 'constant']
 
 
-class FormulaStepSerializer(serializers.ModelSerializer):
+class FormulaStepSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     column = serializers.PrimaryKeyRelatedField(
         queryset=Column.objects.all(), required=False
     )
@@ -74,7 +82,7 @@ class FormulaStepSerializer(serializers.ModelSerializer):
 # ----- USER SERIALIZER -----
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'phone', 'password']
@@ -93,13 +101,50 @@ class UserSerializer(serializers.ModelSerializer):
                 validated_data.get('password'))
         return super().update(instance, validated_data)
 
+# ----- TOKEN SERIALIZERS -----
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Issues tokens carrying the claims ``ClaimsJWTAuthentication`` reads."""
+    token_class = RefreshToken
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refreshes with up-to-date user claims and blacklists the rotated
+    refresh token in the cache.
+    """
+    token_class = RefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        user = load_user(refresh.payload.get(jwt_settings.USER_ID_CLAIM))
+        if user is None or not jwt_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(
+                self.error_messages['no_active_account'], 'no_active_account')
+        add_user_claims(refresh, user)
+        data = {'access': str(refresh.access_token)}
+        if jwt_settings.ROTATE_REFRESH_TOKENS:
+            if jwt_settings.BLACKLIST_AFTER_ROTATION:
+                refresh.blacklist()
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+        return data
+
+
+class ClaimsTokenBlacklistSerializer(TokenBlacklistSerializer):
+    token_class = RefreshToken
+
 # ----- COMPANY SERIALIZER -----
 
 
-class CompanySerializer(serializers.ModelSerializer):
+class CompanySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Company
-        fields = "__all__"
+        # Memberships are managed in the admin.
+        exclude = ['members']
 
 # ----- OPTION SERIALIZER -----
 
@@ -112,17 +157,19 @@ class OptionSerializer(serializers.ModelSerializer):
 # ----- COLUMN SERIALIZER -----
 
 
-class ColumnSerializer(serializers.ModelSerializer):
+class ColumnSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     # Only include options if the column is of type 'select'
     options = serializers.SerializerMethodField()
     # Include formula steps for columns with formulas
-    formula_steps = FormulaStepSerializer(many=True, read_only=True)
+    formula_steps = FormulaStepSerializer(
+        source='steps', many=True, read_only=True)
 
     class Meta:
         model = Column
         fields = ['id', 'name', 'data_type', 'options', 'formula_steps']
 
     def get_options(self, obj):
+        # Served from the prefetch cache when the queryset uses column_prefetches()
         if obj.data_type == 'select':
             options = obj.options.all()
             return OptionSerializer(options, many=True).data
@@ -131,7 +178,7 @@ class ColumnSerializer(serializers.ModelSerializer):
 # ----- TABLE SERIALIZER -----
 
 
-class TableSerializer(serializers.ModelSerializer):
+class TableSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     # Use the nested ColumnSerializer to show related columns
     columns = ColumnSerializer(many=True, read_only=True)
 
@@ -142,7 +189,7 @@ class TableSerializer(serializers.ModelSerializer):
 # ----- FILE SERIALIZER -----
 
 
-class FileUploadSerializer(serializers.ModelSerializer):
+class FileUploadSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = File
         fields = ['cell', 'file']
@@ -151,12 +198,13 @@ class FileUploadSerializer(serializers.ModelSerializer):
 class FileSerializer(serializers.ModelSerializer):
     class Meta:
         model = File
-        fields = ['id', 'cell', 'file', 'uploaded_at']
+        fields = ['id', 'cell', 'file', 'original_name', 'uploaded_at']
+        read_only_fields = ['original_name']
 
 # ----- IMAGE SERIALIZER -----
 
 
-class ImageUploadSerializer(serializers.ModelSerializer):
+class ImageUploadSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Image
         fields = ['cell', 'image']
@@ -165,12 +213,12 @@ class ImageUploadSerializer(serializers.ModelSerializer):
 class ImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Image
-        fields = ['id', 'cell', 'image', 'uploaded_at']
+        fields = ['id', 'cell', 'image', 'thumbnail', 'web_image', 'uploaded_at']
 
 # ----- CELL SERIALIZER -----
 
 
-class CellSerializer(serializers.ModelSerializer):
+class CellSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     files = FileSerializer(many=True, read_only=True)
     images = ImageSerializer(many=True, read_only=True)
     # Add computed_value to expose the formula result
@@ -184,7 +232,7 @@ class CellSerializer(serializers.ModelSerializer):
 # ----- TABLE API SERIALIZER -----
 
 
-class TableApiSerializer(serializers.ModelSerializer):
+class TableApiSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     api_cells = CellSerializer(many=True)
     children = serializers.SerializerMethodField()
 
@@ -201,42 +249,38 @@ class TableApiSerializer(serializers.ModelSerializer):
         if not cells_data:
             return cells_data
 
-        # Group cells by implied row (assuming order defines rows)
         table = self.initial_data.get('table')
         if not table:
             raise serializers.ValidationError(
                 "Table is required to validate columns.")
         table_obj = Table.objects.get(id=table)
-        column_names = table_obj.columns.values_list('name', flat=True)
+        column_names = set(table_obj.columns.values_list('name', flat=True))
 
-        row_cells = []
-        current_row = []
         for cell_data in cells_data:
-            column_id = cell_data.get('column')
-            column = Column.objects.get(id=column_id)
+            column = cell_data.get('column')
             if column.name not in column_names:
                 raise serializers.ValidationError(
                     f"Column {column.name} not in table.")
-            current_row.append(cell_data)
-            # Assume a new row starts when all columns are covered
-            if len(current_row) == table_obj.columns.count():
-                row_cells.append(current_row)
-                current_row = []
-        if current_row:
-            row_cells.append(current_row)
 
-        return cells_data  # Return original data after validation
+        return cells_data
 
     def create(self, validated_data):
         api_cells_data = validated_data.pop('api_cells', [])
         table_api = TableApi.objects.create(**validated_data)
-        cell_instances = [Cell(table_api=table_api, **cell_data)
-                          for cell_data in api_cells_data]
-        Cell.objects.bulk_create(cell_instances)
+        # The first row stays on this TableApi, further rows become children
+        rows = group_rows(api_cells_data)
+        row_apis = [table_api] + add_child_rows(table_api, max(len(rows) - 1, 0))
+        cell_instances = [Cell(table_api=row_api, **cell_data)
+                          for row_api, row in zip(row_apis, rows)
+                          for cell_data in row]
+        bulk_create_cells(cell_instances)
         return table_api
 
     def update(self, instance, validated_data):
         api_cells_data = validated_data.pop('api_cells', [])
+        if len(group_rows(api_cells_data)) > 1:
+            raise serializers.ValidationError({
+                'api_cells': "Each column can only have one cell; update child rows separately."})
         instance.table = validated_data.get('table', instance.table)
         instance.user = validated_data.get('user', instance.user)
         instance.save()
@@ -248,16 +292,18 @@ class TableApiSerializer(serializers.ModelSerializer):
         to_delete_ids = existing_ids - incoming_ids
         Cell.objects.filter(id__in=to_delete_ids).delete()
 
-        # Update or create cells
+        # Update existing cells, create the new ones in one batch
+        existing = instance.api_cells.in_bulk(incoming_ids)
+        new_cells = []
         for cell_data in api_cells_data:
-            cell_id = cell_data.get('id')
-            if cell_id and Cell.objects.filter(id=cell_id, table_api=instance).exists():
-                cell = Cell.objects.get(id=cell_id, table_api=instance)
+            cell = existing.get(cell_data.get('id'))
+            if cell is not None:
                 for key, value in cell_data.items():
                     setattr(cell, key, value)
                 cell.save()
             else:
-                Cell.objects.create(table_api=instance, **cell_data)
+                new_cells.append(Cell(table_api=instance, **cell_data))
+        bulk_create_cells(new_cells)
         return instance
 
 # ----- PROJECT SERIALIZER -----
@@ -273,7 +319,7 @@ class TableCategorySerializerForJob(serializers.ModelSerializer):
         ]
 
 
-class TableCategorySerializer(serializers.ModelSerializer):
+class TableCategorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     tables = TableSerializer(many=True, read_only=True)
 
     class Meta:
@@ -300,7 +346,7 @@ class JobTableCollectionSerializer(serializers.ModelSerializer):
 # ----- JOB SERIALIZER -----
 
 
-class JobSerializer(serializers.ModelSerializer):
+class JobSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     # Read-only nested representation for related companies
     advisorCompanies = CompanySerializer(many=True, read_only=True)
     contractorCompanies = CompanySerializer(many=True, read_only=True)
@@ -330,6 +376,9 @@ class JobSerializer(serializers.ModelSerializer):
         ]
 
     def get_progress(self, obj):
+        # Annotated by JobViewSet/ProjectViewSet; fall back for bare instances
+        if hasattr(obj, 'table_api_count'):
+            return obj.table_api_count
         return obj.table_apis.count()
 
     def create(self, validated_data):
@@ -351,10 +400,27 @@ class JobSerializer(serializers.ModelSerializer):
             instance.contractorCompanies.set(contractor_companies)
         return instance
 
+
+
+class JobCompactSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """Flat job representation for listings (``?view=compact``)."""
+    progress = serializers.IntegerField(
+        source='table_api_count', read_only=True)
+
+    class Meta:
+        model = Job
+        fields = [
+            'id', 'name', 'created_at', 'progress',
+            'advisorCompanies', 'contractorCompanies',
+            'description', 'due_date', 'priority', 'status',
+            'job_table_collection'
+        ]
+        read_only_fields = fields
+
 # ----- PROJECT SERIALIZER -----
 
 
-class ProjectSerializer(serializers.ModelSerializer):
+class ProjectSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     # Nested representation of the Company; for writes, use company_id
     company = CompanySerializer(read_only=True)
     company_id = serializers.PrimaryKeyRelatedField(
@@ -367,20 +433,35 @@ class ProjectSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'created_at', 'company', 'company_id',
                   'description', 'start_date', 'end_date', 'status', 'budget', 'jobs']
 
+
+class ProjectCompactSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """Flat project representation for listings (``?view=compact``)."""
+    job_count = serializers.IntegerField(read_only=True)
+    table_api_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Project
+        fields = ['id', 'name', 'created_at', 'company', 'description',
+                  'start_date', 'end_date', 'status', 'budget',
+                  'job_count', 'table_api_count']
+        read_only_fields = fields
+
 #  ------------ excel upload ------------
 
 
 logger = logging.getLogger(__name__)
 
 
-class FileUploadSerializer(serializers.Serializer):
-    file = serializers.FileField()
-    table_id = serializers.UUIDField(required=True)
-    column_ids = serializers.JSONField(required=True)
+class ExcelImportOptionsSerializer(serializers.Serializer):
+    # Either one table for the first sheet ...
+    table_id = serializers.UUIDField(required=False)
+    column_ids = serializers.JSONField(required=False)
+    # ... or a list of {"sheet": name or index, "table_id", "column_ids"}
+    sheets = serializers.JSONField(required=False)
     job_id = serializers.UUIDField(required=False)
     strict_numeric = serializers.BooleanField(default=True)
 
-    def validate_column_ids(self, value):
+    def _clean_column_ids(self, value):
         logger.debug(f"Raw column_ids: {value}")
         if not isinstance(value, list) or not value:
             raise serializers.ValidationError(
@@ -394,15 +475,93 @@ class FileUploadSerializer(serializers.Serializer):
             logger.error(f"Invalid UUID in column_ids: {value}")
             raise serializers.ValidationError(f"Invalid UUID: {str(e)}")
 
+    def validate_column_ids(self, value):
+        return self._clean_column_ids(value)
+
+    def validate_sheets(self, value):
+        if not isinstance(value, list) or not value:
+            raise serializers.ValidationError(
+                "sheets must be a non-empty list of objects")
+        sheets = []
+        for index, mapping in enumerate(value):
+            if not isinstance(mapping, dict) or 'table_id' not in mapping:
+                raise serializers.ValidationError(
+                    "Each sheet needs a table_id and column_ids")
+            sheet = mapping.get('sheet', index)
+            if not isinstance(sheet, (int, str)):
+                raise serializers.ValidationError(
+                    "sheet must be a sheet name or index")
+            sheets.append({
+                'sheet': sheet,
+                'table_id': serializers.UUIDField().to_internal_value(mapping['table_id']),
+                'column_ids': self._clean_column_ids(mapping.get('column_ids')),
+            })
+        return sheets
+
+    def validate(self, data):
+        sheets = data.get('sheets')
+        if sheets is None:
+            if data.get('table_id') is None or data.get('column_ids') is None:
+                raise ValidationError(
+                    "Provide table_id and column_ids, or sheets")
+            sheets = [{'sheet': 0, 'table_id': data['table_id'],
+                       'column_ids': data['column_ids']}]
+        for mapping in sheets:
+            table_id = mapping['table_id']
+            column_ids = mapping['column_ids']
+            table = Table.objects.filter(id=table_id).first()
+            if table is None:
+                raise ValidationError(f"Table with id {table_id} does not exist")
+            columns = list(Column.objects.filter(id__in=column_ids, table_id=table_id))
+            if len(columns) != len(set(column_ids)):
+                invalid_ids = set(column_ids) - {column.id for column in columns}
+                raise ValidationError(
+                    f"Invalid column_ids: {invalid_ids} do not belong to table {table_id}")
+            mapping['table'] = table
+            mapping['columns'] = columns
+        data['sheets'] = sheets
+        return data
+
+
+class ExcelUploadSerializer(ExcelImportOptionsSerializer):
+    file = serializers.FileField()
+
+# ----- UPLOAD SESSION SERIALIZER -----
+
+
+class UploadChunkSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadChunk
+        fields = ['index', 'offset', 'size', 'checksum', 'received_at']
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    chunks = UploadChunkSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'kind', 'filename', 'size', 'checksum', 'cell', 'options',
+                  'status', 'result', 'chunks', 'created_at']
+        read_only_fields = ['status', 'result', 'created_at']
+
+    def validate_size(self, value):
+        if value <= 0 or value > settings.UPLOAD_SESSION_MAX_SIZE:
+            raise serializers.ValidationError(
+                f"size must be between 1 and {settings.UPLOAD_SESSION_MAX_SIZE} bytes")
+        return value
+
+    def validate_checksum(self, value):
+        value = value.lower()
+        if value and (len(value) != 64 or any(c not in '0123456789abcdef' for c in value)):
+            raise serializers.ValidationError("checksum must be a SHA-256 hex digest")
+        return value
+
     def validate(self, data):
-        table_id = data.get('table_id')
-        column_ids = data.get('column_ids')
-        if not Table.objects.filter(id=table_id).exists():
-            raise ValidationError(f"Table with id {table_id} does not exist")
-        columns = Column.objects.filter(id__in=column_ids, table_id=table_id)
-        if columns.count() != len(column_ids):
-            invalid_ids = set(column_ids) - \
-                set(columns.values_list('id', flat=True))
-            raise ValidationError(
-                f"Invalid column_ids: {invalid_ids} do not belong to table {table_id}")
+        if data['kind'] in ('file', 'image') and data.get('cell') is None:
+            raise serializers.ValidationError(
+                {'cell': "A target cell is required for file and image uploads."})
+        if data['kind'] == 'excel':
+            options = ExcelImportOptionsSerializer(data=data.get('options') or {})
+            if not options.is_valid():
+                raise serializers.ValidationError({'options': options.errors})
         return data
@@ -0,0 +1,209 @@
+"""
+Write paths that touch many cells at once.
+
+``Cell.save`` computes a formula cell's value from its siblings and its
+``post_save`` signal queues one dependency update per cell. That is fine
+for a single edit but turns an import of N cells into N saves and N tasks.
+The functions here produce the same stored values with a handful of
+queries and schedule a single recalculation for the whole batch.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .formula import evaluate_rows, referenced_columns
+from .ingest import insert_cells
+from .models import Cell, Column, TableApi, load_formulas, sync_row_data
+from .tasks import BULK_QUEUE, INTERACTIVE_QUEUE, enqueue_rows_recalculation
+
+
+def group_rows(cells_data):
+    """
+    Split a flat list of cell dicts into rows. A TableApi holds one cell per
+    column, so a column seen again starts the next row.
+    """
+    rows = []
+    seen = None
+    for cell_data in cells_data:
+        column = cell_data['column']
+        if seen is None or column in seen:
+            rows.append([])
+            seen = set()
+        seen.add(column)
+        rows[-1].append(cell_data)
+    return rows
+
+
+def add_child_rows(table_api, count):
+    """Create ``count`` child TableApis of ``table_api`` for further rows."""
+    children = [
+        TableApi(table_id=table_api.table_id, job_id=table_api.job_id,
+                 user_id=table_api.user_id, parent=table_api)
+        for _ in range(count)
+    ]
+    return TableApi.objects.bulk_create(children)
+
+
+def bulk_create_cells(cells, batch_size=1000, queue=INTERACTIVE_QUEUE):
+    """
+    Insert unsaved ``Cell`` instances with ``insert_cells`` (COPY on
+    PostgreSQL for large batches, ``bulk_create`` otherwise).
+
+    Formula cells get the value ``Cell.save`` would have stored, computed
+    per TableApi from the existing cells and the new ones together (the
+    first cell of a column wins, as in ``computed_value``), and their
+    computed value is cached. ``post_save`` does not fire; instead wide
+    rows are synced for the whole batch and, when a TableApi already held
+    formula cells that may depend on the new values, one
+    ``recalculate_rows_task`` is queued on ``queue`` for all of them after
+    commit. Returns the created cells.
+    """
+    cells = list(cells)
+    if not cells:
+        return cells
+
+    table_ids = dict(TableApi.objects.filter(
+        id__in={cell.table_api_id for cell in cells}).values_list('id', 'table_id'))
+    formulas = {
+        table_id: load_formulas(table_id) for table_id in set(table_ids.values())}
+
+    # New formula cells, grouped by TableApi.
+    targets = {}
+    for cell in cells:
+        if str(cell.column_id) in formulas[table_ids[cell.table_api_id]]:
+            targets.setdefault(cell.table_api_id, []).append(cell)
+
+    stale = set()
+    table_api_ids = {
+        cell.table_api_id for cell in cells
+        if formulas[table_ids[cell.table_api_id]]}
+    if table_api_ids:
+        columns = set()
+        for table_id, table_formulas in formulas.items():
+            columns |= referenced_columns(table_formulas) | set(table_formulas)
+        existing = Cell.objects.filter(
+            table_api_id__in=table_api_ids, column_id__in=columns,
+        ).values_list('id', 'table_api_id', 'column_id', 'value')
+        values = []
+        for cell_id, table_api_id, column_id, value in existing:
+            if str(column_id) in formulas[table_ids[table_api_id]]:
+                stale.add(table_api_id)
+            values.append((table_api_id, cell_id, str(column_id), value))
+        values.extend(
+            (cell.table_api_id, cell.id, str(cell.column_id), cell.value)
+            for cell in cells if cell.table_api_id in targets)
+        values.sort()
+        inputs = {}
+        for table_api_id, _, column_id, value in values:
+            inputs.setdefault(table_api_id, {}).setdefault(column_id, value)
+
+        for table_id, table_formulas in formulas.items():
+            row_ids = [
+                table_api_id for table_api_id in targets
+                if table_ids[table_api_id] == table_id]
+            if not row_ids:
+                continue
+            input_columns = sorted(
+                referenced_columns(table_formulas) - set(table_formulas))
+            rows = [
+                tuple(inputs[row_id].get(c, '') for c in input_columns)
+                for row_id in row_ids
+            ]
+            results = evaluate_rows(
+                table_formulas, input_columns, rows,
+                pool_size=settings.FORMULA_POOL_SIZE,
+                min_rows=settings.FORMULA_POOL_MIN_ROWS,
+            )
+            output_index = {
+                column_id: i for i, column_id in enumerate(table_formulas)}
+            for row_id, row_results in zip(row_ids, results):
+                for cell in targets[row_id]:
+                    cell.value = row_results[output_index[str(cell.column_id)]]
+
+    insert_cells(cells, batch_size=batch_size)
+    sync_row_data({cell.table_api_id for cell in cells})
+    cache.set_many(
+        {f"cell_computed_value_{cell.id}": cell.value
+         for row in targets.values() for cell in row},
+        timeout=3600)
+    if stale:
+        ids = [str(table_api_id) for table_api_id in stale]
+        transaction.on_commit(lambda: enqueue_rows_recalculation(ids, queue))
+    return cells
+
+
+def bulk_update_cells(cells, batch_size=1000, queue=INTERACTIVE_QUEUE):
+    """
+    Store the ``value`` of existing ``Cell`` instances with ``bulk_update``.
+
+    As with ``bulk_create_cells`` no signal fires: wide rows are synced for
+    the batch, the cached computed values of formula cells in the touched
+    TableApis are dropped and one ``recalculate_rows_task`` is queued on
+    ``queue`` for them after commit. Returns the cells.
+    """
+    cells = list(cells)
+    if not cells:
+        return cells
+    Cell.objects.bulk_update(cells, ['value'], batch_size=batch_size)
+    table_api_ids = {cell.table_api_id for cell in cells}
+    sync_row_data(table_api_ids)
+
+    table_ids = dict(TableApi.objects.filter(
+        id__in=table_api_ids).values_list('id', 'table_id'))
+    formulas = {
+        table_id: load_formulas(table_id) for table_id in set(table_ids.values())}
+    stale = [
+        table_api_id for table_api_id, table_id in table_ids.items() if formulas[table_id]]
+    if stale:
+        formula_columns = set().union(*(set(f) for f in formulas.values()))
+        formula_cells = Cell.objects.filter(
+            table_api_id__in=stale, column_id__in=formula_columns).values_list('id', flat=True)
+        cache.delete_many([f"cell_computed_value_{cell_id}" for cell_id in formula_cells])
+        ids = [str(table_api_id) for table_api_id in stale]
+        transaction.on_commit(lambda: enqueue_rows_recalculation(ids, queue))
+    return cells
+
+
+def normalize_rows(table_id, table_api_ids=None, batch_size=1000):
+    """
+    Give every TableApi of a table one cell per column of the table.
+
+    Reads never create the cells a formula references; this does, in
+    batches of ``batch_size`` TableApis, creating the missing cells empty
+    through ``bulk_create_cells`` so formula cells get their values.
+    Returns the number of cells created.
+    """
+    column_ids = list(Column.objects.filter(
+        table_id=table_id).order_by('id').values_list('id', flat=True))
+    table_apis = TableApi.objects.filter(table_id=table_id)
+    if table_api_ids is not None:
+        table_apis = table_apis.filter(id__in=table_api_ids)
+    ids = list(table_apis.order_by('id').values_list('id', flat=True))
+
+    created = 0
+    for start in range(0, len(ids), batch_size):
+        chunk = ids[start:start + batch_size]
+        present = set(Cell.objects.filter(table_api_id__in=chunk).values_list(
+            'table_api_id', 'column_id'))
+        missing = [
+            Cell(table_api_id=table_api_id, column_id=column_id)
+            for table_api_id in chunk
+            for column_id in column_ids
+            if (table_api_id, column_id) not in present
+        ]
+        with transaction.atomic():
+            bulk_create_cells(missing, batch_size=batch_size, queue=BULK_QUEUE)
+        created += len(missing)
+    return created
+
+
+def rebuild_row_data(table_id, batch_size=1000):
+    """
+    Rebuild ``row_data`` for every TableApi of a wide-rows table, e.g. after
+    enabling ``wide_rows``. Returns the number of TableApis processed.
+    """
+    ids = list(TableApi.objects.filter(
+        table_id=table_id, table__wide_rows=True).order_by('id').values_list('id', flat=True))
+    for start in range(0, len(ids), batch_size):
+        sync_row_data(ids[start:start + batch_size])
+    return len(ids)
@@ -0,0 +1,69 @@
+"""
+Content-addressed storage for cell files and images.
+
+``ContentAddressedStorage`` hashes an upload with SHA-256 while streaming it
+to a temporary file next to the blobs, then moves it to
+``<BLOB_PREFIX>/<aa>/<sha256><ext>``. When that blob already exists the
+temporary copy is dropped, so identical uploads occupy the disk once and
+``upload_to`` only contributes the extension.
+
+``Blob`` rows count how many File and Image rows point at each blob; the
+signals in ``rest.models`` keep the counts current and the
+``clean_blobs`` command deletes blobs nobody references any more.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage, storages
+from django.core.files.utils import validate_file_name
+
+BLOB_PREFIX = 'uploads/blobs'
+
+
+def blob_storage():
+    """Storage of File.file and Image.image, configured as STORAGES['blobs']."""
+    return storages['blobs']
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(BLOB_PREFIX + '/')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def blob_name(self, digest, name):
+        extension = os.path.splitext(name)[1].lower()
+        return f"{BLOB_PREFIX}/{digest[:2]}/{digest}{extension}"
+
+    def _save(self, name, content):
+        directory = self.path(BLOB_PREFIX)
+        os.makedirs(directory, exist_ok=True)
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.upload')
+        try:
+            with os.fdopen(fd, 'wb') as temp:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temp.write(chunk)
+            final = self.blob_name(digest.hexdigest(), name)
+            validate_file_name(final, allow_relative_path=True)
+            final_path = self.path(final)
+            if os.path.exists(final_path):
+                # Mark the blob as used so clean_blobs' grace period applies.
+                os.utime(final_path)
+            else:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(temp_path, self.file_permissions_mode)
+                os.replace(temp_path, final_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return final
+
+    def get_available_name(self, name, max_length=None):
+        # Blob names are derived from content in _save; collisions are
+        # identical files, never a reason to rename.
+        return name
@@ -0,0 +1,272 @@
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.db import OperationalError
+import logging
+import time
+
+from .formula import evaluate_rows, referenced_columns
+from .images import generate_derivatives
+from .models import Cell, Image, TableApi, load_formulas, sync_row_data
+
+logger = logging.getLogger(__name__)
+
+
+def recompute_rows(table_id, table_api_ids=None):
+    """
+    Recompute the formula cells of a table, or of some of its TableApis.
+
+    Cell values are read with one streamed query into plain tuples (one per
+    TableApi), evaluated in a process pool sized by ``FORMULA_POOL_SIZE`` and
+    written back with ``bulk_update``, so no per-cell save or signal runs.
+    Returns the number of cells whose value changed.
+    """
+    started = time.perf_counter()
+    formulas = load_formulas(table_id)
+    if not formulas:
+        return 0
+    input_columns = sorted(referenced_columns(formulas) - set(formulas))
+
+    inputs = {}   # table_api_id -> {column_id: value}
+    targets = {}  # table_api_id -> [(column_id, cell_id, current value)]
+    cells = Cell.objects.filter(
+        table_api__table_id=table_id,
+        column_id__in=[*input_columns, *formulas],
+    )
+    if table_api_ids is not None:
+        cells = cells.filter(table_api_id__in=table_api_ids)
+    cells = cells.order_by('table_api_id', 'id').values_list(
+        'id', 'table_api_id', 'column_id', 'value')
+    for cell_id, table_api_id, column_id, value in cells.iterator(chunk_size=5000):
+        column_id = str(column_id)
+        if column_id in formulas:
+            targets.setdefault(table_api_id, []).append(
+                (column_id, cell_id, value))
+        else:
+            # Like computed_value, the first cell of a column wins.
+            inputs.setdefault(table_api_id, {}).setdefault(column_id, value)
+
+    row_ids = list(targets)
+    rows = [
+        tuple(inputs.get(row_id, {}).get(c, '') for c in input_columns)
+        for row_id in row_ids
+    ]
+    results = evaluate_rows(
+        formulas, input_columns, rows,
+        pool_size=settings.FORMULA_POOL_SIZE,
+        min_rows=settings.FORMULA_POOL_MIN_ROWS,
+    )
+
+    output_index = {column_id: i for i, column_id in enumerate(formulas)}
+    updates = []
+    changed_rows = set()
+    for row_id, row_results in zip(row_ids, results):
+        for column_id, cell_id, current in targets[row_id]:
+            value = row_results[output_index[column_id]]
+            if value != current:
+                updates.append(Cell(id=cell_id, value=value))
+                changed_rows.add(row_id)
+    Cell.objects.bulk_update(updates, ['value'], batch_size=1000)
+    sync_row_data(changed_rows)
+    cache.set_many(
+        {f"cell_computed_value_{cell.id}": cell.value for cell in updates},
+        timeout=3600)
+    logger.info("Recomputed %s rows of table %s, %s cells changed in %.1f ms",
+                len(rows), table_id, len(updates), (time.perf_counter() - started) * 1000)
+    return len(updates)
+
+
+# Celery Tasks for Formula Recomputation
+#
+# Recalculation runs on its own queues (see CELERY_TASK_ROUTES): edits made
+# through the API or admin go to INTERACTIVE_QUEUE, table-wide recomputes to
+# BULK_QUEUE and the follow-up of Excel imports to IMPORT_QUEUE, so a large
+# import never delays the dependent values of an interactive edit.
+
+INTERACTIVE_QUEUE = 'recalc'
+BULK_QUEUE = 'bulk'
+IMPORT_QUEUE = 'imports'
+
+
+def _rows_pending_key(queue, table_api_id):
+    return f"recalc_rows_pending_{queue}_{table_api_id}"
+
+
+def _dependent_pending_key(table_api_id, column_id):
+    return f"dependent_cells_pending_{table_api_id}_{column_id}"
+
+
+def _table_pending_key(table_id):
+    return f"recompute_table_pending_{table_id}"
+
+
+def claim_table_slot(table_id):
+    """
+    Whether a non-interactive recompute of ``table_id`` may run now: at most
+    one starts per table every ``RECALC_TABLE_INTERVAL`` seconds.
+    """
+    return cache.add(f"recalc_table_slot_{table_id}", True, settings.RECALC_TABLE_INTERVAL)
+
+
+def enqueue_rows_recalculation(table_api_ids, queue=INTERACTIVE_QUEUE):
+    """
+    Queue ``recalculate_rows_task`` on ``queue`` for the TableApis that are
+    not already waiting there. Call it after commit.
+    """
+    keys = {_rows_pending_key(queue, table_api_id): str(table_api_id)
+            for table_api_id in table_api_ids}
+    waiting = cache.get_many(list(keys))
+    ids = [table_api_id for key, table_api_id in keys.items() if key not in waiting]
+    if not ids:
+        return
+    pending = [_rows_pending_key(queue, table_api_id) for table_api_id in ids]
+    cache.set_many(dict.fromkeys(pending, True), settings.RECALC_PENDING_TIMEOUT)
+    try:
+        recalculate_rows_task.apply_async((ids, queue), queue=queue)
+    except Exception:
+        # Nothing was queued: let the next edit enqueue these rows again.
+        cache.delete_many(pending)
+        raise
+
+
+def enqueue_dependent_cells_update(cells):
+    """
+    Queue one ``update_dependent_cells_task`` for ``cells``, a mapping of
+    ``(table_api_id, column_id)`` to cell id, skipping those already waiting.
+    """
+    pending = {}
+    for (table_api_id, column_id), cell_id in cells.items():
+        key = _dependent_pending_key(table_api_id, column_id)
+        if cache.add(key, True, settings.RECALC_PENDING_TIMEOUT):
+            pending[key] = str(cell_id)
+    if not pending:
+        return
+    try:
+        update_dependent_cells_task.delay(list(pending.values()))
+    except Exception:
+        cache.delete_many(list(pending))
+        raise
+
+
+def enqueue_table_recompute(table_id, countdown=0):
+    """Queue ``recompute_table_task`` unless the table is already waiting for one."""
+    key = _table_pending_key(table_id)
+    if not cache.add(key, True, settings.RECALC_PENDING_TIMEOUT + countdown):
+        return
+    try:
+        recompute_table_task.apply_async((str(table_id),), countdown=countdown)
+    except Exception:
+        cache.delete(key)
+        raise
+
+
+# Recomputing reads the current values and writes only what changed, so a
+# redelivered or duplicate task is harmless: they are acknowledged after
+# they run and requeued if the worker dies meanwhile.
+RECALC_TASK_OPTIONS = {
+    'acks_late': True,
+    'reject_on_worker_lost': True,
+    'ignore_result': True,
+    'autoretry_for': (OperationalError,),
+    'retry_backoff': True,
+    'max_retries': 5,
+}
+
+
+# The name it had in rest.models, for messages queued before it moved.
+@shared_task(name='rest.models.update_dependent_cells_task', **RECALC_TASK_OPTIONS)
+def update_dependent_cells_task(cell_ids):
+    """
+    Recompute the formula cells in the rows of the given cells after they
+    were edited.
+
+    The cells are read in one query and grouped by table; each table's
+    compiled formulas come from the cache and its affected rows are
+    recomputed together by ``recompute_rows``, without a save or signal per
+    cell. Rows whose edited columns no formula reads are skipped.
+    """
+    if isinstance(cell_ids, str):
+        cell_ids = [cell_ids]  # Queued by the single-cell version of the task.
+    started = time.perf_counter()
+    edited = list(Cell.objects.filter(id__in=cell_ids).values_list(
+        'table_api_id', 'column_id', 'table_api__table_id'))
+    # Edits from now on need a new task; this one may read older values.
+    cache.delete_many([
+        _dependent_pending_key(table_api_id, column_id)
+        for table_api_id, column_id, _ in edited])
+
+    by_table = {}
+    for table_api_id, column_id, table_id in edited:
+        by_table.setdefault(table_id, {}).setdefault(table_api_id, set()).add(str(column_id))
+    rows = changed = 0
+    for table_id, edited_rows in by_table.items():
+        formulas = load_formulas(table_id)
+        inputs = referenced_columns(formulas) | set(formulas)
+        ids = [table_api_id for table_api_id, columns in edited_rows.items() if columns & inputs]
+        if ids:
+            rows += len(ids)
+            changed += recompute_rows(table_id, ids)
+    logger.info(
+        "Dependent cells of %s edited cells: %s rows in %s tables recomputed, "
+        "%s cells changed in %.1f ms",
+        len(cell_ids), rows, len(by_table), changed,
+        (time.perf_counter() - started) * 1000)
+
+
+@shared_task(**RECALC_TASK_OPTIONS)
+def recompute_table_task(table_id):
+    """Recompute every formula cell of a table."""
+    cache.delete(_table_pending_key(table_id))
+    if not claim_table_slot(table_id):
+        enqueue_table_recompute(table_id, countdown=settings.RECALC_TABLE_INTERVAL)
+        return 0
+    return recompute_rows(table_id)
+
+
+@shared_task(**RECALC_TASK_OPTIONS)
+def recalculate_rows_task(table_api_ids, queue=INTERACTIVE_QUEUE):
+    """
+    Recompute the formula cells of the given TableApis after a bulk write.
+
+    Interactive batches run at once. On the other queues a table whose slot
+    is taken is folded into one delayed ``recompute_table_task`` instead, so
+    the batches of a large import coalesce rather than queue up.
+    """
+    # Edits from now on need a new task; this one may read older values.
+    cache.delete_many([_rows_pending_key(queue, table_api_id) for table_api_id in table_api_ids])
+    by_table = {}
+    for table_id, table_api_id in TableApi.objects.filter(
+            id__in=table_api_ids).values_list('table_id', 'id'):
+        by_table.setdefault(table_id, []).append(table_api_id)
+    changed = 0
+    for table_id, ids in by_table.items():
+        if queue != INTERACTIVE_QUEUE and not claim_table_slot(table_id):
+            enqueue_table_recompute(table_id, countdown=settings.RECALC_TABLE_INTERVAL)
+            continue
+        changed += recompute_rows(table_id, ids)
+    return changed
+
+
+# Celery Task for Image Derivatives
+
+
+@shared_task(ignore_result=True)
+def import_upload_task(session_id):
+    """Import a completed spreadsheet upload session (see ``rest.uploads``)."""
+    # rest.uploads imports this module (through rest.excel) at load time.
+    from .uploads import finish_queued_session
+
+    session = finish_queued_session(session_id)
+    if session is not None:
+        logger.info("Upload session %s: %s", session_id, session.status)
+
+
+@shared_task(ignore_result=True)
+def generate_image_derivatives_task(image_id):
+    """Render the thumbnail and web copy of an Image and store their names."""
+    image = Image.objects.filter(id=image_id).first()
+    if image is None or not image.image:
+        return
+    digest, names = generate_derivatives(image)
+    Image.objects.filter(id=image_id, image=image.image.name).update(
+        content_hash=digest, thumbnail=names['thumbnail'], web_image=names['web'])
@@ -0,0 +1,170 @@
+"""
+Row-level access scoping by Company and Project membership.
+
+A user sees the companies they are a member of, their fellow members, the
+projects of those companies, plus the projects they are a member of
+directly. Jobs follow their project, and
+TableApi rows (with their cells, files and images) follow their job; rows
+without a job are visible to the user who created them. Users with the
+``admin`` role and superusers see everything.
+
+The accessible project ids are computed with one indexed query and cached
+per user under a tenancy version token, which any membership or project
+change replaces. Scoping is then a single ``project_id IN (...)`` filter on
+the queryset, joined through the foreign keys, so lists and lookups cost
+no extra query per object.
+"""
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.exceptions import PermissionDenied
+
+from .models import Company, Project, User
+
+TENANCY_VERSION_KEY = "tenancy_version"
+PROJECT_IDS_TIMEOUT = 60 * 60 * 24
+
+
+def has_full_access(user):
+    return user.is_superuser or getattr(user, 'role', '') == 'admin'
+
+
+def tenancy_version():
+    version = cache.get(TENANCY_VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(TENANCY_VERSION_KEY, version, timeout=None):
+            version = cache.get(TENANCY_VERSION_KEY, version)
+    return version
+
+
+def bump_tenancy_version():
+    cache.set(TENANCY_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+    # As bump_schema_version: bump again once other connections see the change.
+    transaction.on_commit(
+        lambda: cache.set(TENANCY_VERSION_KEY, uuid.uuid4().hex, timeout=None))
+
+
+def accessible_project_ids(user):
+    """Ids of the projects ``user`` may see, from the cache when possible."""
+    if not user.is_authenticated:
+        return []
+    key = f"tenancy_projects_{user.id}_{tenancy_version()}"
+    project_ids = cache.get(key)
+    if project_ids is None:
+        project_ids = list(
+            Project.objects.filter(company__members=user.id).values_list('id', flat=True)
+            .union(Project.objects.filter(members=user.id).values_list('id', flat=True)))
+        cache.set(key, project_ids, PROJECT_IDS_TIMEOUT)
+    return project_ids
+
+
+def _prefix(path):
+    return f'{path}__' if path else ''
+
+
+def scope_users(queryset, user, path=''):
+    """Limit ``queryset`` to rows whose User (at ``path``) is ``user`` or shares a company with them."""
+    if has_full_access(user):
+        return queryset
+    prefix = _prefix(path)
+    colleagues = User.objects.filter(companies__members=user.id).values('pk')
+    return queryset.filter(Q(**{f'{prefix}pk': user.id}) | Q(**{f'{prefix}pk__in': colleagues}))
+
+
+def scope_companies(queryset, user, path=''):
+    """Limit ``queryset`` to rows whose Company (at ``path``) has the user as a member."""
+    if has_full_access(user):
+        return queryset
+    return queryset.filter(**{_prefix(path) + 'members': user.id})
+
+
+def scope_projects(queryset, user, path=''):
+    """Limit ``queryset`` to rows whose Project (at ``path``) the user may see."""
+    if has_full_access(user):
+        return queryset
+    lookup = f'{path}_id__in' if path else 'id__in'
+    return queryset.filter(**{lookup: accessible_project_ids(user)})
+
+
+def scope_jobs(queryset, user, path=''):
+    """Limit ``queryset`` to rows whose Job (at ``path``) the user may see."""
+    return scope_projects(queryset, user, _prefix(path) + 'project')
+
+
+def scope_rows(queryset, user, path=''):
+    """Limit ``queryset`` to rows whose TableApi (at ``path``) the user may see."""
+    if has_full_access(user):
+        return queryset
+    prefix = _prefix(path)
+    return queryset.filter(
+        Q(**{f'{prefix}job__project_id__in': accessible_project_ids(user)})
+        | Q(**{f'{prefix}job__isnull': True, f'{prefix}user_id': user.id}))
+
+
+TENANT_SCOPES = {
+    'user': scope_users, 'company': scope_companies, 'project': scope_projects,
+    'job': scope_jobs, 'row': scope_rows,
+}
+
+
+class TenantScopedMixin:
+    """
+    Scopes a viewset's querysets to the request user's tenancy.
+
+    ``tenant_scope`` names the model the access follows (``user``,
+    ``company``, ``project``, ``job`` or ``row`` for TableApi) and
+    ``tenant_path`` the lookup from the viewset's model to it. Applied in
+    ``filter_queryset`` so lists, detail lookups and writes are all scoped,
+    whatever ``get_queryset`` returns. ``tenant_parent`` names the serializer field,
+    at the start of ``tenant_path``, whose instance a create or update must
+    be allowed to see, so rows cannot be attached to another tenant's data.
+    ``tenant_parent_scope`` checks the parent against another scope instead,
+    for a parent that is not on ``tenant_path`` (a Project's Company).
+    """
+    tenant_scope = 'row'
+    tenant_path = ''
+    tenant_parent = None
+    tenant_parent_scope = None
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        return TENANT_SCOPES[self.tenant_scope](queryset, self.request.user, self.tenant_path)
+
+    def check_tenant_parent(self, serializer):
+        parent = serializer.validated_data.get(self.tenant_parent) if self.tenant_parent else None
+        if parent is None:
+            return
+        if self.tenant_parent_scope:
+            scope, path = TENANT_SCOPES[self.tenant_parent_scope], ''
+        else:
+            scope = TENANT_SCOPES[self.tenant_scope]
+            path = self.tenant_path.removeprefix(self.tenant_parent).removeprefix('__')
+        queryset = type(parent).objects.filter(pk=parent.pk)
+        if not scope(queryset, self.request.user, path).exists():
+            raise PermissionDenied(f"You do not have access to this {self.tenant_parent}.")
+
+    def perform_create(self, serializer):
+        self.check_tenant_parent(serializer)
+        super().perform_create(serializer)
+
+    def perform_update(self, serializer):
+        self.check_tenant_parent(serializer)
+        super().perform_update(serializer)
+
+
+@receiver(m2m_changed, sender=Company.members.through)
+@receiver(m2m_changed, sender=Project.members.through)
+def membership_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_tenancy_version()
+
+
+@receiver([post_save, post_delete], sender=Project)
+def project_changed(sender, instance, **kwargs):
+    # New, deleted or moved projects change what company members see.
+    bump_tenancy_version()
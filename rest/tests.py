@@ -1,3 +1,806 @@
-from django.test import TestCase
+import hashlib
+import os
+import shutil
+from io import BytesIO, StringIO
+import tempfile
+import time
+from html.parser import HTMLParser
+from unittest import mock
 
-# Create your tests here.
+import billiard
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from openpyxl import Workbook
+from PIL import Image as PILImage
+from rest_framework.exceptions import ValidationError
+
+from base import celery_app
+from rest.excel import ExcelImportError, import_sheet
+from rest.formula import evaluate_row, evaluate_rows
+from rest.ingest import insert_cells, use_copy
+from rest.media import byte_range
+from rest.models import (
+    Blob, Cell, Column, Company, File, FormulaStep, Image, Job, Operation, Option, Project, Table, TableApi,
+    UploadSession, User, load_formulas,
+)
+from rest.serializers import TableApiSerializer
+from rest.services import bulk_create_cells
+from rest import tasks
+from rest.tasks import (
+    INTERACTIVE_QUEUE, generate_image_derivatives_task, import_upload_task,
+    update_dependent_cells_task,
+)
+from rest.uploads import (
+    UploadError, complete_session, create_session_file, missing_ranges, session_path, write_chunk,
+)
+from rest.utils import FormulaParseError, check_formula, compile_formula, parse_formula, save_formula
+
+PASSWORD = 'correct-horse-42'
+
+
+class APITestCase(TestCase):
+    def setUp(self):
+        # Tokens, revocations and tenancy lookups all live in the cache.
+        cache.clear()
+
+    def obtain_tokens(self, username):
+        response = self.client.post(
+            '/api/token/', {'username': username, 'password': PASSWORD})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def auth(self, access):
+        return {'HTTP_AUTHORIZATION': f'Bearer {access}'}
+
+
+class TenancyTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user(username='alice', password=PASSWORD, role='user')
+        own_company = Company.objects.create(name='Own')
+        cls.other_company = Company.objects.create(name='Other')
+        cls.colleague = User.objects.create_user(username='carol', password=PASSWORD, role='user')
+        cls.stranger = User.objects.create_user(username='dave', password=PASSWORD, role='user')
+        own_company.members.add(cls.alice, cls.colleague)
+        cls.other_company.members.add(cls.stranger)
+        own_job = Job.objects.create(
+            name='Own job', project=Project.objects.create(name='Own project', company=own_company))
+        other_job = Job.objects.create(
+            name='Other job', project=Project.objects.create(name='Other project', company=cls.other_company))
+        table = Table.objects.create(name='Table')
+        column = Column.objects.create(table=table, name='A', data_type='text')
+        cls.own_row = TableApi.objects.create(table=table, job=own_job)
+        cls.other_row = TableApi.objects.create(table=table, job=other_job)
+        cls.other_cell = Cell.objects.create(table_api=cls.other_row, column=column, value='1')
+
+    def setUp(self):
+        super().setUp()
+        self.headers = self.auth(self.obtain_tokens('alice')['access'])
+
+    def test_cross_tenant_read_is_not_found(self):
+        response = self.client.get(f'/api/table-apis/{self.own_row.id}/', **self.headers)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(f'/api/table-apis/{self.other_row.id}/', **self.headers)
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(f'/api/companies/{self.other_company.id}/', **self.headers)
+        self.assertEqual(response.status_code, 404)
+
+    def test_cross_tenant_write_is_forbidden(self):
+        response = self.client.post('/api/cell-files/', {
+            'cell': str(self.other_cell.id),
+            'file': SimpleUploadedFile('notes.txt', b'hello'),
+        }, **self.headers)
+        self.assertEqual(response.status_code, 403)
+        response = self.client.post('/api/projects/', {
+            'name': 'Intruder', 'company_id': str(self.other_company.id),
+        }, content_type='application/json', **self.headers)
+        self.assertEqual(response.status_code, 403)
+
+    def test_users_are_scoped_to_colleagues(self):
+        response = self.client.get('/api/users/', **self.headers)
+        self.assertEqual(
+            sorted(user['username'] for user in response.json()['results']), ['alice', 'carol'])
+        response = self.client.patch(
+            f'/api/users/{self.stranger.id}/', {'email': 'x@example.com'},
+            content_type='application/json', **self.headers)
+        self.assertEqual(response.status_code, 404)
+
+    def test_only_own_account_is_writable(self):
+        response = self.client.patch(
+            f'/api/users/{self.colleague.id}/', {'password': 'stolen-horse-42'},
+            content_type='application/json', **self.headers)
+        self.assertEqual(response.status_code, 403)
+        response = self.client.patch(
+            f'/api/users/{self.alice.id}/', {'email': 'alice@example.com'},
+            content_type='application/json', **self.headers)
+        self.assertEqual(response.status_code, 200)
+
+
+class TokenRevocationTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='bob', password=PASSWORD, role='user')
+
+    def test_token_issued_before_password_change_is_rejected(self):
+        headers = self.auth(self.obtain_tokens('bob')['access'])
+        self.assertEqual(self.client.get('/api/jobs/', **headers).status_code, 200)
+        # The cut-off has a one second resolution; record it after the token's iat.
+        with mock.patch('rest.authentication.time.time', return_value=time.time() + 1):
+            self.user.set_password('another-horse-42')
+            self.user.save()
+        self.assertEqual(self.client.get('/api/jobs/', **headers).status_code, 401)
+
+    def test_token_issued_before_demotion_is_rejected(self):
+        User.objects.filter(pk=self.user.pk).update(role='admin')
+        self.user.refresh_from_db()
+        tokens = self.obtain_tokens('bob')
+        headers = self.auth(tokens['access'])
+        self.assertEqual(self.client.get('/api/jobs/', **headers).status_code, 200)
+        with mock.patch('rest.authentication.time.time', return_value=time.time() + 1):
+            self.user.role = 'user'
+            self.user.save()
+        self.assertEqual(self.client.get('/api/jobs/', **headers).status_code, 401)
+        response = self.client.post('/api/token/refresh/', {'refresh': tokens['refresh']})
+        self.assertEqual(response.status_code, 401)
+
+    def test_blacklisted_refresh_token_is_rejected(self):
+        refresh = self.obtain_tokens('bob')['refresh']
+        response = self.client.post('/api/token/blacklist/', {'refresh': refresh})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post('/api/token/refresh/', {'refresh': refresh})
+        self.assertEqual(response.status_code, 401)
+
+
+class RecalcRoutingTests(TestCase):
+    def test_dependent_cells_task_routes_to_recalc_queue(self):
+        self.assertIs(update_dependent_cells_task.app, celery_app)
+        route = celery_app.amqp.router.route({}, update_dependent_cells_task.name)
+        self.assertEqual(route['queue'].name, 'recalc')
+
+
+class GridForm(HTMLParser):
+    """The fields a browser would post for the grid's form."""
+
+    def __init__(self):
+        super().__init__()
+        self.data = {}
+        self._select = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'input' and attrs.get('name') and attrs.get('type') != 'submit':
+            self.data[attrs['name']] = attrs.get('value', '')
+        elif tag == 'select':
+            self._select = attrs['name']
+        elif tag == 'option' and self._select and (
+                self._select not in self.data or 'selected' in attrs):
+            self.data[self._select] = attrs.get('value', '')
+
+    def handle_endtag(self, tag):
+        if tag == 'select':
+            self._select = None
+
+
+@override_settings(STORAGES={
+    **settings.STORAGES,
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+})
+class TableApiGridTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser(username='root', password=PASSWORD))
+        table = Table.objects.create(name='Table')
+        self.column = Column.objects.create(table=table, name='Status', data_type='select')
+        Option.objects.create(column=self.column, value='open')
+        self.row = TableApi.objects.create(table=table)
+        self.url = f'/admin/rest/tableapi/{self.row.id}/grid/'
+
+    def test_unchanged_select_keeps_value_outside_its_options(self):
+        cell = Cell.objects.create(table_api=self.row, column=self.column, value='legacy')
+        form = GridForm()
+        form.feed(self.client.get(self.url).content.decode())
+        self.assertEqual(form.data[f'cell:{self.row.id}:{self.column.id}'], 'legacy')
+
+        self.assertEqual(self.client.post(self.url, form.data).status_code, 302)
+        cell.refresh_from_db()
+        self.assertEqual(cell.value, 'legacy')
+
+
+class ByteRangeTests(TestCase):
+    def test_single_ranges(self):
+        self.assertEqual(byte_range('bytes=0-4', 10), (0, 4))
+        self.assertEqual(byte_range('bytes=5-', 10), (5, 9))
+        self.assertEqual(byte_range('bytes=-3', 10), (7, 9))
+        self.assertEqual(byte_range('bytes=8-20', 10), (8, 9))
+        self.assertEqual(byte_range('bytes=-20', 10), (0, 9))
+
+    def test_unsatisfiable_ranges(self):
+        self.assertIs(byte_range('bytes=10-', 10), False)
+        self.assertIs(byte_range('bytes=5-2', 10), False)
+        self.assertIs(byte_range('bytes=-0', 10), False)
+
+    def test_ignored_ranges(self):
+        self.assertIsNone(byte_range('bytes=0-1,4-5', 10))
+        self.assertIsNone(byte_range('bytes=-', 10))
+        self.assertIsNone(byte_range('items=0-1', 10))
+
+
+class MediaTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Before super(), which runs setUpTestData.
+        cls.media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.media_root)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media_root))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        alice = User.objects.create_user(username='alice', password=PASSWORD, role='user')
+        table = Table.objects.create(name='Table')
+        column = Column.objects.create(table=table, name='A', data_type='file')
+        own_cell = Cell.objects.create(
+            table_api=TableApi.objects.create(table=table, user=alice), column=column, value='')
+        other_cell = Cell.objects.create(
+            table_api=TableApi.objects.create(table=table), column=column, value='')
+        cls.own_file = File.objects.create(cell=own_cell, file=ContentFile(b'mine', name='b.txt'))
+        cls.file = File.objects.create(cell=other_cell, file=ContentFile(b'hello world', name='a.txt'))
+
+    def setUp(self):
+        super().setUp()
+        self.url = self.file.file.url
+
+    def test_media_requires_access_to_the_cell(self):
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+        headers = self.auth(self.obtain_tokens('alice')['access'])
+        self.assertEqual(self.client.get(self.url, **headers).status_code, 404)
+        self.assertEqual(self.client.get(self.own_file.file.url, **headers).status_code, 200)
+
+    def test_ranges_and_conditional_requests(self):
+        User.objects.filter(username='alice').update(role='admin')
+        headers = self.auth(self.obtain_tokens('alice')['access'])
+        response = self.client.get(self.url, **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'hello world')
+        self.assertTrue(response['Cache-Control'].startswith('private'))
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-4', **headers)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 0-4/11')
+        self.assertEqual(b''.join(response.streaming_content), b'hello')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=20-', **headers)
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */11')
+
+        etag = response['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag, **headers)
+        self.assertEqual(response.status_code, 304)
+        # A stale If-Range sends the whole file instead of the range.
+        response = self.client.get(
+            self.url, HTTP_RANGE='bytes=0-4', HTTP_IF_RANGE='"stale"', **headers)
+        self.assertEqual(response.status_code, 200)
+
+
+class TableApiSerializerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.table = Table.objects.create(name='Table')
+        cls.a = Column.objects.create(table=cls.table, name='A', data_type='text')
+        cls.b = Column.objects.create(table=cls.table, name='B', data_type='text')
+
+    def save(self, cells, instance=None):
+        serializer = TableApiSerializer(instance, data={
+            'table': str(self.table.id),
+            'api_cells': [{'column': str(column.id), 'value': value} for column, value in cells],
+        })
+        serializer.is_valid(raise_exception=True)
+        return serializer.save()
+
+    def test_create_moves_repeated_columns_to_child_rows(self):
+        row = self.save([(self.a, '1'), (self.b, 'x'), (self.a, '2'), (self.b, 'y')])
+        self.assertEqual(
+            sorted(row.api_cells.values_list('value', flat=True)), ['1', 'x'])
+        child = row.children.get()
+        self.assertEqual(
+            sorted(child.api_cells.values_list('value', flat=True)), ['2', 'y'])
+
+    def test_update_rejects_repeated_columns(self):
+        row = self.save([(self.a, '1')])
+        with self.assertRaises(ValidationError):
+            self.save([(self.a, '1'), (self.a, '2')], instance=row)
+        self.assertEqual(list(row.api_cells.values_list('value', flat=True)), ['1'])
+
+    def test_update_replaces_cells(self):
+        row = self.save([(self.a, '1')])
+        self.save([(self.a, '3'), (self.b, 'z')], instance=row)
+        self.assertEqual(
+            sorted(row.api_cells.values_list('value', flat=True)), ['3', 'z'])
+        self.assertFalse(row.children.exists())
+
+
+class FormulaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for name, symbol in [('add', '+'), ('subtract', '-'), ('multiply', '*'),
+                             ('divide', '/'), ('sqrt', 'sqrt'), ('percent', '%')]:
+            Operation.objects.create(name=name, symbol=symbol)
+        cls.table = Table.objects.create(name='Table')
+        cls.inputs = {
+            name: Column.objects.create(table=cls.table, name=name, data_type='number')
+            for name in 'ABC'
+        }
+        cls.result = Column.objects.create(table=cls.table, name='F', data_type='number')
+
+    def setUp(self):
+        cache.clear()
+        self.operations = {operation.name: operation for operation in Operation.objects.all()}
+
+    def evaluate(self, formula_text, A='2', B='3', C='4'):
+        parse_formula(formula_text, self.result, self.operations)
+        values = {str(self.inputs[name].id): value for name, value in zip('ABC', (A, B, C))}
+        return evaluate_row(load_formulas(self.table.id), values)[str(self.result.id)]
+
+    def test_left_to_right(self):
+        self.assertEqual(self.evaluate('A + B * C'), '20.0')
+        self.assertEqual(self.evaluate('A * 50 %'), '1.0')
+        self.assertEqual(self.evaluate('sqrt(A + B + C + 7)'), '4.0')
+
+    def test_groups_after_the_first_operand(self):
+        self.assertEqual(self.evaluate('A * (B + C)'), '14.0')
+        self.assertEqual(self.evaluate('A + sqrt(B * 12)'), '8.0')
+        self.assertEqual(self.evaluate('A - (B - (C - A))'), '1.0')
+        self.assertEqual(self.evaluate('A * ((B + C) * A)'), '28.0')
+        self.assertEqual(self.evaluate('(A + B) * (C - A) %'), '0.1')
+
+    def test_leading_groups_need_no_steps(self):
+        plan = compile_formula('(A + B) * C', self.operations)
+        self.assertNotIn('group', [step.operation for step in plan])
+
+    def test_syntax_errors(self):
+        for formula_text in ['A * (B + C', 'A + B)', 'A * ()', 'A B', 'A +', 'A (B)']:
+            with self.subTest(formula_text), self.assertRaises(FormulaParseError):
+                compile_formula(formula_text, self.operations)
+
+    def check(self, formula_text, column):
+        check_formula(
+            compile_formula(formula_text, self.operations), column.id,
+            [{'id': str(c.id), 'name': c.name, 'data_type': c.data_type}
+             for c in Column.objects.filter(table=self.table)],
+            load_formulas(self.table.id))
+
+    def test_unknown_column_is_rejected(self):
+        with self.assertRaisesMessage(FormulaParseError, "'D' not found"):
+            self.check('A * (B + D)', self.result)
+
+    def test_cycles_are_rejected(self):
+        parse_formula('A + B', self.result, self.operations)
+        with self.assertRaisesMessage(FormulaParseError, 'Circular reference: A -> F -> A'):
+            self.check('F * 2', self.inputs['A'])
+        with self.assertRaisesMessage(FormulaParseError, 'Circular reference'):
+            self.check('A + (F)', self.result)
+
+    def test_recompile_formulas_repairs_flattened_groups(self):
+        # Stored as the baseline parser did, dropping the parentheses.
+        self.result.formula_text = 'A * (B + C)'
+        self.result.save()
+        save_formula(self.result, compile_formula('A * B + C', self.operations), self.operations)
+        out = StringIO()
+        call_command('recompile_formulas', '--dry-run', stdout=out)
+        self.assertIn('1 formulas would be recompiled', out.getvalue())
+        call_command('recompile_formulas', stdout=StringIO())
+        self.assertEqual(
+            list(FormulaStep.objects.filter(column=self.result).values_list(
+                'operation__name', flat=True)),
+            [None, 'multiply', 'group', None, 'add', None, 'end_group'])
+
+
+# A * 2, as compile_steps lays it out
+DOUBLE = {'f': ((('column', 'a'), None, None), (None, 'multiply', ('constant', 2.0)),
+                (('constant', 2.0), None, None))}
+ROWS = [(str(i),) for i in range(20)]
+
+
+def evaluate_in_worker(pool_size):
+    return billiard.current_process().daemon, evaluate_rows(DOUBLE, ['a'], ROWS, pool_size, 2)
+
+
+class EvaluateRowsTests(TestCase):
+    def test_pool_matches_in_process(self):
+        expected = [(str(float(i * 2)),) for i in range(20)]
+        self.assertEqual(evaluate_rows(DOUBLE, ['a'], ROWS), expected)
+        self.assertEqual(evaluate_rows(DOUBLE, ['a'], ROWS, pool_size=3, min_rows=2), expected)
+
+    def test_pool_starts_in_a_daemonic_worker(self):
+        # As in a worker of Celery's prefork pool.
+        with billiard.Pool(1) as pool:
+            daemon, results = pool.apply(evaluate_in_worker, (3,))
+        self.assertTrue(daemon)
+        self.assertEqual(results, evaluate_rows(DOUBLE, ['a'], ROWS))
+
+
+def workbook_bytes(*rows):
+    workbook = Workbook()
+    for row in rows:
+        workbook.active.append(row)
+    content = BytesIO()
+    workbook.save(content)
+    return content.getvalue()
+
+
+class UploadTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.temp_dir)
+        cls.enterClassContext(override_settings(
+            MEDIA_ROOT=os.path.join(cls.temp_dir, 'media'),
+            UPLOAD_SESSION_DIR=os.path.join(cls.temp_dir, 'sessions')))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='alice', password=PASSWORD, role='admin')
+        cls.table = Table.objects.create(name='Table')
+        cls.name = Column.objects.create(table=cls.table, name='Name', data_type='text')
+        cls.amount = Column.objects.create(table=cls.table, name='Amount', data_type='number')
+        column = Column.objects.create(table=cls.table, name='Attachment', data_type='file')
+        cls.cell = Cell.objects.create(
+            table_api=TableApi.objects.create(table=cls.table), column=column, value='')
+
+    def start(self, content, kind='file', checksum='', **fields):
+        session = UploadSession.objects.create(
+            user=self.user, kind=kind, filename='upload.bin', size=len(content),
+            checksum=checksum, **fields)
+        create_session_file(session)
+        return session
+
+    def write(self, session, content, index, offset, length, checksum=''):
+        return write_chunk(session, index, offset, BytesIO(content[offset:offset + length]),
+                           length, checksum)
+
+    def test_chunks_must_fit_and_match_their_checksum(self):
+        session = self.start(b'0123456789')
+        for offset, length in ((-1, 2), (8, 4), (0, 0), (0, None)):
+            with self.assertRaisesMessage(UploadError, 'does not fit'):
+                write_chunk(session, 0, offset, BytesIO(b'0123'), length)
+        with self.assertRaisesMessage(UploadError, 'ended before'):
+            write_chunk(session, 0, 0, BytesIO(b'012'), 4)
+        with self.assertRaisesMessage(UploadError, 'checksum does not match'):
+            self.write(session, b'0123456789', 0, 0, 4, checksum='0' * 64)
+        self.assertFalse(session.chunks.exists())
+        self.write(session, b'0123456789', 0, 0, 4,
+                   checksum=hashlib.sha256(b'0123').hexdigest().upper())
+        self.assertEqual(session.chunks.get().size, 4)
+
+    def test_missing_ranges(self):
+        content = b'0123456789'
+        session = self.start(content)
+        self.assertEqual(missing_ranges(session), [(0, 10)])
+        self.write(session, content, 1, 2, 3)
+        self.write(session, content, 2, 3, 2)
+        self.assertEqual(missing_ranges(session), [(0, 2), (5, 10)])
+        self.write(session, content, 3, 8, 2)
+        self.assertEqual(missing_ranges(session), [(0, 2), (5, 8)])
+        with self.assertRaisesMessage(UploadError, 'Missing byte ranges'):
+            complete_session(session)
+
+    def test_resume_after_file_checksum_mismatch(self):
+        content = b'hello world'
+        session = self.start(content, checksum=hashlib.sha256(content).hexdigest(), cell=self.cell)
+        self.write(session, b'hello there', 0, 0, 6)
+        self.write(session, b'hello there', 1, 6, 5)
+        with self.assertRaisesMessage(UploadError, 'upload the file again'):
+            complete_session(session)
+        self.assertEqual(missing_ranges(session), [(0, 11)])
+
+        self.write(session, content, 0, 0, 11)
+        session = complete_session(session)
+        self.assertEqual(session.status, 'complete')
+        with File.objects.get(id=session.result['file_id']).file.open() as f:
+            self.assertEqual(f.read(), content)
+        self.assertFalse(os.path.exists(session_path(session)))
+
+    def test_excel_import_runs_on_the_imports_queue(self):
+        content = workbook_bytes(('Name', 'Amount'), ('a', 1), ('b', 2.5))
+        session = self.start(content, kind='excel', options={
+            'table_id': str(self.table.id),
+            'column_ids': [str(self.name.id), str(self.amount.id)]})
+        self.write(session, content, 0, 0, len(content))
+        with mock.patch.object(import_upload_task, 'delay') as delay:
+            session = complete_session(session)
+        delay.assert_called_once_with(str(session.id))
+        self.assertEqual(session.status, 'processing')
+        self.assertFalse(TableApi.objects.filter(table=self.table).exclude(
+            id=self.cell.table_api_id).exists())
+        with self.assertRaisesMessage(UploadError, 'no longer accepts chunks'):
+            self.write(session, content, 0, 0, len(content))
+
+        import_upload_task(str(session.id))
+        session.refresh_from_db()
+        self.assertEqual(session.status, 'complete')
+        self.assertEqual(session.result['sheets'][0]['rows'], 2)
+        self.assertCountEqual(
+            Cell.objects.filter(column=self.amount).values_list('value', flat=True), ['1.0', '2.5'])
+        self.assertFalse(session.chunks.exists())
+        self.assertFalse(os.path.exists(session_path(session)))
+
+    def test_failed_excel_import_is_recorded(self):
+        content = workbook_bytes(('Name', 'Amount'), ('a', 'many'))
+        session = self.start(content, kind='excel', options={
+            'table_id': str(self.table.id),
+            'column_ids': [str(self.name.id), str(self.amount.id)]})
+        self.write(session, content, 0, 0, len(content))
+        with mock.patch.object(import_upload_task, 'delay', side_effect=OSError):
+            with self.assertRaisesMessage(UploadError, 'could not be queued'):
+                complete_session(session)
+        session.refresh_from_db()
+        self.assertEqual(session.status, 'pending')
+
+        with mock.patch.object(import_upload_task, 'delay'):
+            complete_session(session)
+        import_upload_task(str(session.id))
+        session.refresh_from_db()
+        self.assertEqual(session.status, 'failed')
+        self.assertIn('Invalid numeric value "many"', session.result['error'])
+        self.assertFalse(Cell.objects.filter(column=self.amount).exists())
+
+
+class BulkCreateCellsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        operations = {'add': Operation.objects.create(name='add', symbol='+')}
+        cls.table = Table.objects.create(name='Table')
+        cls.a, cls.b, cls.f = (
+            Column.objects.create(table=cls.table, name=name, data_type='number')
+            for name in 'ABF')
+        parse_formula('A + B', cls.f, operations)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_formula_cells_are_computed_from_old_and_new_values(self):
+        row = TableApi.objects.create(table=self.table)
+        Cell.objects.create(table_api=row, column=self.a, value='2')
+        with self.captureOnCommitCallbacks() as callbacks:
+            cells = bulk_create_cells([
+                Cell(table_api=row, column=self.b, value='3'),
+                Cell(table_api=row, column=self.f, value=''),
+            ])
+        self.assertEqual(cells[1].value, '5.0')
+        self.assertEqual(Cell.objects.get(table_api=row, column=self.f).value, '5.0')
+        self.assertEqual(cache.get(f"cell_computed_value_{cells[1].id}"), '5.0')
+        self.assertEqual(callbacks, [])
+
+    def test_rows_with_formula_cells_are_recalculated_after_commit(self):
+        row = TableApi.objects.create(table=self.table)
+        Cell.objects.create(table_api=row, column=self.f, value='0.0')
+        with mock.patch('rest.services.enqueue_rows_recalculation') as enqueue:
+            with self.captureOnCommitCallbacks(execute=True):
+                bulk_create_cells([Cell(table_api=row, column=self.a, value='4')])
+        enqueue.assert_called_once_with([str(row.id)], INTERACTIVE_QUEUE)
+
+
+class InsertCellsTests(TestCase):
+    @override_settings(CELL_COPY_MIN_ROWS=1)
+    def test_sqlite_falls_back_to_bulk_create(self):
+        table = Table.objects.create(name='Table')
+        column = Column.objects.create(table=table, name='A', data_type='text')
+        rows = [TableApi.objects.create(table=table) for _ in range(3)]
+        with mock.patch('rest.ingest.copy_insert') as copy_insert:
+            insert_cells([Cell(table_api=row, column=column, value='x') for row in rows])
+        copy_insert.assert_not_called()
+        self.assertEqual(Cell.objects.filter(column=column).count(), 3)
+
+    @override_settings(CELL_COPY_MIN_ROWS=100)
+    def test_copy_is_used_for_large_batches_on_postgresql(self):
+        postgresql = mock.Mock(vendor='postgresql')
+        with mock.patch('rest.ingest.connections', {'default': postgresql}):
+            self.assertTrue(use_copy(100, 'default'))
+            self.assertFalse(use_copy(99, 'default'))
+
+
+class ImportSheetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.table = Table.objects.create(name='Table')
+        cls.name = Column.objects.create(table=cls.table, name='Name', data_type='text')
+        cls.amount = Column.objects.create(table=cls.table, name='Amount', data_type='number')
+
+    def setUp(self):
+        cache.clear()
+
+    def sheet(self, *rows):
+        workbook = Workbook()
+        for row in (('Amount', None, 'Name'),) + rows:
+            workbook.active.append(row)
+        return workbook.active
+
+    def values(self, table_api):
+        """The first row's values, then those of its children in any order."""
+        def row_values(row):
+            return dict(Cell.objects.filter(table_api=row).values_list('column__name', 'value'))
+        return row_values(table_api), [row_values(row) for row in table_api.children.all()]
+
+    def test_cells_are_converted_like_the_pandas_import(self):
+        sheet = self.sheet((1, 'ignored', 'a'), (None, None, None), ('2.5', None, 7), (None, None, 'c'))
+        table_api, rows, cells = import_sheet(
+            sheet, self.table, [self.name, self.amount], batch_size=2)
+        self.assertEqual((rows, cells), (3, 6))
+        first, children = self.values(table_api)
+        self.assertEqual(first, {'Amount': '1.0', 'Name': 'a'})
+        self.assertCountEqual(children, [{'Amount': '2.5', 'Name': '7'}, {'Amount': '', 'Name': 'c'}])
+
+    def test_invalid_numbers(self):
+        sheet = self.sheet((1, None, 'a'), ('many', None, 'b'))
+        with self.assertRaisesMessage(
+                ExcelImportError, 'Invalid numeric value "many" in column "Amount" at row 3'):
+            import_sheet(sheet, self.table, [self.name, self.amount])
+        table_api, _, _ = import_sheet(
+            sheet, self.table, [self.name, self.amount], strict_numeric=False)
+        self.assertEqual(self.values(table_api)[1], [{'Amount': '', 'Name': 'b'}])
+
+    def test_unknown_headers_are_rejected(self):
+        sheet = self.sheet()
+        sheet.cell(row=1, column=2, value='Extra')
+        with self.assertRaisesMessage(ExcelImportError, "['Extra'] do not match"):
+            import_sheet(sheet, self.table, [self.name, self.amount])
+
+
+class SchemaETagTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user(username='admin', password=PASSWORD, role='admin')
+        cls.table = Table.objects.create(name='Table')
+        Column.objects.create(table=cls.table, name='A', data_type='number')
+
+    def test_unchanged_schema_is_not_modified(self):
+        headers = self.auth(self.obtain_tokens('admin')['access'])
+        url = f'/api/tables/{self.table.id}/schema/'
+        response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual([column['name'] for column in response.json()['columns']], ['A'])
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=f'"other", {etag}', **headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Column.objects.create(table=self.table, name='B', data_type='text')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag, **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual([column['name'] for column in response.json()['columns']], ['A', 'B'])
+
+
+class BlobTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.media_root)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media_root))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        table = Table.objects.create(name='Table')
+        column = Column.objects.create(table=table, name='A', data_type='file')
+        cls.cells = [
+            Cell.objects.create(table_api=TableApi.objects.create(table=table), column=column, value='')
+            for _ in range(2)
+        ]
+
+    def refcounts(self):
+        return dict(Blob.objects.values_list('name', 'refcount'))
+
+    def test_identical_uploads_share_a_counted_blob(self):
+        first = File.objects.create(cell=self.cells[0], file=ContentFile(b'same', name='a.txt'))
+        second = File.objects.create(cell=self.cells[1], file=ContentFile(b'same', name='b.TXT'))
+        digest = hashlib.sha256(b'same').hexdigest()
+        name = f"uploads/blobs/{digest[:2]}/{digest}.txt"
+        self.assertEqual((first.file.name, second.file.name), (name, name))
+        self.assertEqual((first.original_name, second.original_name), ('a.txt', 'b.TXT'))
+        self.assertEqual(self.refcounts(), {name: 2})
+
+        first.delete()
+        self.assertEqual(self.refcounts(), {name: 1})
+        second.file = ContentFile(b'other', name='c.txt')
+        second.save()
+        self.assertEqual(self.refcounts(), {name: 0, second.file.name: 1})
+
+    def test_clean_blobs_dry_run_deletes_nothing(self):
+        file = File.objects.create(cell=self.cells[0], file=ContentFile(b'gone', name='a.txt'))
+        name = file.file.name
+        file.delete()
+        out = StringIO()
+        call_command('clean_blobs', '--hours', '0', '--dry-run', stdout=out)
+        self.assertIn('Would remove 1 blobs (4 bytes)', out.getvalue())
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, name)))
+        self.assertTrue(Blob.objects.filter(name=name).exists())
+
+        # Still within the grace period.
+        out = StringIO()
+        call_command('clean_blobs', stdout=out)
+        self.assertIn('Removed 0 blobs', out.getvalue())
+
+        out = StringIO()
+        call_command('clean_blobs', '--hours', '0', stdout=out)
+        self.assertIn('Removed 1 blobs (4 bytes)', out.getvalue())
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, name)))
+        self.assertFalse(Blob.objects.exists())
+
+
+def png_bytes(size):
+    content = BytesIO()
+    PILImage.new('RGB', size, 'red').save(content, 'PNG')
+    return content.getvalue()
+
+
+class ImageDerivativeTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.media_root)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media_root))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        table = Table.objects.create(name='Table')
+        column = Column.objects.create(table=table, name='A', data_type='image')
+        cls.cells = [
+            Cell.objects.create(table_api=TableApi.objects.create(table=table), column=column, value='')
+            for _ in range(2)
+        ]
+
+    def test_derivatives_are_named_after_the_content_hash(self):
+        content = png_bytes((400, 200))
+        digest = hashlib.sha256(content).hexdigest()
+        image = Image.objects.create(cell=self.cells[0], image=ContentFile(content, name='a.png'))
+        generate_image_derivatives_task(str(image.id))
+        image.refresh_from_db()
+        self.assertEqual(image.content_hash, digest)
+        self.assertEqual(image.thumbnail.name, f"uploads/derivatives/{digest[:2]}/{digest}-thumbnail.webp")
+        self.assertEqual(image.web_image.name, f"uploads/derivatives/{digest[:2]}/{digest}-web.webp")
+        with PILImage.open(image.thumbnail.path) as thumbnail:
+            self.assertEqual((thumbnail.format, thumbnail.size), ('WEBP', (160, 80)))
+
+        # The same content reuses the stored derivatives.
+        copy = Image.objects.create(cell=self.cells[1], image=ContentFile(content, name='b.png'))
+        with mock.patch('rest.images.render_derivative') as render:
+            generate_image_derivatives_task(str(copy.id))
+        render.assert_not_called()
+        copy.refresh_from_db()
+        self.assertEqual((copy.thumbnail.name, copy.web_image.name),
+                         (image.thumbnail.name, image.web_image.name))
+
+
+class RecalcDedupTests(TestCase):
+    ENQUEUES = [
+        (tasks.enqueue_rows_recalculation, 'recalculate_rows_task', 'apply_async', (['row'],)),
+        (tasks.enqueue_dependent_cells_update, 'update_dependent_cells_task', 'delay',
+         ({('row', 'column'): 'cell'},)),
+        (tasks.enqueue_table_recompute, 'recompute_table_task', 'apply_async', ('table',)),
+    ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_markers_are_cleared_when_publishing_fails(self):
+        for enqueue, task, method, args in self.ENQUEUES:
+            with self.subTest(task):
+                publish = mock.patch.object(getattr(tasks, task), method)
+                with publish as send:
+                    send.side_effect = OSError('broker down')
+                    with self.assertRaises(OSError):
+                        enqueue(*args)
+                with publish as send:
+                    enqueue(*args)
+                    enqueue(*args)
+                # Queued once: the failed attempt left no marker behind.
+                self.assertEqual(send.call_count, 1)
@@ -0,0 +1,208 @@
+"""
+Resumable chunked uploads.
+
+A client creates an ``UploadSession`` with the file's size (and optionally
+its SHA-256), then PUTs the file in chunks, each with its byte offset, in
+any order and in parallel. Chunks are written straight into a temporary
+file under ``UPLOAD_SESSION_DIR`` with ``os.pwrite``; a chunk that fails
+its checksum or arrives truncated is not recorded and can be resent. The
+session's ``chunks`` tell a client which ranges to resend after a dropped
+connection. Completing the session checks that every byte arrived,
+verifies the whole-file checksum and hands the file to ``File`` or
+``Image``. Spreadsheets are imported by ``import_upload_task`` on the
+imports queue instead, so a large workbook holds neither a web worker nor
+a long transaction; the session is ``processing`` until the import has
+finished, then ``complete`` or ``failed`` with the error in ``result``.
+"""
+import hashlib
+import os
+
+from django.conf import settings
+from django.core.files import File as DjangoFile
+from django.db import transaction
+
+from .excel import ExcelImportError, import_workbook
+from .models import File, Image, Job, UploadChunk, UploadSession
+from .serializers import ExcelImportOptionsSerializer
+from .tasks import import_upload_task
+from .tenancy import scope_jobs
+
+READ_BLOCK_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    """The chunk or session cannot be accepted as sent."""
+
+
+def session_path(session):
+    return os.path.join(settings.UPLOAD_SESSION_DIR, f"{session.id}.part")
+
+
+def create_session_file(session):
+    os.makedirs(settings.UPLOAD_SESSION_DIR, exist_ok=True)
+    with open(session_path(session), 'wb') as f:
+        f.truncate(session.size)
+
+
+def discard_session(session):
+    """Delete a session together with its temporary file."""
+    try:
+        os.remove(session_path(session))
+    except FileNotFoundError:
+        pass
+    session.delete()
+
+
+def write_chunk(session, index, offset, stream, length, checksum=''):
+    """
+    Write ``length`` bytes read from ``stream`` at ``offset`` and record the
+    chunk. ``checksum`` is the chunk's expected SHA-256 hex digest, if sent.
+    """
+    if session.status != 'pending':
+        raise UploadError("This upload no longer accepts chunks.")
+    if length is None or length <= 0 or offset < 0 or offset + length > session.size:
+        raise UploadError("Chunk does not fit within the declared file size.")
+    digest = hashlib.sha256()
+    remaining = length
+    fd = os.open(session_path(session), os.O_WRONLY)
+    try:
+        while remaining:
+            block = stream.read(min(READ_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            os.pwrite(fd, block, offset + length - remaining)
+            digest.update(block)
+            remaining -= len(block)
+    finally:
+        os.close(fd)
+    if remaining:
+        raise UploadError("Chunk ended before its declared length.")
+    if checksum and digest.hexdigest() != checksum.lower():
+        raise UploadError("Chunk checksum does not match.")
+    chunk, _ = UploadChunk.objects.update_or_create(
+        session=session, index=index,
+        defaults={'offset': offset, 'size': length, 'checksum': digest.hexdigest()},
+    )
+    return chunk
+
+
+def missing_ranges(session):
+    """``[(start, end)]`` byte ranges no recorded chunk covers."""
+    missing = []
+    position = 0
+    for offset, size in session.chunks.order_by('offset').values_list('offset', 'size'):
+        if offset > position:
+            missing.append((position, offset))
+        position = max(position, offset + size)
+    if position < session.size:
+        missing.append((position, session.size))
+    return missing
+
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _hand_off_file(session, path):
+    with open(path, 'rb') as f:
+        file = File.objects.create(cell=session.cell, file=DjangoFile(f, name=os.path.basename(session.filename)))
+    return {'file_id': str(file.id)}
+
+
+def _hand_off_image(session, path):
+    with open(path, 'rb') as f:
+        image = Image.objects.create(cell=session.cell, image=DjangoFile(f, name=os.path.basename(session.filename)))
+    return {'image_id': str(image.id)}
+
+
+def _hand_off_excel(session, path):
+    options = ExcelImportOptionsSerializer(data=session.options)
+    if not options.is_valid():
+        raise UploadError(f"Invalid import options: {options.errors}")
+    job_id = options.validated_data.get('job_id')
+    # The session's user, not the worker, must be allowed to see the job.
+    job = scope_jobs(Job.objects.all(), session.user).filter(id=job_id).first() if job_id else None
+    if job_id and job is None:
+        raise UploadError(f"Job with id {job_id} not found")
+    try:
+        with open(path, 'rb') as f:
+            results = import_workbook(
+                f, options.validated_data['sheets'], job=job, user_id=session.user_id,
+                strict_numeric=options.validated_data['strict_numeric'])
+    except ExcelImportError as e:
+        raise UploadError(str(e))
+    return {'sheets': results}
+
+
+HAND_OFF = {
+    'file': _hand_off_file,
+    'image': _hand_off_image,
+    'excel': _hand_off_excel,
+}
+# Hand-offs too slow for a request, run by import_upload_task
+QUEUED_HAND_OFFS = {'excel'}
+
+
+def complete_session(session):
+    """
+    Assemble and hand off the upload, or queue the hand-off and return the
+    session as ``processing``. Raises ``UploadError`` and leaves the
+    session pending when bytes are missing or the hand-off fails; on a
+    whole-file checksum mismatch every chunk is forgotten so the client
+    uploads the file again.
+    """
+    path = session_path(session)
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(pk=session.pk)
+        if session.status != 'pending':
+            return session
+        missing = missing_ranges(session)
+        if missing:
+            raise UploadError(f"Missing byte ranges: {missing}")
+        corrupt = bool(session.checksum) and file_checksum(path) != session.checksum
+        if corrupt:
+            session.chunks.all().delete()
+        elif session.kind in QUEUED_HAND_OFFS:
+            session.status = 'processing'
+            session.save(update_fields=['status'])
+        else:
+            session.result = HAND_OFF[session.kind](session, path)
+            session.status = 'complete'
+            session.save(update_fields=['result', 'status'])
+            session.chunks.all().delete()
+    if corrupt:
+        raise UploadError("File checksum does not match; upload the file again.")
+    if session.status == 'processing':
+        try:
+            import_upload_task.delay(str(session.id))
+        except Exception:
+            # Nothing was queued: let the client complete the session again.
+            UploadSession.objects.filter(pk=session.pk).update(status='pending')
+            raise UploadError("The import could not be queued; complete the upload again.")
+        return session
+    os.remove(path)
+    return session
+
+
+def finish_queued_session(session_id):
+    """Run the queued hand-off of a ``processing`` session."""
+    session = UploadSession.objects.filter(
+        pk=session_id, status='processing').select_related('user').first()
+    if session is None:
+        return None  # Already finished, or discarded meanwhile.
+    path = session_path(session)
+    try:
+        with transaction.atomic():
+            session.result = HAND_OFF[session.kind](session, path)
+    except UploadError as e:
+        session.status, session.result = 'failed', {'error': str(e)}
+    else:
+        session.status = 'complete'
+    session.save(update_fields=['result', 'status'])
+    session.chunks.all().delete()
+    os.remove(path)
+    return session
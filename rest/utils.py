@@ -1,71 +1,230 @@
-from .models import Column, Operation, FormulaStep, FormulaOperand
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from .formula import END_GROUP, GROUP, UNARY_OPERATIONS, referenced_columns
+from .models import Column, FormulaStep, FormulaOperand, bump_schema_version
 
 
 class FormulaParseError(Exception):
     pass
 
 
-def parse_formula(formula_text, column, operations_dict):
+# One FormulaStep to be: ``operand`` is None, ('column', name) or
+# ('constant', Decimal); ``operation`` is an Operation name or None.
+PlannedStep = namedtuple('PlannedStep', ['operand', 'operation'])
+
+SYMBOL_OPERATIONS = {'+': 'add', '-': 'subtract', '*': 'multiply', '/': 'divide', '%': 'percent'}
+# FormulaOperand.constant is a DecimalField(max_digits=12, decimal_places=2).
+CONSTANT_PLACES = Decimal('0.01')
+CONSTANT_LIMIT = Decimal('1e10')
+
+
+def tokenize_formula(formula_text):
+    """Split a formula into ``('number', Decimal)``, ``('name', str)`` and ``('symbol', str)``."""
     tokens = []
     i = 0
     while i < len(formula_text):
         char = formula_text[i]
-        if char in '()+-*/':
-            tokens.append(char)
-        elif char == '%':
-            tokens.append('%')
-        elif char.lower() == 's' and formula_text[i:i+4].lower() == 'sqrt':
-            tokens.append('sqrt')
-            i += 3
-        elif char.isspace():
+        if char.isspace():
+            i += 1
+        elif char in '()' or char in SYMBOL_OPERATIONS:
+            tokens.append(('symbol', char))
             i += 1
-            continue
         elif char.isdigit() or char == '.':
-            num = ""
+            start = i
             while i < len(formula_text) and (formula_text[i].isdigit() or formula_text[i] == '.'):
-                num += formula_text[i]
                 i += 1
-            tokens.append(float(num))
-            continue
-        else:
-            col_name = ""
+            try:
+                tokens.append(('number', Decimal(formula_text[start:i])))
+            except InvalidOperation:
+                raise FormulaParseError(f"Invalid number '{formula_text[start:i]}'")
+        elif char.isalnum() or char == '_':
+            start = i
             while i < len(formula_text) and (formula_text[i].isalnum() or formula_text[i] == '_'):
-                col_name += formula_text[i]
                 i += 1
-            if col_name:
-                tokens.append(col_name)
+            tokens.append(('name', formula_text[start:i]))
+        else:
+            raise FormulaParseError(f"Unexpected character '{char}'")
+    return tokens
+
+
+def compile_formula(formula_text, operation_names):
+    """
+    Compile ``formula_text`` into ``PlannedStep``s without touching the
+    database.
+
+    Formulas are evaluated left to right on a running result, as
+    ``rest.formula.RowEvaluator`` does: the first operand seeds the result,
+    a binary operation (``+ - * /`` or its name) combines it with the next
+    operand, ``%`` applies at once and ``sqrt(...)`` applies when its
+    parentheses close. The plan is laid out so the evaluator reproduces
+    that: a seed step, then one step per operation followed by its operand.
+
+    Parentheses before the first operand need no steps of their own, the
+    running result is simply not combined with anything yet. A group opened
+    later, as in ``A * (B + C)``, is bracketed by ``group`` and
+    ``end_group`` steps so the evaluator computes it on its own before
+    applying the operation in front of it.
+    """
+    operation_names = set(operation_names)
+    plan = []
+    groups = []  # per open parenthesis: (unary operation to apply on close, bracketed)
+    expect_operand = True
+    tokens = tokenize_formula(formula_text)
+
+    def operation(name):
+        if name not in operation_names:
+            raise FormulaParseError(f"Operation '{name}' is not defined")
+        return name
+
+    skip_paren = False
+    for index, (kind, token) in enumerate(tokens):
+        next_token = tokens[index + 1] if index + 1 < len(tokens) else (None, None)
+        if skip_paren:
+            # The '(' opening a sqrt(...) group, already pushed below.
+            skip_paren = False
+            continue
+        name = None
+        if kind == 'name':
+            # sqrt has always been accepted in any case.
+            name = 'sqrt' if token.lower() == 'sqrt' else token
+        if kind == 'symbol' and token == '(':
+            if not expect_operand:
+                raise FormulaParseError("Missing operator before '('")
+            groups.append((None, bool(plan)))
+            if plan:
+                plan.append(PlannedStep(None, operation(GROUP)))
+        elif kind == 'symbol' and token == ')':
+            if not groups:
+                raise FormulaParseError("Unbalanced ')'")
+            if expect_operand:
+                raise FormulaParseError("Empty parentheses or missing operand before ')'")
+            unary, bracketed = groups.pop()
+            if unary:
+                plan.append(PlannedStep(None, unary))
+            if bracketed:
+                plan.append(PlannedStep(None, operation(END_GROUP)))
+        elif name in UNARY_OPERATIONS and next_token == ('symbol', '('):
+            if not expect_operand:
+                raise FormulaParseError(f"Missing operator before '{token}('")
+            groups.append((operation(name), bool(plan)))
+            if plan:
+                plan.append(PlannedStep(None, operation(GROUP)))
+            skip_paren = True
+        elif (kind == 'symbol' and SYMBOL_OPERATIONS[token] in UNARY_OPERATIONS) or name in UNARY_OPERATIONS:
+            if expect_operand:
+                raise FormulaParseError(f"'{token}' needs a value before it")
+            plan.append(PlannedStep(None, operation(SYMBOL_OPERATIONS.get(token, name))))
+        elif kind == 'symbol' or (name in operation_names and name not in (GROUP, END_GROUP)):
+            if expect_operand:
+                raise FormulaParseError(f"Missing operand before '{token}'")
+            plan.append(PlannedStep(None, operation(SYMBOL_OPERATIONS.get(token, name))))
+            expect_operand = True
+        else:
+            if not expect_operand:
+                raise FormulaParseError(f"Missing operator before '{token}'")
+            if kind == 'number':
+                constant = token.quantize(CONSTANT_PLACES)
+                if abs(constant) >= CONSTANT_LIMIT:
+                    raise FormulaParseError(f"Constant {token} is too large")
+                plan.append(PlannedStep(('constant', constant), None))
+            else:
+                plan.append(PlannedStep(('column', token), None))
+            expect_operand = False
+    if groups:
+        raise FormulaParseError("Unbalanced '('")
+    if expect_operand and plan:
+        raise FormulaParseError("Formula ends with an operator")
+    return plan
+
+
+def check_formula(plan, column_id, columns, formulas):
+    """
+    Validate the column references of a plan for column ``column_id``.
+
+    ``columns`` are the table's column catalogue entries (``id``, ``name``,
+    ``data_type``) and ``formulas`` its compiled formulas, as returned by
+    ``load_formulas``. References must name number columns of the table and
+    must not lead back to ``column_id``. Returns the referenced column ids.
+    """
+    by_name = {column['name']: column for column in columns}
+    references = set()
+    for step in plan:
+        if step.operand and step.operand[0] == 'column':
+            column = by_name.get(step.operand[1])
+            if column is None:
+                raise FormulaParseError(f"Invalid column name: '{step.operand[1]}' not found in table.")
+            if column['data_type'] != 'number':
+                raise FormulaParseError(f"Column '{column['name']}' is not a number column.")
+            references.add(column['id'])
+
+    column_id = str(column_id)
+    dependencies = {
+        formula_column: referenced_columns({formula_column: compiled})
+        for formula_column, compiled in formulas.items()
+    }
+    dependencies[column_id] = references
+    names = {column['id']: column['name'] for column in columns}
+    stack = [(reference, [reference]) for reference in references]
+    seen = set()
+    while stack:
+        current, path = stack.pop()
+        if current == column_id:
+            cycle = ' -> '.join(names.get(c, c) for c in [column_id, *path])
+            raise FormulaParseError(f"Circular reference: {cycle}")
+        if current in seen:
             continue
-        i += 1
-
-    steps = []
-    order = 0
-    prev_operand = None
-
-    for token in tokens:
-        if token in operations_dict:
-            operation = operations_dict[token]
-            if prev_operand:
-                step = FormulaStep(
-                    column=column, operation=operation, operand=prev_operand, order=order)
-                steps.append(step)
-                order += 1
-            prev_operand = None
-        elif isinstance(token, float):
-            operand = FormulaOperand(constant=token)
-            operand.save()
-            prev_operand = operand
-        elif isinstance(token, str) and token not in '()':
-            ref_column = Column.objects.filter(
-                table=column.table, name=token).first()
-            if not ref_column:
-                ref_column = Column(table=column.table,
-                                    name=token, data_type='number')
-                ref_column.save()
-            operand = FormulaOperand(column=ref_column)
-            operand.save()
-            prev_operand = operand
-
-    for step in steps:
-        step.save()
+        seen.add(current)
+        stack.extend((dep, path + [dep]) for dep in dependencies.get(current, ()))
+    return references
+
+
+def save_formula(column, plan, operations_dict, create_columns=False):
+    """
+    Replace the FormulaSteps of ``column`` with ``plan`` in one transaction:
+    the old steps and operands are deleted and the new ones inserted with
+    two ``bulk_create`` calls. Referenced columns missing from the table
+    are created as number columns when ``create_columns`` is set, otherwise
+    they are an error. Returns the new steps.
+    """
+    with transaction.atomic():
+        names = {
+            step.operand[1] for step in plan if step.operand and step.operand[0] == 'column'}
+        by_name = {}
+        for ref_column in Column.objects.filter(table_id=column.table_id, name__in=names).order_by('id'):
+            by_name.setdefault(ref_column.name, ref_column)
+        for name in sorted(names - set(by_name)):
+            if not create_columns:
+                raise FormulaParseError(f"Invalid column name: '{name}' not found in table.")
+            by_name[name] = Column.objects.create(
+                table_id=column.table_id, name=name, data_type='number')
+
+        old_operands = list(FormulaStep.objects.filter(
+            column=column, operand__isnull=False).values_list('operand_id', flat=True))
+        FormulaStep.objects.filter(column=column).delete()
+        FormulaOperand.objects.filter(id__in=old_operands, formulastep__isnull=True).delete()
 
+        operands = FormulaOperand.objects.bulk_create([
+            FormulaOperand(column=by_name[step.operand[1]]) if step.operand[0] == 'column'
+            else FormulaOperand(constant=step.operand[1])
+            for step in plan if step.operand
+        ])
+        operand_iter = iter(operands)
+        steps = FormulaStep.objects.bulk_create([
+            FormulaStep(
+                column=column, order=order,
+                operand=next(operand_iter) if step.operand else None,
+                operation=operations_dict[step.operation] if step.operation else None)
+            for order, step in enumerate(plan)
+        ])
+        # bulk_create sends no post_save, so invalidate cached formulas here.
+        bump_schema_version(column.table_id)
     return steps
+
+
+def parse_formula(formula_text, column, operations_dict):
+    """Compile ``formula_text`` and store it as the steps of ``column``, creating missing columns."""
+    plan = compile_formula(formula_text, operations_dict)
+    return save_formula(column, plan, operations_dict, create_columns=True)
@@ -1,26 +1,42 @@
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import viewsets, filters
+from rest_framework import mixins, viewsets, filters
 from rest_framework.permissions import IsAuthenticated
-from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from django.http import JsonResponse
+from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponseNotModified, JsonResponse
+from django.shortcuts import get_object_or_404
 from django.views.decorators.http import require_GET
 import websockets
-import pandas as pd
 from rest_framework import status
 from django.db import transaction
+from django.db.models import Count, Prefetch
 import logging
+import uuid
 
 
 from .models import (
-    File, Image, TableCategory, User, Table, Column, TableApi, Cell,
-    Company, Project, Job, Operation, FormulaStep
+    File, Image, JobTableCollection, TableCategory, User, Table, Column, TableApi, Cell,
+    Company, Project, Job, Operation, FormulaStep, UploadSession, computed_values
 )
 from .serializers import (
-    FileUploadSerializer, ImageUploadSerializer, TableCategorySerializer, UserSerializer, TableSerializer, ColumnSerializer, TableApiSerializer, CellSerializer,
-    CompanySerializer, ProjectSerializer, JobSerializer, OperationSerializer, FormulaStepSerializer
+    ExcelUploadSerializer, FileUploadSerializer, ImageUploadSerializer, TableCategorySerializer, UserSerializer, TableSerializer, ColumnSerializer, TableApiSerializer, CellSerializer,
+    CompanySerializer, ProjectSerializer, JobSerializer, OperationSerializer, FormulaStepSerializer,
+    JobCompactSerializer, ProjectCompactSerializer, UploadChunkSerializer, UploadSessionSerializer
+)
+from .authentication import ClaimsJWTAuthentication
+from .fastpath import ValuesListMixin
+from .tenancy import TenantScopedMixin, has_full_access, scope_jobs, scope_rows
+from .fieldsets import SparseFieldsViewSetMixin
+from .rows import build_rows, row_filters, row_queryset
+from .excel import ExcelImportError, import_workbook
+from .uploads import UploadError, complete_session, create_session_file, discard_session, write_chunk
+from .schema import (
+    collection_schema, collection_schema_etag, column_catalogue, column_prefetches,
+    conditional_response, not_modified, table_schema, table_schema_etag
 )
 
 # ------------------------------------------------------------------------------
@@ -33,107 +49,265 @@ class LargeDataPagination(PageNumberPagination):
     page_size_query_param = 'page_size'
     max_page_size = 1000
 
+# ------------------------------------------------------------------------------
+# Listing helpers
+# ------------------------------------------------------------------------------
+
+
+def is_compact(request):
+    """``?view=compact`` selects the flat, non-nested representation."""
+    return request.method == 'GET' and request.query_params.get('view') == 'compact'
+
+
+def annotated_jobs(compact=False):
+    """
+    Jobs with ``table_api_count`` annotated and everything JobSerializer
+    nests prefetched, so a listing costs a fixed number of queries.
+    """
+    jobs = Job.objects.annotate(table_api_count=Count('table_apis'))
+    if compact:
+        return jobs.prefetch_related('advisorCompanies', 'contractorCompanies')
+    return jobs.select_related('job_table_collection').prefetch_related(
+        'advisorCompanies', 'contractorCompanies',
+        Prefetch('job_table_collection__table_categories',
+                 queryset=TableCategory.objects.order_by('order_number')),
+    )
+
 # ------------------------------------------------------------------------------
 # User ViewSet
 # ------------------------------------------------------------------------------
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(TenantScopedMixin, SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
+    tenant_scope = 'user'
     serializer_class = UserSerializer
     pagination_class = LargeDataPagination
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
+
+    def check_user_write(self, instance=None):
+        # Colleagues are visible, but only admins change other users.
+        if has_full_access(self.request.user):
+            return
+        if instance is None or str(instance.pk) != str(self.request.user.id):
+            raise PermissionDenied("You can only change your own account.")
+
+    def perform_create(self, serializer):
+        self.check_user_write()
+        super().perform_create(serializer)
+
+    def perform_update(self, serializer):
+        self.check_user_write(serializer.instance)
+        super().perform_update(serializer)
+
+    def perform_destroy(self, instance):
+        self.check_user_write(instance)
+        super().perform_destroy(instance)
 
 # ------------------------------------------------------------------------------
 # Table ViewSet
 # ------------------------------------------------------------------------------
 
 
-class TableViewSet(viewsets.ModelViewSet):
+class TableViewSet(SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     queryset = Table.objects.all()
     serializer_class = TableSerializer
+    field_prefetches = {
+        'columns': [Prefetch('columns', queryset=Column.objects.prefetch_related(*column_prefetches()))],
+    }
     filter_backends = [DjangoFilterBackend,
                        filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['name', 'created_at']
     search_fields = ['name']
     ordering_fields = ['name', 'created_at']
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
+
+    def get_queryset(self):
+        if self.action in ('rows', 'schema'):
+            # These load their own data; the table row alone is enough.
+            return Table.objects.all()
+        return super().get_queryset()
+
+    @action(detail=True, methods=['get'])
+    def rows(self, request, pk=None):
+        """Paginated rows with values keyed by column id; ``?<column id>=<value>`` filters."""
+        table = self.get_object()
+        column_ids = table.columns.values_list('id', flat=True)
+        queryset = scope_rows(
+            row_queryset(table, row_filters(request.query_params, column_ids)), request.user)
+        paginator = LargeDataPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        return paginator.get_paginated_response(build_rows(table, page))
+
+    @action(detail=True, methods=['get'])
+    def schema(self, request, pk=None):
+        """Cached column/option/formula snapshot, served with a strong ETag."""
+        table = self.get_object()
+        etag = table_schema_etag(table.id)
+        return conditional_response(
+            request, etag, lambda: table_schema(table, etag))
+
+# ------------------------------------------------------------------------------
+# JobTableCollection Schema View
+# ------------------------------------------------------------------------------
+
+
+class JobTableCollectionSchemaView(APIView):
+    """Schema snapshot of every table in a JobTableCollection."""
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [ClaimsJWTAuthentication]
+
+    def get(self, request, pk):
+        collection = get_object_or_404(JobTableCollection, pk=pk)
+        tables = list(collection.tables.order_by(
+            'name', 'id').only('id', 'name'))
+        etag = collection_schema_etag(collection, tables)
+        return conditional_response(
+            request, etag, lambda: collection_schema(collection, tables, etag))
 
 # ------------------------------------------------------------------------------
 # Column ViewSet
 # ------------------------------------------------------------------------------
 
 
-class ColumnViewSet(viewsets.ModelViewSet):
-    queryset = Column.objects.prefetch_related(
-        'options', 'formula_steps').all()
+class ColumnViewSet(SparseFieldsViewSetMixin, viewsets.ModelViewSet):
+    queryset = Column.objects.all()
     serializer_class = ColumnSerializer
+    field_prefetches = {
+        'options': column_prefetches(steps=False),
+        'formula_steps': column_prefetches(options=False),
+    }
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['name', 'data_type']
     ordering_fields = ['name', 'data_type']
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
 
 # ------------------------------------------------------------------------------
 # Operation ViewSet (New)
 # ------------------------------------------------------------------------------
 
 
-class OperationViewSet(viewsets.ModelViewSet):
+class OperationViewSet(ValuesListMixin, SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     queryset = Operation.objects.all()
     serializer_class = OperationSerializer
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
 
 # ------------------------------------------------------------------------------
 # FormulaStep ViewSet (New)
 # ------------------------------------------------------------------------------
 
 
-class FormulaStepViewSet(viewsets.ModelViewSet):
-    queryset = FormulaStep.objects.select_related('column', 'operation').all()
+class FormulaStepViewSet(SparseFieldsViewSetMixin, viewsets.ModelViewSet):
+    queryset = FormulaStep.objects.all()
     serializer_class = FormulaStepSerializer
+    field_select_related = {'operand': ['operand']}
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['column', 'operation', 'order']
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
 
 # ------------------------------------------------------------------------------
 # TableApi ViewSet
 # ------------------------------------------------------------------------------
 
 
-class TableApiViewSet(viewsets.ModelViewSet):
-    queryset = TableApi.objects.select_related(
-        'table', 'user').prefetch_related('api_cells').all()
+class TableApiViewSet(TenantScopedMixin, SparseFieldsViewSetMixin, viewsets.ModelViewSet):
+    queryset = TableApi.objects.all()
     serializer_class = TableApiSerializer
+    field_prefetches = {
+        'api_cells': [Prefetch('api_cells', queryset=Cell.objects.select_related(
+            'column').prefetch_related('files', 'images'))],
+        'children': ['children'],
+    }
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        # Overrides a posted 'user', so it has to be a User instance (cached).
+        serializer.save(user=self.request.user.user)
 
 # ------------------------------------------------------------------------------
 # Cell ViewSet
 # ------------------------------------------------------------------------------
 
 
-class CellViewSet(viewsets.ModelViewSet):
-    queryset = Cell.objects.select_related('column', 'table_api').prefetch_related(
-        'table_api__user', 'files', 'images').all()
+class CellViewSet(TenantScopedMixin, ValuesListMixin, SparseFieldsViewSetMixin, viewsets.ModelViewSet):
+    queryset = Cell.objects.select_related('column', 'table_api').all()
+    tenant_path = 'table_api'
+    tenant_parent = 'table_api'
     serializer_class = CellSerializer
+    field_prefetches = {'files': ['files'], 'images': ['images']}
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
+
+    def get_values_lookups(self, fields):
+        return ['id', 'column', 'value', 'created_at', 'table_api', 'table_api__table']
+
+    def get_values_rows(self, rows, fields):
+        serializer = self.get_serializer()
+        cell_ids = [row['id'] for row in rows]
+        computed = {}
+        if 'computed_value' in fields:
+            computed = computed_values(
+                [{**row, 'table': row['table_api__table']} for row in rows])
+        attachments = {
+            name: self._attachments(model, file_fields, cell_ids, serializer.fields[name])
+            for name, model, file_fields in (
+                ('files', File, ['file']),
+                ('images', Image, ['image', 'thumbnail', 'web_image']),
+            )
+            if name in fields
+        }
+
+        out = []
+        for row in rows:
+            item = {}
+            for name in fields:
+                if name == 'computed_value':
+                    item[name] = computed[row['id']]
+                elif name in attachments:
+                    item[name] = attachments[name].get(row['id'], [])
+                else:
+                    item[name] = row[name]
+            out.append(item)
+        return out
+
+    def _attachments(self, model, file_fields, cell_ids, field):
+        """Nested File/Image rows per cell id, shaped like FileSerializer/ImageSerializer."""
+        by_cell = {}
+        if not hasattr(field, 'child'):
+            # Collapsed to primary keys by ?expand=
+            for pk, cell_id in model.objects.filter(cell_id__in=cell_ids).values_list('id', 'cell'):
+                by_cell.setdefault(cell_id, []).append(pk)
+            return by_cell
+        names = list(field.child.fields)
+        # ?fields= may drop the grouping key or some of the file fields.
+        lookups = list(dict.fromkeys([*names, 'cell', *file_fields]))
+        storages = {name: model._meta.get_field(name).storage
+                    for name in file_fields if name in names}
+        for row in model.objects.filter(cell_id__in=cell_ids).values(*lookups):
+            for file_field, storage in storages.items():
+                if row[file_field]:
+                    row[file_field] = self.request.build_absolute_uri(
+                        storage.url(row[file_field]))
+                else:
+                    row[file_field] = None
+            by_cell.setdefault(row['cell'], []).append(
+                {name: row[name] for name in names})
+        return by_cell
 
 # ------------------------------------------------------------------------------
 # Company ViewSet
 # ------------------------------------------------------------------------------
 
 
-class CompanyViewSet(viewsets.ModelViewSet):
+class CompanyViewSet(TenantScopedMixin, ValuesListMixin, SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     queryset = Company.objects.all()
+    tenant_scope = 'company'
     serializer_class = CompanySerializer
     filter_backends = [DjangoFilterBackend,
                        filters.SearchFilter, filters.OrderingFilter]
@@ -141,41 +315,80 @@ class CompanyViewSet(viewsets.ModelViewSet):
     search_fields = ['name']
     ordering_fields = ['name']
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        # Otherwise the new company is hidden from the user who created it.
+        serializer.instance.members.add(self.request.user.id)
 
 # ------------------------------------------------------------------------------
 # Project ViewSet
 # ------------------------------------------------------------------------------
 
 
-class ProjectViewSet(viewsets.ModelViewSet):
-    queryset = Project.objects.select_related(
-        'company').prefetch_related('jobs').all()
+class ProjectViewSet(TenantScopedMixin, SparseFieldsViewSetMixin, viewsets.ModelViewSet):
+    queryset = Project.objects.all()
+    tenant_scope = 'project'
+    tenant_parent = 'company'
+    tenant_parent_scope = 'company'
     serializer_class = ProjectSerializer
+    field_select_related = {'company': ['company']}
+    field_prefetches = {'jobs': [Prefetch('jobs', queryset=annotated_jobs())]}
     filter_backends = [DjangoFilterBackend,
                        filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['name', 'created_at']
     search_fields = ['name']
     ordering_fields = ['name', 'created_at']
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
+
+    def get_queryset(self):
+        if is_compact(self.request):
+            return Project.objects.annotate(
+                job_count=Count('jobs', distinct=True),
+                table_api_count=Count('jobs__table_apis', distinct=True),
+            )
+        return super().get_queryset()
+
+    def get_serializer_class(self):
+        if is_compact(self.request):
+            return ProjectCompactSerializer
+        return super().get_serializer_class()
 
 # ------------------------------------------------------------------------------
 # Job ViewSet
 # ------------------------------------------------------------------------------
 
 
-class JobViewSet(viewsets.ModelViewSet):
-    queryset = Job.objects.select_related('project').prefetch_related(
-        'advisorCompanies', 'contractorCompanies', 'job_table_collection').all()
+class JobViewSet(TenantScopedMixin, SparseFieldsViewSetMixin, viewsets.ModelViewSet):
+    queryset = Job.objects.annotate(table_api_count=Count('table_apis'))
+    tenant_scope = 'job'
     serializer_class = JobSerializer
+    field_select_related = {'job_table_collection': ['job_table_collection']}
+    field_prefetches = {
+        'advisorCompanies': ['advisorCompanies'],
+        'contractorCompanies': ['contractorCompanies'],
+        'job_table_collection': [Prefetch('job_table_collection__table_categories',
+                                          queryset=TableCategory.objects.order_by('order_number'))],
+    }
     filter_backends = [DjangoFilterBackend,
                        filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['name', 'created_at']
     search_fields = ['name']
     ordering_fields = ['name', 'created_at']
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
+
+    def get_queryset(self):
+        if is_compact(self.request):
+            return annotated_jobs(compact=True)
+        return super().get_queryset()
+
+    def get_serializer_class(self):
+        if is_compact(self.request):
+            return JobCompactSerializer
+        return super().get_serializer_class()
 
 # ------------------------------------------------------------------------------
 # WebSocket API View
@@ -203,36 +416,123 @@ class WebSocketAPIView(APIView):
 # ------------------------------------------------------------------------------
 
 
-class TableCategoryViewSet(viewsets.ModelViewSet):
+class TableCategoryViewSet(SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     queryset = TableCategory.objects.all().order_by('order_number')
     serializer_class = TableCategorySerializer
+    field_prefetches = {
+        'tables': [Prefetch('tables__columns', queryset=Column.objects.prefetch_related(*column_prefetches()))],
+    }
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [ClaimsJWTAuthentication]
 
 # ------------------------------------------------------------------------------
 # FileUpload ViewSet
 # ------------------------------------------------------------------------------
 
 
-class FileUploadViewSet(viewsets.ModelViewSet):
+class FileUploadViewSet(TenantScopedMixin, SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     queryset = File.objects.all()
     serializer_class = FileUploadSerializer
+    tenant_path = 'cell__table_api'
+    tenant_parent = 'cell'
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [ClaimsJWTAuthentication]
 
 # ------------------------------------------------------------------------------
 # ImageUpload ViewSet
 # ------------------------------------------------------------------------------
 
 
-class ImageUploadViewSet(viewsets.ModelViewSet):
+class ImageUploadViewSet(TenantScopedMixin, SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     queryset = Image.objects.all()
     serializer_class = ImageUploadSerializer
+    tenant_path = 'cell__table_api'
+    tenant_parent = 'cell'
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [ClaimsJWTAuthentication]
+
+
+# ------------------------------------------------------------------------------
+# Upload Session ViewSet
+# ------------------------------------------------------------------------------
+
+
+class UploadSessionViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                           mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    Resumable uploads. Create a session, PUT the raw bytes of each chunk to
+    ``chunks/<index>/`` with an ``Upload-Offset`` header (and optionally
+    ``Upload-Checksum: sha256=<hex>``), then POST ``complete/``. Excel
+    imports answer 202 and run on the imports queue; GET the session until
+    its status is ``complete`` or ``failed``.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [ClaimsJWTAuthentication]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(
+            user_id=self.request.user.id).prefetch_related('chunks')
+
+    def perform_create(self, serializer):
+        cell = serializer.validated_data.get('cell')
+        if cell is not None and not scope_rows(
+                Cell.objects.filter(pk=cell.pk), self.request.user, 'table_api').exists():
+            raise PermissionDenied("You do not have access to this cell.")
+        job_id = (serializer.validated_data.get('options') or {}).get('job_id')
+        if serializer.validated_data['kind'] == 'excel' and job_id and not scope_jobs(
+                Job.objects.filter(pk=job_id), self.request.user).exists():
+            raise PermissionDenied("You do not have access to this job.")
+        create_session_file(serializer.save(user_id=self.request.user.id))
+
+    def perform_destroy(self, instance):
+        discard_session(instance)
+
+    @action(detail=True, methods=['put'], url_path=r'chunks/(?P<index>\d+)')
+    def chunk(self, request, pk=None, index=None):
+        session = self.get_object()
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            length = int(request.headers.get('Content-Length', ''))
+        except ValueError:
+            return Response({'error': 'Upload-Offset and Content-Length headers are required'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        checksum = request.headers.get('Upload-Checksum', '')
+        if checksum and not checksum.startswith('sha256='):
+            return Response({'error': 'Upload-Checksum must be sha256=<hex>'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            chunk = write_chunk(session, int(index), offset, request.stream,
+                                length, checksum.removeprefix('sha256='))
+        except UploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(UploadChunkSerializer(chunk).data)
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        try:
+            session = complete_session(self.get_object())
+        except UploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        if session.status == 'processing':
+            # Poll the session until the import is complete or failed.
+            return Response(self.get_serializer(session).data, status=status.HTTP_202_ACCEPTED)
+        return Response(self.get_serializer(session).data)
 
 
 @require_GET
+@staff_member_required
 def get_columns_for_table(request):
-    table_id = request.GET.get('table_id')
-    if table_id:
-        columns = Column.objects.filter(table_id=table_id).values('name')
-        return JsonResponse({'columns': list(columns)})
-    return JsonResponse({'columns': []})
+    """Column catalogue of ``?table_id=`` for the admin formula editor, with an ETag."""
+    try:
+        table_id = uuid.UUID(request.GET.get('table_id', ''))
+    except ValueError:
+        return JsonResponse({'columns': []})
+    etag = table_schema_etag(table_id)
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+    if not_modified(request, etag):
+        return HttpResponseNotModified(headers=headers)
+    return JsonResponse(column_catalogue(table_id, etag), headers=headers)
 
 
 # ------------------------------------------------------------------------------
@@ -242,85 +542,48 @@ logger = logging.getLogger(__name__)
 
 
 class ExcelUploadView(APIView):
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [ClaimsJWTAuthentication]
+
     def post(self, request):
         logger.debug(f"Raw request data: {request.data}")
-        serializer = FileUploadSerializer(data=request.data)
+        serializer = ExcelUploadSerializer(data=request.data)
         if not serializer.is_valid():
             logger.error(f"Serializer errors: {serializer.errors}")
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
         excel_file = serializer.validated_data['file']
-        table_id = serializer.validated_data['table_id']
-        column_ids = serializer.validated_data['column_ids']
+        sheets = serializer.validated_data['sheets']
         job_id = serializer.validated_data.get('job_id')
         strict_numeric = serializer.validated_data['strict_numeric']
 
+        job = None
+        if job_id:
+            job = scope_jobs(Job.objects.all(), request.user).filter(id=job_id).first()
+            if job is None:
+                return Response(
+                    {'error': f'Job with id {job_id} not found'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
         try:
             with transaction.atomic():
-                df = pd.read_excel(excel_file, dtype_backend='numpy_nullable')
-                excel_columns = df.columns.tolist()
-                table = Table.objects.get(id=table_id)
-                columns = Column.objects.filter(id__in=column_ids, table=table)
-                column_map = {col.name: col for col in columns}
-                unmatched_columns = [
-                    col for col in excel_columns if col not in column_map]
-                if unmatched_columns:
-                    return Response(
-                        {'error': f"Excel columns {unmatched_columns} do not match any provided column names"},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                job = None
-                if job_id:
-                    try:
-                        job = Job.objects.get(id=job_id)
-                    except Job.DoesNotExist:
-                        return Response(
-                            {'error': f'Job with id {job_id} not found'},
-                            status=status.HTTP_400_BAD_REQUEST
-                        )
-                table_api = TableApi.objects.create(
-                    table=table,
-                    job=job,
-                    user=request.user if request.user.is_authenticated else None
-                )
-                created_cells = []
-                for index, row in df.iterrows():
-                    for col_name in excel_columns:
-                        value = row[col_name]
-                        column = column_map[col_name]
-                        if pd.isna(value):
-                            value = ''
-                        else:
-                            if column.data_type == 'number':
-                                try:
-                                    value = float(value)
-                                    value = str(value)
-                                except (ValueError, TypeError):
-                                    if strict_numeric:
-                                        return Response(
-                                            {'error': f'Invalid numeric value "{value}" in column "{col_name}" at row {index + 2}'},
-                                            status=status.HTTP_400_BAD_REQUEST
-                                        )
-                                    value = ''
-                            else:
-                                value = str(value)
-                        cell = Cell.objects.create(
-                            table_api=table_api,
-                            column=column,
-                            value=value,
-                            is_required=False
-                        )
-                        created_cells.append(cell)
-                response_serializer = CellSerializer(created_cells, many=True)
-                return Response(
-                    {
-                        'message': 'Data successfully uploaded and saved',
-                        'table_id': str(table.id),
-                        'table_api_id': str(table_api.id),
-                        'cells': response_serializer.data
-                    },
-                    status=status.HTTP_201_CREATED
+                results = import_workbook(
+                    excel_file, sheets, job=job,
+                    user_id=request.user.id,
+                    strict_numeric=strict_numeric,
                 )
+            # Rows after the first are children of each sheet's table_api_id
+            return Response(
+                {
+                    'message': 'Data successfully uploaded and saved',
+                    'table_id': results[0]['table_id'],
+                    'table_api_id': results[0]['table_api_id'],
+                    'sheets': results,
+                },
+                status=status.HTTP_201_CREATED
+            )
+        except ExcelImportError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response(
                 {'error': f'Error processing file: {str(e)}'},
@@ -1,9 +1,32 @@
+(function () {
 // Prevent re-initialization
 if (window.formulaEditorInitialized) {
   return;
 }
 window.formulaEditorInitialized = true;
 
+// Column catalogues by table id, with the ETag they were served with
+const catalogueCache = {};
+
+function fetchCatalogue(url, tableId) {
+  const cached = catalogueCache[tableId];
+  const headers = cached ? { "If-None-Match": cached.etag } : {};
+  return fetch(`${url}?table_id=${encodeURIComponent(tableId)}`, {
+    headers: headers,
+    credentials: "same-origin",
+  }).then((response) => {
+    if (response.status === 304 && cached) return cached.catalogue;
+    if (!response.ok) throw new Error(`HTTP ${response.status}`);
+    return response.json().then((catalogue) => {
+      catalogueCache[tableId] = {
+        etag: response.headers.get("ETag"),
+        catalogue: catalogue,
+      };
+      return catalogue;
+    });
+  });
+}
+
 document.addEventListener("DOMContentLoaded", function () {
   const formulaInput = document.querySelector(".formula-input");
   const previewResult = document.getElementById("preview-result");
@@ -12,13 +35,41 @@ document.addEventListener("DOMContentLoaded", function () {
 
   if (!formulaInput) return;
 
-  const columns = formulaInput.dataset.columns
+  let columns = formulaInput.dataset.columns
     ? formulaInput.dataset.columns.split(",")
     : [];
   const functions = formulaInput.dataset.functions
     ? formulaInput.dataset.functions.split(",")
     : [];
 
+  // Load the columns of the selected table from the cached catalogue
+  // endpoint, so picking a table on the add form updates the suggestions.
+  const catalogueUrl = formulaInput.dataset.catalogueUrl;
+  const tableSelect = document.getElementById("id_table");
+  const columnId = (window.location.pathname.match(
+    /\/column\/([0-9a-f-]{36})\//
+  ) || [])[1];
+
+  function loadColumns(tableId) {
+    if (!catalogueUrl || !tableId) return;
+    fetchCatalogue(catalogueUrl, tableId)
+      .then((catalogue) => {
+        columns = catalogue.columns
+          .filter((column) => column.id !== columnId)
+          .map((column) => column.name);
+      })
+      .catch((error) => console.error("Error loading columns:", error));
+  }
+
+  if (tableSelect) {
+    tableSelect.addEventListener("change", function () {
+      loadColumns(this.value);
+    });
+    if (!columns.length) loadColumns(tableSelect.value);
+  } else if (!columns.length) {
+    loadColumns(formulaInput.dataset.table);
+  }
+
   // Named function for calc button click handler
   function handleCalcButtonClick() {
     const value = this.dataset.value;
@@ -139,3 +190,4 @@ document.addEventListener("DOMContentLoaded", function () {
   // Initial preview update
   updatePreview();
 });
+})();